@@ -8,6 +8,7 @@ import logging
 import json
 
 logger = logging.getLogger(__name__)
+EXIT_MONITOR_MAX_WAIT = 30 * 60 # seconds the run waits for entry fills (capped by the market close), later fills get no automatic exit
 
 class AIStockAgent:
     def __init__(self):
@@ -33,6 +34,11 @@ class AIStockAgent:
             logger.info(f"Available cash: {self.available_cash}")
         
         stocks_to_trade = asyncio.run(self.ai_tools.get_ai_stock_recommendations())
+        try: # live quotes for the trade window, reads fall back to REST while the stream is not delivering
+            self.schwab_tools.start_quote_stream(stocks_to_trade)
+            self.schwab_tools.start_account_activity_stream()
+        except Exception as e:
+            logger.error(f"Error starting quote stream: {e}")
         
         list_of_best_trades = [trade for trade in asyncio.run(self._process_all_tickers(stocks_to_trade)) if trade is not None]
 
@@ -40,15 +46,23 @@ class AIStockAgent:
         selected_trades = (self.macro_analsysis(list_of_best_trades, reduced_available_cash))['selectedTrades']
         
         order_status = [trade for trade in asyncio.run(self._process_all_orders(selected_trades)) if trade is not None]
-        # TODO:Check if all of the orders that were placed were successful have been filled from Schwab
-        
-        # If orders have been filled, place the exit order
-        exit_order_status = [trade for trade in asyncio.run(self._process_all_exits(selected_trades)) if trade is not None]
-            
         self.email_handler.send_trade_notification(selected_trades)
+
+        # Place each exit order as soon as its entry fills (stream events, order polling as reconciliation)
+        exit_wait = min(EXIT_MONITOR_MAX_WAIT, self.trading_scheduling_tools.seconds_until_market_close())
+        exit_order_status = asyncio.run(self.schwab_tools.place_exits_on_fill(order_status, timeout=exit_wait))
+        try:
+            activity = asyncio.run(self.schwab_tools.sync_account_activity())
+            filled_symbols = [order['orderLegCollection'][0]['instrument']['symbol'] for order in activity['filledOrders']]
+            logger.info(f"Orders filled since last sync: {filled_symbols}, open orders: {len(self.schwab_tools.get_open_orders())}")
+        except Exception as e:
+            logger.error(f"Error syncing orders and transactions: {e}")
         
+        cache_stats = self.schwab_tools.get_api_cache_stats()
+        logger.info(f"Schwab API cache: {cache_stats['hits']} calls saved, {cache_stats['misses']} misses")
+        logger.info(f"Schwab API metrics: {json.dumps(self.schwab_tools.get_api_metrics_summary())}")
         logger.info("AI Agent run completed. Sleeping until next trading window...")
-        self.trading_scheduling_tools.sleep_until_next_trading_window(current_time=current_time)
+        self.trading_scheduling_tools.sleep_until_next_trading_window(current_time=datetime.now())
     
     def macro_analsysis(self, list_of_best_trades, available_cash):
         try:
@@ -68,24 +82,28 @@ class AIStockAgent:
             tasks = [self.schwab_tools.place_order(trade) for trade in selected_trades]
             return await asyncio.gather(*tasks)
 
-    async def _process_all_exits(self, trades):
-        tasks = [self.schwab_tools.place_exit_oco_order(trade) for trade in trades]
-        return await asyncio.gather(*tasks)
-    
     async def _process_all_tickers(self, stocks_to_trade):
-        tasks = [self.micro_analysis(ticker) for ticker in stocks_to_trade]
-        return await asyncio.gather(*tasks)
+        try:
+            core_quotes = await self.schwab_tools.get_core_quotes(stocks_to_trade)
+        except Exception as e:
+            logger.error(f"Error fetching batched quotes: {e}")
+            core_quotes = {}
+        tasks = [self.micro_analysis(ticker, core_quotes.get(ticker)) for ticker in stocks_to_trade]
+        best_trades = await asyncio.gather(*tasks)
+        await self.schwab_tools.subscribe_option_quotes(stocks_to_trade) # one subscription for every fetched chain
+        return best_trades
     
-    async def micro_analysis(self, ticker):
+    async def micro_analysis(self, ticker, core_quote=None):
         try:
             fundamentals_and_events = await self.ai_tools.get_ai_stock_events(ticker)
 
-            core_quote = self.schwab_tools.get_core_quote(ticker)
+            if core_quote is None: # not in the batched quotes, fetch it on its own
+                core_quote = await self.schwab_tools.get_core_quote(ticker)
 
             atm_strike_price = round(core_quote["last_price"])
-            options_chain = self.schwab_tools.get_options_chain({ticker: atm_strike_price})
-            
-            price_history = self.schwab_tools.get_price_history(ticker)
+            options_chain, price_history = await asyncio.gather(
+                self.schwab_tools.get_options_chain({ticker: atm_strike_price}, subscribe=False),
+                self.schwab_tools.get_price_history(ticker))
             
             payload = {
                 "symbol":ticker,
@@ -94,6 +112,9 @@ class AIStockAgent:
                 "historicalPrices": price_history,
                 "fundamentals": fundamentals_and_events
             }
+            intraday = self.schwab_tools.get_intraday_features(ticker)
+            if intraday is not None: # only once the stream has delivered bars for the ticker
+                payload["intraday"] = intraday
             
             best_trade = await self.ai_tools.micro_stock_options_analysis(payload)
             
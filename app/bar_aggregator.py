@@ -0,0 +1,199 @@
+from collections import deque
+from datetime import datetime
+import threading
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+BAR_INTERVALS = (1, 5, 15) # minutes
+MAX_BARS = 400 # bars kept per symbol and interval (a regular session is 390 one minute bars)
+VOLATILITY_WINDOW = 20 # bar returns in the rolling realized volatility
+MINUTES_PER_YEAR = 252 * 390 # trading minutes, to annualize realized volatility
+
+class _Bars:
+    # fixed size ring buffer of OHLCV bars of one interval, plus running sums of the last bar returns
+    def __init__(self, minutes, capacity, volatility_window):
+        self.minutes = minutes
+        self.interval_ms = minutes * 60_000
+        self.capacity = capacity
+        self.starts = [0] * capacity
+        self.opens = [0.0] * capacity
+        self.highs = [0.0] * capacity
+        self.lows = [0.0] * capacity
+        self.closes = [0.0] * capacity
+        self.volumes = [0] * capacity
+        self.count = 0
+        self.head = 0 # index of the next bar
+        self._returns = deque(maxlen=volatility_window)
+        self._sum_r = 0.0
+        self._sum_r2 = 0.0
+        self._last_closed_close = None
+
+    @property
+    def current(self):
+        return (self.head - 1) % self.capacity if self.count else None
+
+    def _push_return(self, r):
+        if len(self._returns) == self._returns.maxlen:
+            old = self._returns[0]
+            self._sum_r -= old
+            self._sum_r2 -= old * old
+        self._returns.append(r)
+        self._sum_r += r
+        self._sum_r2 += r * r
+
+    def _new_bar(self, start, o, h, l, c, v):
+        i = self.current
+        if i is not None: # the current bar is closed
+            close = self.closes[i]
+            if self._last_closed_close and close > 0:
+                self._push_return(math.log(close / self._last_closed_close))
+            self._last_closed_close = close
+        j = self.head
+        self.starts[j], self.opens[j], self.highs[j], self.lows[j], self.closes[j], self.volumes[j] = start, o, h, l, c, v
+        self.head = (j + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def tick(self, time_ms, price, volume):
+        start = time_ms - time_ms % self.interval_ms
+        i = self.current
+        if i is None or start > self.starts[i]:
+            self._new_bar(start, price, price, price, price, volume)
+        elif start == self.starts[i]:
+            self.highs[i] = max(self.highs[i], price)
+            self.lows[i] = min(self.lows[i], price)
+            self.closes[i] = price
+            self.volumes[i] += volume
+        # late ticks of closed bars are ignored
+
+    def set_bar(self, start, o, h, l, c, v):
+        # chart bars are complete, the current bar is replaced when the same minute is sent again
+        i = self.current
+        if i is None or start > self.starts[i]:
+            self._new_bar(start, o, h, l, c, v)
+        elif start == self.starts[i]:
+            self.opens[i], self.highs[i], self.lows[i], self.closes[i], self.volumes[i] = o, h, l, c, v
+
+    def last(self, n):
+        # indexes of the last n bars, oldest first
+        n = min(n, self.count)
+        return [(self.head - n + k) % self.capacity for k in range(n)]
+
+    def realized_volatility(self, annualize=True):
+        n = len(self._returns)
+        if n < 2:
+            return None
+        variance = max(0.0, (self._sum_r2 - self._sum_r * self._sum_r / n) / (n - 1))
+        return math.sqrt(variance * (MINUTES_PER_YEAR / self.minutes if annualize else 1))
+
+class _SymbolState:
+    def __init__(self, intervals, capacity, volatility_window):
+        self.bars = {minutes: _Bars(minutes, capacity, volatility_window) for minutes in intervals}
+        self.from_chart = False # chart bars are preferred over level one ticks once they arrive
+        self.last_total_volume = None
+        self.day = None
+        self.vwap_pv = 0.0
+        self.vwap_volume = 0
+
+    def new_day(self, time_ms):
+        day = datetime.fromtimestamp(time_ms / 1000).date()
+        if day != self.day:
+            self.day, self.vwap_pv, self.vwap_volume, self.last_total_volume = day, 0.0, 0, None
+
+class BarAggregator:
+    # intraday OHLCV bars per symbol from CHART_EQUITY (one minute bars) or LEVELONE_EQUITIES (trades), O(1) per update
+    def __init__(self, intervals=BAR_INTERVALS, max_bars=MAX_BARS, volatility_window=VOLATILITY_WINDOW):
+        if 1 not in intervals:
+            raise Exception("Bar intervals must include 1 minute")
+        if any(minutes % 1 or minutes > max_bars for minutes in intervals):
+            raise Exception("Bar intervals must be whole minutes shorter than max_bars")
+        self.intervals = tuple(sorted(intervals))
+        self.max_bars = max_bars
+        self.volatility_window = volatility_window
+        self._lock = threading.Lock()
+        self._symbols = {}
+
+    def _state(self, symbol):
+        state = self._symbols.get(symbol)
+        if state is None:
+            state = self._symbols[symbol] = _SymbolState(self.intervals, self.max_bars, self.volatility_window)
+        return state
+
+    def on_stream_message(self, decoded, **kwargs):
+        # receiver for StreamDecoder(...).wrap(...)
+        with self._lock:
+            for record in decoded["data"].get("CHART_EQUITY", ()):
+                if record.get("chartTime") is not None and record.get("closePrice") is not None:
+                    self._add_chart_bar(record["key"], record["chartTime"], record.get("openPrice"), record.get("highPrice"),
+                                        record.get("lowPrice"), record["closePrice"], record.get("volume") or 0)
+            for record in decoded["data"].get("LEVELONE_EQUITIES", ()):
+                if record.get("lastPrice") is not None:
+                    self._add_trade(record["key"], record.get("tradeTime") or record.get("timestamp"), record["lastPrice"], record.get("totalVolume"))
+
+    def _add_chart_bar(self, symbol, start, o, h, l, c, v):
+        state = self._state(symbol)
+        state.from_chart = True
+        state.new_day(start)
+        o, h, l = (c if x is None else x for x in (o, h, l))
+        minute = state.bars[1]
+        i = minute.current
+        if i is not None and minute.starts[i] == start: # replaced, take the old bar out of the vwap
+            state.vwap_pv -= (minute.highs[i] + minute.lows[i] + minute.closes[i]) / 3 * minute.volumes[i]
+            state.vwap_volume -= minute.volumes[i]
+        minute.set_bar(start, o, h, l, c, v)
+        if minute.current is None or minute.starts[minute.current] != start:
+            return # late bar
+        state.vwap_pv += (h + l + c) / 3 * v
+        state.vwap_volume += v
+        # longer bars are rebuilt from their (at most interval) minute bars, so a resent minute is not counted twice
+        for minutes in self.intervals[1:]:
+            bars = state.bars[minutes]
+            bar_start = start - start % bars.interval_ms
+            indexes = [j for j in minute.last(minutes) if minute.starts[j] >= bar_start]
+            bars.set_bar(bar_start, minute.opens[indexes[0]], max(minute.highs[j] for j in indexes), min(minute.lows[j] for j in indexes),
+                         minute.closes[indexes[-1]], sum(minute.volumes[j] for j in indexes))
+
+    def _add_trade(self, symbol, time_ms, price, total_volume):
+        state = self._state(symbol)
+        if state.from_chart or time_ms is None:
+            return
+        state.new_day(time_ms)
+        volume = 0
+        if total_volume is not None:
+            if state.last_total_volume is not None and total_volume >= state.last_total_volume:
+                volume = total_volume - state.last_total_volume
+            state.last_total_volume = total_volume
+        for bars in state.bars.values():
+            bars.tick(time_ms, price, volume)
+        state.vwap_pv += price * volume
+        state.vwap_volume += volume
+
+    def get_bars(self, symbol, interval=1, count=None):
+        with self._lock:
+            state = self._symbols.get(symbol)
+            if state is None:
+                return []
+            bars = state.bars[interval]
+            return [{'datetime': bars.starts[i], 'open': bars.opens[i], 'high': bars.highs[i], 'low': bars.lows[i],
+                     'close': bars.closes[i], 'volume': bars.volumes[i]} for i in bars.last(count or bars.count)]
+
+    def vwap(self, symbol):
+        with self._lock:
+            state = self._symbols.get(symbol)
+            return state.vwap_pv / state.vwap_volume if state is not None and state.vwap_volume else None
+
+    def realized_volatility(self, symbol, interval=5, annualize=True):
+        with self._lock:
+            state = self._symbols.get(symbol)
+            return state.bars[interval].realized_volatility(annualize) if state is not None else None
+
+    def features(self, symbol):
+        # intraday summary for analysis payloads (None values until enough bars arrived)
+        with self._lock:
+            state = self._symbols.get(symbol)
+            if state is None:
+                return None
+            minute = state.bars[1]
+            last = minute.closes[minute.current] if minute.count else None
+        return {"last": last, "vwap": self.vwap(symbol),
+                "realized_volatility": {f"{minutes}m": self.realized_volatility(symbol, minutes) for minutes in self.intervals}}
@@ -0,0 +1,149 @@
+from datetime import datetime
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+OI_REF_MIN = 1000 # open interest reference floor (median open interest x 2 above it)
+OI_REF_DEFAULT = 5000 # open interest reference when no contract has open interest
+SCORE_WEIGHTS = {"pop_score": 0.4, "exp_roi_score": 0.2, "risk_reward_score": 0.1,
+                 "theta_drag_score": 0.1, "liquidity_score": 0.1, "iv_cheapness_score": 0.1}
+
+# min/max with python semantics (a NaN argument loses against the bound like min(hi, max(lo, x)) does)
+def _max(lo, x):
+    return np.where(x > lo, x, lo)
+
+def _min(hi, x):
+    return np.where(x < hi, x, hi)
+
+def days_to_expiration(expirations, now=None):
+    # days per unique expiration date, invalid dates are marked in the mask
+    now = now or datetime.now()
+    by_expiration = {}
+    for expiration in set(expirations):
+        try:
+            exp_date = datetime.strptime(expiration.split('T')[0], "%Y-%m-%d")
+            by_expiration[expiration] = max(1, (exp_date - now).days + 1)
+        except (AttributeError, TypeError, ValueError):
+            by_expiration[expiration] = 0
+    days = np.array([by_expiration[expiration] for expiration in expirations], dtype=float)
+    return days, days > 0
+
+def open_interest_refs(open_interest, groups, group_count):
+    # median open interest x 2 per group (floor OI_REF_MIN), OI_REF_DEFAULT for groups without open interest
+    refs = np.full(group_count, float(OI_REF_DEFAULT))
+    positive = open_interest > 0
+    if not positive.any():
+        return refs
+    values, value_groups = open_interest[positive], groups[positive]
+    order = np.lexsort((values, value_groups))
+    values, value_groups = values[order], value_groups[order]
+    counts = np.bincount(value_groups, minlength=group_count)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    has = counts > 0
+    low = starts[has] + (counts[has] - 1) // 2
+    high = starts[has] + counts[has] // 2
+    medians = (values[low] + values[high]) / 2
+    refs[has] = np.maximum(OI_REF_MIN, medians * 2)
+    return refs
+
+def score_columns(is_put, strike, delta, implied_volatility, theta, bid, ask, open_interest, days,
+                  iv_mean=None, iv_std=None, groups=None, valid=None, iv_percentile=None, components=False):
+    # scores of the contracts given as arrays (IVs in percent, iv_mean/iv_std are the expiration's IV stats, None if there
+    # are none), open interest is referenced per group (one group per ticker chain), invalid rows score 0
+    # iv_percentile is the expiration's ATM IV percentile in its own history (NaN where there is not enough history)
+    n = len(strike)
+    groups = np.zeros(n, dtype=np.intp) if groups is None else np.asarray(groups, dtype=np.intp)
+    valid = np.ones(n, dtype=bool) if valid is None else valid.copy()
+    with np.errstate(all="ignore"):
+        implied_vol = implied_volatility / 100
+        iv_mean = (implied_vol * 100 if iv_mean is None else iv_mean) / 100 # same round trip as the per contract formula
+        iv_std = (np.ones(n) if iv_std is None else iv_std) / 100
+        theta = np.abs(theta)
+        premium = np.where((bid != 0) & (ask != 0), (bid + ask) / 2, 0)
+        has_premium = premium > 0
+        valid &= ~(has_premium & np.isnan(strike)) # the strike is only needed with a premium
+
+        # 1. Probability of profit
+        pop = np.where(delta != 0, np.where(is_put, 1 - np.abs(delta), delta), 0.5)
+        pop_score = pop * 10
+
+        # 2. Expected ROI, clamped to [-1, 1]
+        exp_roi = np.where(is_put, (pop * premium - (1 - pop) * (strike - premium)) / premium,
+                           (pop * (strike - premium) - (1 - pop) * premium) / premium)
+        exp_roi = np.where(has_premium, _min(1.0, _max(-1.0, exp_roi)), 0)
+        exp_roi_score = (exp_roi + 1) * 5
+
+        # 3. Risk/reward on a log scale
+        risk_reward = (pop / (1 - pop)) * _max(0, exp_roi)
+        risk_reward_score = np.where((0 < pop) & (pop < 0.99), _min(10, _max(0, np.log(1 + risk_reward) * 3)),
+                                     np.where(pop >= 0.99, 10, 0))
+
+        # 4. Theta decay drag, lower is better
+        theta_drag = (theta * days) / premium
+        theta_drag_score = _min(10, _max(0, np.where(has_premium, 10 / (1 + theta_drag * 2), 0)))
+
+        # 5. Liquidity, inverse spread scaled by open interest
+        liquid = (ask > bid) & (bid > 0)
+        valid &= ~(liquid & np.isnan(open_interest))
+        oi_ref = open_interest_refs(np.nan_to_num(open_interest, nan=0.0), groups, int(groups.max()) + 1 if n else 0)[groups]
+        inverse_spread = 1 / _max(0.01, (ask - bid) / bid)
+        oi_factor = np.sqrt(_max(1, open_interest) / oi_ref)
+        liquidity_score = np.where(liquid, _min(10, inverse_spread * oi_factor), 1)
+
+        # 6. IV cheapness against the expiration's IV stats
+        iv_z_score = (iv_mean - implied_vol) / iv_std
+        iv_cheapness_score = np.where(iv_std > 0, _min(10, _max(0, (iv_z_score + 3) * 5 / 6)), 5)
+        if iv_percentile is not None: # with history: half against today's strikes, half against the symbol's past IV
+            iv_cheapness_score = np.where(np.isnan(iv_percentile), iv_cheapness_score, (iv_cheapness_score + 10 * (1 - iv_percentile)) / 2)
+
+        scores = {"pop_score": pop_score, "exp_roi_score": exp_roi_score, "risk_reward_score": risk_reward_score,
+                  "theta_drag_score": theta_drag_score, "liquidity_score": liquidity_score, "iv_cheapness_score": iv_cheapness_score}
+        weighted = {name: score * SCORE_WEIGHTS[name] for name, score in scores.items()}
+        final = 0
+        for component in weighted.values(): # same summation order as the per contract formula
+            final = final + component
+        final = np.where(valid, final, 0)
+    if components:
+        return final, valid, {name: np.where(valid, values, 0) for name, values in weighted.items()}
+    return final, valid
+
+def score_chains(chains, now=None, iv_percentiles=None):
+    # scores the columns of many OptionChains (one per ticker) in one pass, sets chain.score and chain.valid
+    # iv_percentiles: per chain, the IV history percentile of each expiration (see IVHistoryStore.expiration_percentiles)
+    if iv_percentiles is not None:
+        iv_percentiles = [p for chain, p in zip(chains, iv_percentiles) if len(chain)]
+    chains = [chain for chain in chains if len(chain)]
+    if not chains:
+        return chains
+    lengths = [len(chain) for chain in chains]
+    groups = np.repeat(np.arange(len(chains)), lengths)
+    def concat(name):
+        return np.concatenate([getattr(chain, name) for chain in chains])
+    # expiration tables of every chain in one table
+    offsets = np.cumsum([0] + [len(chain.expiration_keys) for chain in chains[:-1]])
+    expiration_index = np.concatenate([chain.expiration_index + offset for chain, offset in zip(chains, offsets.tolist())])
+    stats = [s for chain in chains for s in chain.iv_stats]
+    days, days_valid = days_to_expiration([date for chain in chains for date in chain.expiration_dates], now)
+    has_stats = np.array([s is not None for s in stats], dtype=bool)[expiration_index]
+    stats_mean = np.array([s["mean"] if s is not None else np.nan for s in stats], dtype=float)[expiration_index]
+    stats_std = np.array([s["std"] if s is not None else np.nan for s in stats], dtype=float)[expiration_index]
+
+    implied_volatility, theta, bid, ask = concat("implied_volatility"), concat("theta"), concat("bid"), concat("ask")
+    valid = days_valid[expiration_index] & ~np.isnan(implied_volatility) & ~np.isnan(theta) & ~np.isnan(bid) & ~np.isnan(ask)
+    # not a no-op: the per contract formula compared the IV to its own (iv / 100) * 100, keep the round trip so scores stay bit-identical
+    iv_mean = np.where(has_stats, stats_mean, implied_volatility / 100 * 100)
+    iv_std = np.where(has_stats, stats_std, 1.0)
+    percentile = None
+    if iv_percentiles is not None:
+        percentile = np.concatenate([np.full(len(chain.expiration_keys), np.nan) if p is None else np.asarray(p, dtype=float)
+                                     for chain, p in zip(chains, iv_percentiles)])[expiration_index]
+    scores, valid = score_columns(concat("is_put"), concat("strike_price"), np.nan_to_num(concat("delta"), nan=0.0),
+                                  implied_volatility, theta, bid, ask, concat("open_interest"), days[expiration_index],
+                                  iv_mean, iv_std, groups, valid, percentile)
+    splits = np.cumsum(lengths)[:-1]
+    for chain, chain_scores, chain_valid in zip(chains, np.split(scores, splits), np.split(valid, splits)):
+        chain.score, chain.valid = chain_scores, chain_valid
+    symbols = [symbol for chain in chains for symbol in chain.symbols]
+    for i in np.flatnonzero(~valid).tolist():
+        logger.error(f"Error scoring contract {symbols[i] or 'unknown'}: missing or invalid contract data")
+    return chains
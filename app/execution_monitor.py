@@ -0,0 +1,170 @@
+from collections import OrderedDict
+import asyncio
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+POLL_INTERVAL = 15 # seconds between order_details polls while the stream is down
+RECONCILE_INTERVAL = 120 # seconds between order_details polls while the stream is up, catches events it never delivered
+MAX_PENDING_ORDERS = 1000 # untracked order ids whose events are kept for a later track()
+TERMINAL_STATUSES = ("FILLED", "CANCELED", "REJECTED", "EXPIRED", "REPLACED")
+ORDER_ID_KEYS = ("SchwabOrderID", "orderId", "OrderId", "OrderID")
+FILL_COMPLETED_TYPES = ("OrderFillCompleted",)
+CLOSED_TYPES = {"CancelAccepted": "CANCELED", "OrderRejected": "REJECTED", "OrderExpired": "EXPIRED", "OrderUROutCompleted": "CANCELED"}
+
+def find_order_id(message_data, depth=0):
+    # the order id sits at different depths depending on the activity message type
+    if depth > 4:
+        return None
+    if isinstance(message_data, dict):
+        for key in ORDER_ID_KEYS:
+            if message_data.get(key) is not None:
+                return str(message_data[key])
+        values = message_data.values()
+    elif isinstance(message_data, list):
+        values = message_data
+    else:
+        return None
+    for value in values:
+        if isinstance(value, (dict, list)):
+            order_id = find_order_id(value, depth + 1)
+            if order_id is not None:
+                return order_id
+    return None
+
+class ExecutionMonitor:
+    # order states driven by ACCT_ACTIVITY stream events, on_fill is awaited once per filled order
+    def __init__(self, fetch_order, stream_active, poll_interval=POLL_INTERVAL, reconcile_interval=RECONCILE_INTERVAL):
+        self._fetch_order = fetch_order # async order_id -> order json (order_details)
+        self._stream_active = stream_active # () -> bool
+        self.poll_interval = poll_interval
+        self.reconcile_interval = reconcile_interval
+        self._lock = threading.Lock()
+        self._orders = {} # order_id -> {'status': str, 'context': any, 'handled': bool}
+        self._events = [] # (order_id, message_type) received while no run() loop was active
+        self._pending = OrderedDict() # order_id -> [message_type], events of orders not tracked yet (an entry can fill before track())
+        self._loop = None
+        self._wakeup = None
+        self._tasks = set()
+        self._on_fill = None # async (order_id, context) -> None, set by run()
+
+    def track(self, order_id, context=None):
+        with self._lock:
+            order_id = str(order_id)
+            self._orders[order_id] = {'status': "WORKING", 'context': context, 'handled': False}
+            events = [(order_id, message_type) for message_type in self._pending.pop(order_id, ())]
+            loop = self._loop
+            if loop is None:
+                self._events.extend(events)
+                return
+        for event in events:
+            loop.call_soon_threadsafe(self._on_event, *event)
+
+    def status(self, order_id):
+        with self._lock:
+            order = self._orders.get(str(order_id))
+            return order['status'] if order is not None else None
+
+    def on_stream_message(self, decoded, **kwargs):
+        # receiver for StreamDecoder(...).wrap(...), runs on the stream thread so events are handed to the run() loop
+        for record in decoded["data"].get("ACCT_ACTIVITY", ()):
+            order_id = find_order_id(record.get("messageData"))
+            if order_id is None:
+                continue
+            with self._lock:
+                if order_id not in self._orders:
+                    self._pending.setdefault(order_id, []).append(record.get("messageType"))
+                    self._pending.move_to_end(order_id)
+                    if len(self._pending) > MAX_PENDING_ORDERS:
+                        self._pending.popitem(last=False)
+                    continue
+                loop = self._loop
+                if loop is None:
+                    self._events.append((order_id, record.get("messageType")))
+                    continue
+            loop.call_soon_threadsafe(self._on_event, order_id, record.get("messageType"))
+
+    def _on_event(self, order_id, message_type):
+        # on the run() loop
+        if message_type in FILL_COMPLETED_TYPES:
+            self._set_status(order_id, "FILLED")
+        elif message_type in CLOSED_TYPES:
+            self._set_status(order_id, CLOSED_TYPES[message_type])
+        elif message_type and "Fill" in message_type:
+            # partial fills and unknown fill messages are confirmed with one order_details call
+            self._spawn(self._refresh(order_id))
+
+    def _set_status(self, order_id, status):
+        with self._lock:
+            order = self._orders.get(order_id)
+            if order is None or order['status'] in TERMINAL_STATUSES:
+                return
+            order['status'] = status
+            fire = status == "FILLED" and not order['handled']
+            if fire:
+                order['handled'] = True
+        logger.info(f"Order {order_id} is {status}")
+        if fire:
+            self._spawn(self._fire(order_id, order['context']))
+        self._wakeup.set()
+
+    def _spawn(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fire(self, order_id, context):
+        try:
+            await self._on_fill(order_id, context)
+        except Exception as e:
+            logger.error(f"Error handling fill of order {order_id}: {e}")
+
+    async def _refresh(self, order_id):
+        try:
+            order = await self._fetch_order(order_id)
+            if order.get('status'):
+                self._set_status(order_id, order['status'])
+        except Exception as e:
+            logger.error(f"Error fetching order {order_id}: {e}")
+
+    def _open_orders(self):
+        with self._lock:
+            return [order_id for order_id, order in self._orders.items() if order['status'] not in TERMINAL_STATUSES]
+
+    async def run(self, on_fill, timeout):
+        # wait until every tracked order is terminal (or timeout seconds), polling every poll_interval while the stream is down
+        # and every reconcile_interval while it is up
+        self._on_fill = on_fill
+        self._wakeup = asyncio.Event()
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            events, self._events = self._events, []
+        try:
+            for order_id, message_type in events:
+                self._on_event(order_id, message_type)
+            deadline = time.monotonic() + timeout
+            last_poll = None # None refreshes every open order once first, fills missed before run() are picked up
+            while (open_orders := self._open_orders()) and time.monotonic() < deadline:
+                interval = self.poll_interval if not self._stream_active() else self.reconcile_interval
+                if last_poll is None or time.monotonic() - last_poll >= interval:
+                    last_poll = time.monotonic()
+                    await asyncio.gather(*[self._refresh(order_id) for order_id in open_orders])
+                    continue
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), min(self.poll_interval, max(0, deadline - time.monotonic())))
+                except asyncio.TimeoutError:
+                    pass
+            if self._tasks:
+                await asyncio.gather(*self._tasks)
+        finally:
+            with self._lock:
+                self._loop = None
+        with self._lock:
+            return {order_id: order['status'] for order_id, order in self._orders.items()}
+
+    def forget(self, order_ids):
+        with self._lock:
+            for order_id in order_ids:
+                self._orders.pop(str(order_id), None)
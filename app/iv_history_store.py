@@ -0,0 +1,160 @@
+from datetime import datetime
+from app.pricing import years_to_expiration, DAYS_PER_YEAR
+import numpy as np
+import sqlite3
+import threading
+import bisect
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+IV_HISTORY_DB = "iv_history.sqlite"
+IV_TENORS = (5, 7, 10) # calendar days inside the 3-14 day chains the agent fetches, interpolated in total variance
+IV_WINDOWS = (30, 90, 252) # daily observations in the rank/percentile lookbacks
+MIN_HISTORY = 20 # observations before the history is used for scoring
+
+class _TenorHistory:
+    # last max(IV_WINDOWS) daily ATM IVs of one symbol/tenor, with a sorted copy per window for bisect lookups
+    def __init__(self, rows, windows):
+        self.windows = windows
+        self.dates = [r[0] for r in rows] # ascending
+        self.values = [r[1] for r in rows]
+        self.sorted = {window: sorted(self.values[-window:]) for window in windows}
+
+    def _remove(self, window, value):
+        values = self.sorted[window]
+        del values[bisect.bisect_left(values, value)]
+
+    def add(self, date, value):
+        if self.dates and date == self.dates[-1]: # refetch of the same day replaces its value
+            old = self.values[-1]
+            self.values[-1] = value
+            for window in self.windows:
+                self._remove(window, old)
+                bisect.insort(self.sorted[window], value)
+            return True
+        if self.dates and date < self.dates[-1]:
+            return False # out of order, reloaded from the database
+        self.dates.append(date)
+        self.values.append(value)
+        for window in self.windows:
+            if len(self.values) > window:
+                self._remove(window, self.values[-window - 1])
+            bisect.insort(self.sorted[window], value)
+        if len(self.values) > max(self.windows):
+            del self.dates[0], self.values[0]
+        return True
+
+def atm_iv_by_expiration(chain, spot):
+    # average IV (percent) of the contracts at the strike closest to spot, per expiration (NaN without quoted IV)
+    atm = np.full(len(chain.expiration_keys), np.nan)
+    quoted = chain.implied_volatility > 0 # Schwab sends -999 for contracts without a volatility
+    for k in range(len(chain.expiration_keys)):
+        in_expiration = quoted & (chain.expiration_index == k)
+        if not in_expiration.any():
+            continue
+        distance = np.abs(chain.strike_price[in_expiration] - spot)
+        atm[k] = chain.implied_volatility[in_expiration][distance == distance.min()].mean()
+    return atm
+
+def interpolate_tenors(days, ivs, tenors=IV_TENORS):
+    # {tenor: IV} for the tenors between the first and last expiration (linear in total variance iv^2 * t)
+    known = sorted((d, iv) for d, iv in zip(days, ivs) if d > 0 and iv == iv)
+    surface = {}
+    for tenor in tenors:
+        for (d0, iv0), (d1, iv1) in zip(known, known[1:] + known[-1:]):
+            if d0 <= tenor <= d1:
+                if d1 == d0:
+                    surface[tenor] = iv0
+                else:
+                    variance = iv0 * iv0 * d0 + (iv1 * iv1 * d1 - iv0 * iv0 * d0) * (tenor - d0) / (d1 - d0)
+                    surface[tenor] = math.sqrt(max(variance, 0) / tenor)
+                break
+    return surface
+
+class IVHistoryStore:
+    def __init__(self, path=IV_HISTORY_DB, windows=IV_WINDOWS):
+        self.windows = tuple(sorted(windows))
+        self._lock = threading.Lock()
+        self._histories = {} # (symbol, tenor) -> _TenorHistory
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS atm_iv (
+                symbol TEXT NOT NULL,
+                tenor INTEGER NOT NULL,
+                date TEXT NOT NULL,
+                iv REAL NOT NULL,
+                PRIMARY KEY (symbol, tenor, date)
+            ) WITHOUT ROWID;
+        """)
+        self._connection.commit()
+
+    def _history(self, symbol, tenor):
+        # called with the lock held, loaded from sqlite the first time
+        history = self._histories.get((symbol, tenor))
+        if history is None:
+            rows = self._connection.execute("SELECT date, iv FROM atm_iv WHERE symbol = ? AND tenor = ? ORDER BY date DESC LIMIT ?",
+                                            (symbol, tenor, self.windows[-1])).fetchall()
+            history = self._histories[(symbol, tenor)] = _TenorHistory(rows[::-1], self.windows)
+        return history
+
+    def append(self, symbol, surface, date=None, now=None):
+        # {tenor: ATM IV in percent} of one day (date, or the day of now), the last call of a day wins
+        date = date or (now or datetime.now()).strftime("%Y-%m-%d")
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO atm_iv VALUES (?, ?, ?, ?)",
+                                         [(symbol, tenor, date, iv) for tenor, iv in surface.items()])
+            self._connection.commit()
+            for tenor, iv in surface.items():
+                if not self._history(symbol, tenor).add(date, iv):
+                    del self._histories[(symbol, tenor)]
+
+    def record_chain(self, chain, spot=None, now=None):
+        # appends the ATM IV surface of an OptionChain for the day of now (today if None), returns the ATM IV of each expiration
+        # the chain should hold both calls and puts, the ATM IV averages them
+        spot = chain.underlying_price if spot is None else spot
+        if spot is None or not len(chain):
+            return None
+        atm = atm_iv_by_expiration(chain, spot)
+        days = years_to_expiration(chain.expiration_dates, now) * DAYS_PER_YEAR
+        surface = interpolate_tenors(days.tolist(), atm.tolist())
+        if surface:
+            self.append(chain.ticker, surface, now=now)
+        return atm
+
+    def count(self, symbol, tenor, window=IV_WINDOWS[-1]):
+        with self._lock:
+            return len(self._history(symbol, tenor).sorted[window])
+
+    def iv_percentile(self, symbol, tenor, iv=None, window=IV_WINDOWS[-1]):
+        # fraction of the window's daily ATM IVs below iv (the latest one if None)
+        with self._lock:
+            history = self._history(symbol, tenor)
+            values = history.sorted[window]
+            if not values:
+                return None
+            iv = history.values[-1] if iv is None else iv
+            return bisect.bisect_left(values, iv) / len(values)
+
+    def iv_rank(self, symbol, tenor, iv=None, window=IV_WINDOWS[-1]):
+        # position of iv between the window's lowest and highest daily ATM IV (0 to 1)
+        with self._lock:
+            history = self._history(symbol, tenor)
+            values = history.sorted[window]
+            if len(values) < 2 or values[-1] == values[0]:
+                return None
+            iv = history.values[-1] if iv is None else iv
+            return min(1.0, max(0.0, (iv - values[0]) / (values[-1] - values[0])))
+
+    def expiration_percentiles(self, chain, atm, window=IV_WINDOWS[-1], now=None):
+        # percentile of each expiration's ATM IV against the nearest tenor with enough history (NaN without)
+        days = years_to_expiration(chain.expiration_dates, now) * DAYS_PER_YEAR
+        tenors = [tenor for tenor in IV_TENORS if self.count(chain.ticker, tenor, window) >= MIN_HISTORY]
+        percentiles = np.full(len(chain.expiration_keys), np.nan)
+        if not tenors or atm is None:
+            return percentiles
+        for k, (d, iv) in enumerate(zip(days.tolist(), atm.tolist())):
+            if d == d and iv == iv:
+                tenor = min(tenors, key=lambda tenor: abs(tenor - d))
+                percentiles[k] = self.iv_percentile(chain.ticker, tenor, iv, window)
+        return percentiles
@@ -1,6 +1,9 @@
 from dataclasses import dataclass
 from datetime import datetime
 from typing import List
+import statistics
+import sys
+import numpy as np
 
 @dataclass
 class OptionContract:
@@ -22,4 +25,133 @@ class OptionContract:
 @dataclass
 class OptionChainSnapshot:
     ticker: str
-    options: List[OptionContract]
\ No newline at end of file
+    options: List[OptionContract]
+
+# contract field -> Schwab chain field, every column is float64 with NaN for missing values
+CHAIN_COLUMNS = {
+    "strike_price": "strikePrice",
+    "bid": "bid",
+    "ask": "ask",
+    "last": "last",
+    "open_interest": "openInterest",
+    "volume": "totalVolume",
+    "implied_volatility": "volatility",
+    "delta": "delta",
+    "gamma": "gamma",
+    "theta": "theta",
+    "vega": "vega",
+}
+INT_COLUMNS = ("open_interest", "volume")
+
+def _number(value):
+    return np.nan if value is None else value
+
+class OptionChain:
+    # one ticker's contracts as columns, expirations (and their IV stats) are stored once and referenced by index
+    __slots__ = ("ticker", "symbols", "is_put", "expiration_index", "expiration_keys", "expiration_dates", "iv_stats",
+                 "score", "valid", "underlying_price", "interest_rate", *CHAIN_COLUMNS)
+
+    def __init__(self, ticker, symbols, is_put, expiration_index, expiration_keys, expiration_dates, columns, iv_stats=None, score=None,
+                 underlying_price=None, interest_rate=None, valid=None):
+        self.ticker = sys.intern(ticker)
+        self.symbols = symbols # contract symbols
+        self.is_put = is_put # bool array, False for calls
+        self.expiration_index = expiration_index # int32 array into the expiration tables
+        self.expiration_keys = expiration_keys # Schwab exp map keys ("2025-06-20:5")
+        self.expiration_dates = expiration_dates # contract expirationDate per expiration
+        for name in CHAIN_COLUMNS:
+            setattr(self, name, columns[name])
+        self.iv_stats = iv_stats if iv_stats is not None else self.compute_iv_stats()
+        self.score = score # float array once scored
+        self.valid = valid # bool array once scored, False for contracts with missing or invalid data (scored 0)
+        self.underlying_price = underlying_price
+        self.interest_rate = interest_rate # annual, as a fraction
+
+    @classmethod
+    def from_schwab(cls, ticker, *exp_maps, underlying_price=None, interest_rate=None):
+        # from callExpDateMap/putExpDateMap style maps: {exp key: {strike: [contract]}}, interest_rate in percent like the chain's
+        symbols, is_put, expiration_index = [], [], []
+        values = {name: [] for name in CHAIN_COLUMNS}
+        keys, dates, key_index = [], [], {}
+        for exp_map in exp_maps:
+            for exp_key, strikes in exp_map.items():
+                k = key_index.get(exp_key)
+                for contracts in strikes.values():
+                    for contract in contracts:
+                        if k is None:
+                            k = key_index[exp_key] = len(keys)
+                            keys.append(sys.intern(exp_key))
+                            dates.append(sys.intern(contract.get("expirationDate") or ""))
+                        symbols.append(contract.get("symbol"))
+                        is_put.append(contract.get("putCall") == "PUT")
+                        expiration_index.append(k)
+                        for name, field in CHAIN_COLUMNS.items():
+                            values[name].append(_number(contract.get(field)))
+        columns = {name: np.array(column, dtype=float) for name, column in values.items()}
+        return cls(ticker, symbols, np.array(is_put, dtype=bool), np.array(expiration_index, dtype=np.int32), keys, dates, columns,
+                   underlying_price=underlying_price, interest_rate=None if interest_rate is None else interest_rate / 100)
+
+    def compute_iv_stats(self):
+        # min/max/mean/population std of the IVs per expiration (None if the expiration has no IV)
+        stats = []
+        for k, exp_key in enumerate(self.expiration_keys):
+            iv_values = self.implied_volatility[(self.expiration_index == k) & ~np.isnan(self.implied_volatility)].tolist()
+            stats.append({"expiration_date": exp_key, "min": min(iv_values), "max": max(iv_values),
+                          "mean": statistics.mean(iv_values), "std": statistics.pstdev(iv_values)} if iv_values else None)
+        return stats
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def column(self, name):
+        return getattr(self, name)
+
+    def take(self, indexes):
+        # new chain with the contracts at indexes (in that order), expiration tables are shared
+        indexes = np.asarray(indexes, dtype=np.intp)
+        return OptionChain(self.ticker, [self.symbols[i] for i in indexes.tolist()], self.is_put[indexes], self.expiration_index[indexes],
+                           self.expiration_keys, self.expiration_dates, {name: getattr(self, name)[indexes] for name in CHAIN_COLUMNS},
+                           self.iv_stats, None if self.score is None else self.score[indexes], self.underlying_price, self.interest_rate,
+                           None if self.valid is None else self.valid[indexes])
+
+    def copy(self):
+        return self.take(np.arange(len(self)))
+
+    def filter(self, mask):
+        return self.take(np.flatnonzero(mask))
+
+    def sort(self, by="score", descending=False):
+        values = self.column(by)
+        order = np.argsort(-values if descending else values, kind="stable")
+        return self.take(order)
+
+    def top(self, n, by="score"):
+        return self.sort(by, descending=True).take(np.arange(min(n, len(self))))
+
+    def contract(self, i):
+        k = self.expiration_index[i]
+        values = {name: getattr(self, name)[i].item() for name in CHAIN_COLUMNS}
+        return OptionContract(expiration_date=self.expiration_dates[k], contract_symbol=self.symbols[i],
+                              type="PUT" if self.is_put[i] else "CALL", **values)
+
+    def to_records(self):
+        # contract dicts of the agent payload (NaN back to None, stats dicts shared per expiration)
+        columns = {name: [None if value != value else (int(value) if name in INT_COLUMNS else value) for value in getattr(self, name).tolist()]
+                   for name in CHAIN_COLUMNS}
+        scores = self.score.tolist() if self.score is not None else None
+        valid = self.valid.tolist() if self.valid is not None else None
+        records = []
+        for i, k in enumerate(self.expiration_index.tolist()):
+            record = {"expiration_date": self.expiration_dates[k] or None, "contract_symbol": self.symbols[i],
+                      "strike_price": columns["strike_price"][i], "type": "PUT" if self.is_put[i] else "CALL"}
+            for name in CHAIN_COLUMNS:
+                if name != "strike_price":
+                    record[name] = columns[name][i]
+            if self.iv_stats[k] is not None:
+                record["iv_stats"] = self.iv_stats[k]
+            if scores is not None:
+                record["score"] = round(scores[i], 2)
+            if valid is not None and not valid[i]:
+                record["score_components"] = {"error": "missing or invalid contract data"}
+            records.append(record)
+        return records
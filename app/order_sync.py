@@ -0,0 +1,212 @@
+from datetime import datetime, timedelta, timezone
+import sqlite3
+import threading
+import logging
+import json
+
+logger = logging.getLogger(__name__)
+ORDER_SYNC_DB = "orders.sqlite"
+BACKFILL_DAYS = 1 # history downloaded the first time an account is synced
+CURSOR_OVERLAP = timedelta(minutes=1) # re-read a little before the high-water mark so records with the same timestamp are not missed
+CLOSED_ORDER_STATUSES = ("FILLED", "CANCELED", "REJECTED", "EXPIRED", "REPLACED")
+
+def parse_schwab_time(value):
+    # "2024-03-01T14:30:00+0000" -> epoch ms
+    return int(datetime.fromisoformat(value).timestamp() * 1000) if value else None
+
+def format_schwab_time(epoch_ms):
+    # epoch ms -> "2024-03-01T14:30:00.000Z" (the format the orders/transactions endpoints expect)
+    return datetime.fromtimestamp(epoch_ms / 1000, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.") + f"{epoch_ms % 1000:03d}Z"
+
+class OrderSync:
+    def __init__(self, path=ORDER_SYNC_DB):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS orders (
+                account TEXT NOT NULL,
+                order_id INTEGER NOT NULL,
+                entered_time INTEGER NOT NULL,
+                close_time INTEGER,
+                status TEXT NOT NULL,
+                is_open INTEGER NOT NULL,
+                symbol TEXT,
+                filled_quantity REAL,
+                remaining_quantity REAL,
+                raw TEXT NOT NULL,
+                PRIMARY KEY (account, order_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS orders_open ON orders (account, is_open, entered_time);
+            CREATE INDEX IF NOT EXISTS orders_status ON orders (account, status, close_time);
+            CREATE TABLE IF NOT EXISTS transactions (
+                account TEXT NOT NULL,
+                activity_id INTEGER NOT NULL,
+                time INTEGER NOT NULL,
+                type TEXT,
+                order_id INTEGER,
+                symbol TEXT,
+                quantity REAL,
+                net_amount REAL,
+                raw TEXT NOT NULL,
+                PRIMARY KEY (account, activity_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS transactions_time ON transactions (account, time);
+            CREATE INDEX IF NOT EXISTS transactions_order ON transactions (account, order_id);
+            CREATE TABLE IF NOT EXISTS positions (
+                account TEXT NOT NULL,
+                symbol TEXT NOT NULL,
+                quantity REAL NOT NULL,
+                cost REAL NOT NULL,
+                realized REAL NOT NULL,
+                PRIMARY KEY (account, symbol)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS cursors (
+                account TEXT NOT NULL,
+                name TEXT NOT NULL,
+                value INTEGER NOT NULL,
+                PRIMARY KEY (account, name)
+            ) WITHOUT ROWID;
+        """)
+        self._connection.commit()
+
+    def _cursor(self, account, name):
+        row = self._connection.execute("SELECT value FROM cursors WHERE account = ? AND name = ?", (account, name)).fetchone()
+        return row[0] if row is not None else None
+
+    def _set_cursor(self, account, name, value):
+        self._connection.execute("INSERT OR REPLACE INTO cursors VALUES (?, ?, ?)", (account, name, value))
+
+    def _orders_window_start(self, account, backfill_days):
+        # orders can still change while they are open, so the window reaches back to the oldest open one
+        with self._lock:
+            high_water_mark = self._cursor(account, "orders")
+            oldest_open = self._connection.execute("SELECT MIN(entered_time) FROM orders WHERE account = ? AND is_open = 1",
+                                                   (account,)).fetchone()[0]
+        if high_water_mark is None:
+            return int((datetime.now(timezone.utc) - timedelta(days=backfill_days)).timestamp() * 1000)
+        start = high_water_mark - int(CURSOR_OVERLAP.total_seconds() * 1000)
+        return min(start, oldest_open) if oldest_open is not None else start
+
+    def upsert_orders(self, account, orders):
+        # returns the orders that are new or whose status/fill changed
+        changed = []
+        with self._lock:
+            for order in orders:
+                order_id = order['orderId']
+                status = order.get('status')
+                filled = order.get('filledQuantity')
+                row = self._connection.execute("SELECT status, filled_quantity FROM orders WHERE account = ? AND order_id = ?",
+                                               (account, order_id)).fetchone()
+                if row is not None and row[0] == status and row[1] == filled:
+                    continue
+                legs = order.get('orderLegCollection') or [{}]
+                self._connection.execute("INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                         (account, order_id, parse_schwab_time(order['enteredTime']), parse_schwab_time(order.get('closeTime')),
+                                          status, int(status not in CLOSED_ORDER_STATUSES), legs[0].get('instrument', {}).get('symbol'),
+                                          filled, order.get('remainingQuantity'), json.dumps(order)))
+                changed.append(order)
+            entered_times = [parse_schwab_time(order['enteredTime']) for order in orders]
+            if entered_times:
+                self._set_cursor(account, "orders", max([*entered_times, self._cursor(account, "orders") or 0]))
+            self._connection.commit()
+        return changed
+
+    def upsert_transactions(self, account, transactions):
+        # returns the transactions not seen before (deduplicated by activityId), positions are updated in time order
+        new = []
+        with self._lock:
+            for transaction in sorted(transactions, key=lambda t: t['time']):
+                trade_item = next((item for item in transaction.get('transferItems', [])
+                                   if item.get('instrument', {}).get('assetType') not in (None, "CURRENCY")), {})
+                symbol = trade_item.get('instrument', {}).get('symbol')
+                row = (account, transaction['activityId'], parse_schwab_time(transaction['time']), transaction.get('type'),
+                       transaction.get('orderId'), symbol, trade_item.get('amount'), transaction.get('netAmount'), json.dumps(transaction))
+                if self._connection.execute("INSERT OR IGNORE INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", row).rowcount == 0:
+                    continue
+                if transaction.get('type') == "TRADE" and symbol is not None and trade_item.get('amount'):
+                    self._apply_trade(account, symbol, trade_item['amount'], transaction.get('netAmount') or 0.0)
+                new.append(transaction)
+            times = [parse_schwab_time(t['time']) for t in transactions]
+            if times:
+                self._set_cursor(account, "transactions", max([*times, self._cursor(account, "transactions") or 0]))
+            self._connection.commit()
+        return new
+
+    def _apply_trade(self, account, symbol, quantity, cash):
+        # average cost bookkeeping on cash flows (so option multipliers and fees are already included)
+        row = self._connection.execute("SELECT quantity, cost, realized FROM positions WHERE account = ? AND symbol = ?",
+                                       (account, symbol)).fetchone()
+        position, cost, realized = row if row is not None else (0.0, 0.0, 0.0)
+        if position == 0 or (position > 0) == (quantity > 0):
+            position, cost = position + quantity, cost - cash
+        else:
+            closed = min(abs(quantity), abs(position))
+            closing_fraction = closed / abs(quantity)
+            released_cost = cost * closed / abs(position)
+            realized += cash * closing_fraction - released_cost
+            cost -= released_cost
+            position += closed if quantity > 0 else -closed
+            opened = abs(quantity) - closed
+            if opened:
+                position += opened if quantity > 0 else -opened
+                cost -= cash * (1 - closing_fraction)
+        self._connection.execute("INSERT OR REPLACE INTO positions VALUES (?, ?, ?, ?, ?)", (account, symbol, position, cost, realized))
+
+    async def sync_orders(self, client, account, backfill_days=BACKFILL_DAYS):
+        # only request orders entered after the high-water mark (or still open)
+        start = self._orders_window_start(account, backfill_days)
+        end = int(datetime.now(timezone.utc).timestamp() * 1000)
+        response = await client.account_orders(account, format_schwab_time(start), format_schwab_time(end))
+        if response.status_code != 200:
+            raise Exception(f"Error fetching orders: {response.text}")
+        changed = self.upsert_orders(account, response.json())
+        logger.debug(f"Synced orders from {format_schwab_time(start)}: {len(changed)} new or changed")
+        return changed
+
+    async def sync_transactions(self, client, account, types="TRADE", backfill_days=BACKFILL_DAYS):
+        # only request transactions after the high-water mark
+        with self._lock:
+            high_water_mark = self._cursor(account, "transactions")
+        end = int(datetime.now(timezone.utc).timestamp() * 1000)
+        start = (high_water_mark - int(CURSOR_OVERLAP.total_seconds() * 1000) if high_water_mark is not None
+                 else end - int(timedelta(days=backfill_days).total_seconds() * 1000))
+        response = await client.transactions(account, format_schwab_time(start), format_schwab_time(end), types)
+        if response.status_code != 200:
+            raise Exception(f"Error fetching transactions: {response.text}")
+        new = self.upsert_transactions(account, response.json())
+        logger.debug(f"Synced transactions from {format_schwab_time(start)}: {len(new)} new")
+        return new
+
+    def _orders(self, query, params):
+        with self._lock:
+            rows = self._connection.execute(query, params).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def get_order(self, account, order_id):
+        orders = self._orders("SELECT raw FROM orders WHERE account = ? AND order_id = ?", (account, order_id))
+        return orders[0] if orders else None
+
+    def get_open_orders(self, account):
+        return self._orders("SELECT raw FROM orders WHERE account = ? AND is_open = 1 ORDER BY entered_time", (account,))
+
+    def get_filled_orders(self, account, since=None):
+        since_ms = int(since.timestamp() * 1000) if since is not None else 0
+        return self._orders("SELECT raw FROM orders WHERE account = ? AND status = 'FILLED' AND COALESCE(close_time, entered_time) >= ? "
+                            "ORDER BY COALESCE(close_time, entered_time)",
+                            (account, since_ms))
+
+    def get_realized_pnl(self, account, symbol=None):
+        # realized P&L per symbol (average cost, net of fees)
+        with self._lock:
+            if symbol is None:
+                rows = self._connection.execute("SELECT symbol, realized FROM positions WHERE account = ?", (account,)).fetchall()
+            else:
+                rows = self._connection.execute("SELECT symbol, realized FROM positions WHERE account = ? AND symbol = ?",
+                                                (account, symbol)).fetchall()
+        return {r[0]: r[1] for r in rows}
+
+    def get_positions(self, account):
+        with self._lock:
+            rows = self._connection.execute("SELECT symbol, quantity, cost FROM positions WHERE account = ? AND quantity != 0",
+                                            (account,)).fetchall()
+        return [{'symbol': r[0], 'quantity': r[1], 'cost': r[2]} for r in rows]
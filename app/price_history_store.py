@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+import calendar
+import sqlite3
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+PRICE_HISTORY_DB = "price_history.sqlite"
+BACKFILL_DAYS = 365 # history downloaded the first time a symbol is seen
+MIN_SYNC_INTERVAL = 15 * 60 # seconds between delta fetches of the same symbol/frequency
+
+def months_ago(dt, months):
+    # same day of the month n months earlier (clamped to the end of shorter months)
+    month_index = dt.year * 12 + dt.month - 1 - months
+    year, month = divmod(month_index, 12)
+    day = min(dt.day, calendar.monthrange(year, month + 1)[1])
+    return dt.replace(year=year, month=month + 1, day=day)
+
+class PriceHistoryStore:
+    def __init__(self, path=PRICE_HISTORY_DB):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS candles (
+                symbol TEXT NOT NULL,
+                frequency TEXT NOT NULL,
+                datetime INTEGER NOT NULL,
+                open REAL, high REAL, low REAL, close REAL, volume INTEGER,
+                PRIMARY KEY (symbol, frequency, datetime)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS syncs (
+                symbol TEXT NOT NULL,
+                frequency TEXT NOT NULL,
+                synced_at REAL NOT NULL,
+                PRIMARY KEY (symbol, frequency)
+            ) WITHOUT ROWID;
+        """)
+        self._connection.commit()
+
+    @staticmethod
+    def frequency_key(frequency_type, frequency):
+        return f"{frequency_type}:{frequency}"
+
+    def last_datetime(self, symbol, frequency_key):
+        with self._lock:
+            row = self._connection.execute("SELECT MAX(datetime) FROM candles WHERE symbol = ? AND frequency = ?",
+                                           (symbol, frequency_key)).fetchone()
+        return row[0]
+
+    def upsert(self, symbol, frequency_key, candles):
+        rows = [(symbol, frequency_key, c['datetime'], c.get('open'), c.get('high'), c.get('low'), c.get('close'), c.get('volume'))
+                for c in candles]
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO candles VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._connection.execute("INSERT OR REPLACE INTO syncs VALUES (?, ?, ?)", (symbol, frequency_key, time.time()))
+            self._connection.commit()
+
+    def _synced_recently(self, symbol, frequency_key):
+        with self._lock:
+            row = self._connection.execute("SELECT synced_at FROM syncs WHERE symbol = ? AND frequency = ?",
+                                           (symbol, frequency_key)).fetchone()
+        return row is not None and time.time() - row[0] < MIN_SYNC_INTERVAL
+
+    async def sync(self, client, symbol, frequency_type="daily", frequency=1, backfill_days=BACKFILL_DAYS):
+        # only request candles from the last stored bar on (it is re-fetched since it may have been partial)
+        frequency_key = self.frequency_key(frequency_type, frequency)
+        if self._synced_recently(symbol, frequency_key):
+            return 0
+        last = self.last_datetime(symbol, frequency_key)
+        start = datetime.fromtimestamp(last / 1000) if last is not None else datetime.now() - timedelta(days=backfill_days)
+        period_type = "day" if frequency_type == "minute" else "month"
+        response = await client.price_history(symbol, periodType=period_type, frequencyType=frequency_type, frequency=frequency,
+                                              startDate=start, endDate=datetime.now())
+        if response.status_code != 200:
+            raise Exception(f"Error fetching price history for {symbol}: {response.text}")
+        candles = response.json().get("candles", [])
+        self.upsert(symbol, frequency_key, candles)
+        logger.debug(f"Synced {len(candles)} {frequency_key} candles for {symbol}")
+        return len(candles)
+
+    def get_candles(self, symbol, start, end=None, frequency_type="daily", frequency=1):
+        end = end or datetime.now()
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT datetime, open, high, low, close, volume FROM candles "
+                "WHERE symbol = ? AND frequency = ? AND datetime BETWEEN ? AND ? ORDER BY datetime",
+                (symbol, self.frequency_key(frequency_type, frequency), int(start.timestamp() * 1000), int(end.timestamp() * 1000))).fetchall()
+        return [{'datetime': r[0], 'open': r[1], 'high': r[2], 'low': r[3], 'close': r[4], 'volume': r[5]} for r in rows]
+
+    def get_daily_closes(self, symbol, start, end=None):
+        # dates are converted by sqlite (local time, same as datetime.fromtimestamp)
+        end = end or datetime.now()
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT strftime('%Y-%m-%d', datetime / 1000, 'unixepoch', 'localtime'), close FROM candles "
+                "WHERE symbol = ? AND frequency = ? AND datetime BETWEEN ? AND ? ORDER BY datetime",
+                (symbol, self.frequency_key("daily", 1), int(start.timestamp() * 1000), int(end.timestamp() * 1000))).fetchall()
+        return [{'date': r[0], 'close': r[1]} for r in rows]
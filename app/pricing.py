@@ -0,0 +1,154 @@
+from datetime import datetime, timezone
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+RISK_FREE_RATE = 0.045 # annual, when the chain has no interestRate
+DAYS_PER_YEAR = 365.0
+MIN_TIME = 1e-6 # years (30 seconds), expired contracts are priced at this time to expiry
+MIN_VOL = 1e-4
+MAX_VOL = 5.0
+IV_TOLERANCE = 1e-6 # price
+IV_MAX_ITERATIONS = 60
+SQRT_2PI = np.sqrt(2 * np.pi)
+
+def norm_cdf(x):
+    # Hart's double precision algorithm (as given by West, "Better approximations to cumulative normal functions")
+    x = np.asarray(x, dtype=float)
+    z = np.abs(x)
+    with np.errstate(all="ignore"):
+        decay = np.exp(-z * z / 2)
+        numerator = (((((3.52624965998911e-02 * z + 0.700383064443688) * z + 6.37396220353165) * z + 33.912866078383) * z
+                      + 112.079291497871) * z + 221.213596169931) * z + 220.206867912376
+        denominator = ((((((8.83883476483184e-02 * z + 1.75566716318264) * z + 16.064177579207) * z + 86.7807322029461) * z
+                         + 296.564248779674) * z + 637.333633378831) * z + 793.826512519948) * z + 440.413735824752
+        fraction = decay / (z + 1 / (z + 2 / (z + 3 / (z + 4 / (z + 0.65))))) / 2.506628274631
+        tail = np.where(z < 7.07106781186547, decay * numerator / denominator, fraction)
+        tail = np.where(z > 37, 0.0, tail)
+    return np.where(x > 0, 1 - tail, tail)
+
+def norm_pdf(x):
+    x = np.asarray(x, dtype=float)
+    return np.exp(-0.5 * x * x) / SQRT_2PI
+
+def _inputs(is_put, spot, strike, t, vol, rate, dividend):
+    is_put, spot, strike, t, vol = np.broadcast_arrays(np.asarray(is_put, dtype=bool), *(np.asarray(v, dtype=float) for v in (spot, strike, t, vol)))
+    return is_put, spot, strike, np.maximum(t, MIN_TIME), np.maximum(vol, MIN_VOL), float(rate), float(dividend)
+
+def _d1_d2(spot, strike, t, vol, rate, dividend):
+    vol_t = vol * np.sqrt(t)
+    d1 = (np.log(spot / strike) + (rate - dividend + 0.5 * vol * vol) * t) / vol_t
+    return d1, d1 - vol_t
+
+def bs_price(is_put, spot, strike, t, vol, rate=RISK_FREE_RATE, dividend=0.0):
+    # Black-Scholes value of european options, t in years, vol as a fraction (0.25)
+    is_put, spot, strike, t, vol, rate, dividend = _inputs(is_put, spot, strike, t, vol, rate, dividend)
+    with np.errstate(all="ignore"):
+        d1, d2 = _d1_d2(spot, strike, t, vol, rate, dividend)
+        forward_spot, discounted_strike = spot * np.exp(-dividend * t), strike * np.exp(-rate * t)
+        call = forward_spot * norm_cdf(d1) - discounted_strike * norm_cdf(d2)
+        put = discounted_strike * norm_cdf(-d2) - forward_spot * norm_cdf(-d1)
+    return np.where(is_put, put, call)
+
+def bs_greeks(is_put, spot, strike, t, vol, rate=RISK_FREE_RATE, dividend=0.0):
+    # greeks in Schwab's units: theta per calendar day, vega and rho per volatility/rate point (1%)
+    is_put, spot, strike, t, vol, rate, dividend = _inputs(is_put, spot, strike, t, vol, rate, dividend)
+    with np.errstate(all="ignore"):
+        d1, d2 = _d1_d2(spot, strike, t, vol, rate, dividend)
+        sqrt_t = np.sqrt(t)
+        spot_decay, strike_discount = np.exp(-dividend * t), np.exp(-rate * t)
+        pdf_d1 = norm_pdf(d1)
+        cdf_d1, cdf_d2 = norm_cdf(d1), norm_cdf(d2)
+        decay = -spot * spot_decay * pdf_d1 * vol / (2 * sqrt_t)
+        call_theta = decay - rate * strike * strike_discount * cdf_d2 + dividend * spot * spot_decay * cdf_d1
+        put_theta = decay + rate * strike * strike_discount * (1 - cdf_d2) - dividend * spot * spot_decay * (1 - cdf_d1)
+        return {
+            "delta": np.where(is_put, spot_decay * (cdf_d1 - 1), spot_decay * cdf_d1),
+            "gamma": spot_decay * pdf_d1 / (spot * vol * sqrt_t),
+            "theta": np.where(is_put, put_theta, call_theta) / DAYS_PER_YEAR,
+            "vega": spot * spot_decay * pdf_d1 * sqrt_t / 100,
+            "rho": np.where(is_put, -strike * t * strike_discount * (1 - cdf_d2), strike * t * strike_discount * cdf_d2) / 100,
+        }
+
+def implied_volatility(price, is_put, spot, strike, t, rate=RISK_FREE_RATE, dividend=0.0,
+                       tolerance=IV_TOLERANCE, max_iterations=IV_MAX_ITERATIONS):
+    # vectorized Newton steps kept inside a shrinking [low, high] bracket (bisection when a step leaves it),
+    # NaN for prices outside the no-arbitrage bounds
+    price = np.asarray(price, dtype=float)
+    is_put, spot, strike, t, _, rate, dividend = _inputs(is_put, spot, strike, t, MIN_VOL, rate, dividend)
+    price = np.broadcast_to(price, spot.shape)
+    with np.errstate(all="ignore"):
+        forward_spot, discounted_strike = spot * np.exp(-dividend * t), strike * np.exp(-rate * t)
+        lower = np.where(is_put, np.maximum(discounted_strike - forward_spot, 0), np.maximum(forward_spot - discounted_strike, 0))
+        upper = np.where(is_put, discounted_strike, forward_spot)
+        solvable = (price > lower) & (price < upper) & (spot > 0) & (strike > 0)
+        low, high = np.full(spot.shape, MIN_VOL), np.full(spot.shape, MAX_VOL)
+        vol = np.clip(np.sqrt(2 * np.pi / t) * price / spot, MIN_VOL, MAX_VOL) # Brenner-Subrahmanyam guess
+        active = solvable.copy()
+        for _ in range(max_iterations):
+            if not active.any():
+                break
+            index = np.flatnonzero(active)
+            v = vol[index]
+            diff = bs_price(is_put[index], spot[index], strike[index], t[index], v, rate, dividend) - price[index]
+            converged = np.abs(diff) < tolerance
+            # the price increases with volatility
+            high[index] = np.where(diff > 0, v, high[index])
+            low[index] = np.where(diff < 0, v, low[index])
+            d1, _ = _d1_d2(spot[index], strike[index], t[index], v, rate, dividend)
+            vega = spot[index] * np.exp(-dividend * t[index]) * norm_pdf(d1) * np.sqrt(t[index])
+            step = v - diff / vega
+            inside = (vega > 1e-12) & (step > low[index]) & (step < high[index])
+            vol[index] = np.where(converged, v, np.where(inside, step, (low[index] + high[index]) / 2))
+            active[index] = ~converged & (high[index] - low[index] > 1e-10)
+        if active.any():
+            logger.debug(f"Implied volatility did not converge for {int(active.sum())} contracts")
+    return np.where(solvable, vol, np.nan)
+
+def years_to_expiration(expiration_dates, now=None):
+    # ISO expiration dates (Schwab expirationDate) to years, one parse per unique date
+    now = now or datetime.now(timezone.utc)
+    years = {}
+    for expiration in set(expiration_dates):
+        try:
+            expires = datetime.fromisoformat(expiration)
+            if expires.tzinfo is None:
+                expires = expires.replace(tzinfo=timezone.utc)
+            years[expiration] = max((expires - now).total_seconds(), 0) / (DAYS_PER_YEAR * 86400)
+        except (TypeError, ValueError):
+            years[expiration] = np.nan
+    return np.array([years[expiration] for expiration in expiration_dates], dtype=float)
+
+def chain_greeks(chain, spot, rate=None, dividend=0.0, now=None):
+    # local implied volatility (percent, from the mid price) and greeks for every contract of an OptionChain
+    rate = chain.interest_rate if rate is None else rate
+    rate = RISK_FREE_RATE if rate is None else rate
+    t = years_to_expiration(chain.expiration_dates, now)[chain.expiration_index]
+    with np.errstate(all="ignore"):
+        mid = np.where((chain.bid > 0) & (chain.ask > 0), (chain.bid + chain.ask) / 2, chain.last)
+    vol = implied_volatility(mid, chain.is_put, spot, chain.strike_price, t, rate, dividend)
+    greeks = bs_greeks(chain.is_put, spot, chain.strike_price, t, vol, rate, dividend)
+    greeks = {name: np.where(np.isnan(vol), np.nan, values) for name, values in greeks.items()}
+    greeks["implied_volatility"] = vol * 100
+    return greeks
+
+def reprice_chain(chain, spot, rate=None, dividend=0.0, now=None):
+    # replaces the chain's Schwab IV and greeks with local ones, contracts the solver cannot price keep Schwab's values
+    greeks = chain_greeks(chain, spot, rate, dividend, now)
+    for name in ("implied_volatility", "delta", "gamma", "theta", "vega"):
+        values = greeks[name]
+        column = chain.column(name)
+        column[:] = np.where(np.isnan(values), column, values)
+    chain.iv_stats = chain.compute_iv_stats()
+    return chain
+
+def greeks_deviation(chain, spot, rate=None, dividend=0.0, now=None):
+    # median absolute difference between the chain's (Schwab) IV and greeks and local ones, Schwab's placeholders (IV <= 0) are skipped
+    local = chain_greeks(chain, spot, rate, dividend, now)
+    quoted = chain.implied_volatility > 0
+    deviation = {}
+    for name in ("implied_volatility", "delta", "gamma", "theta", "vega"):
+        differences = np.abs(local[name] - chain.column(name))[quoted]
+        differences = differences[~np.isnan(differences)]
+        deviation[name] = float(np.median(differences)) if len(differences) else None
+    return deviation
@@ -0,0 +1,68 @@
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+QUOTE_MAX_AGE = 1.0 # seconds a cached quote is served without going back to REST
+L1_SERVICES = ("LEVELONE_EQUITIES", "LEVELONE_OPTIONS")
+
+class QuoteCache:
+    # latest level one fields per equity / OCC option symbol, merged from stream updates (which only carry changed fields)
+    def __init__(self, max_age=QUOTE_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._quotes = {} # symbol -> {field: value}
+        self._updated = {} # symbol -> time.monotonic() of the last update of that symbol
+        self._reference = {} # symbol -> fields only REST has (e.g. avg10DaysVolume)
+
+    def on_stream_message(self, decoded, **kwargs):
+        # receiver for StreamDecoder(...).wrap(...)
+        now = time.monotonic()
+        with self._lock:
+            for service in L1_SERVICES:
+                for record in decoded["data"].get(service, ()):
+                    symbol = record.get("key")
+                    if symbol is None:
+                        continue
+                    fields = self._quotes.setdefault(symbol, {})
+                    fields.update(record)
+                    self._updated[symbol] = now
+
+    def set_reference(self, symbol, fields):
+        with self._lock:
+            self._reference.setdefault(symbol, {}).update(fields)
+
+    def get_reference(self, symbol):
+        with self._lock:
+            return dict(self._reference.get(symbol, {}))
+
+    def remove(self, symbols):
+        # unsubscribed symbols stop receiving updates, so they must not look current
+        with self._lock:
+            for symbol in symbols:
+                self._quotes.pop(symbol, None)
+                self._updated.pop(symbol, None)
+
+    def age(self, symbol):
+        # seconds since this symbol was last updated (None if never), traffic on other symbols says nothing about a dropped subscription
+        with self._lock:
+            updated = self._updated.get(symbol)
+        return time.monotonic() - updated if updated is not None else None
+
+    def get(self, symbol, max_age=None, required=()):
+        # fields of a fresh quote, None if missing, stale or missing a required field
+        age = self.age(symbol)
+        if age is None or age > (self.max_age if max_age is None else max_age):
+            return None
+        with self._lock:
+            fields = dict(self._quotes.get(symbol, {}))
+        if any(fields.get(field) is None for field in required):
+            return None
+        return fields
+
+    def stats(self):
+        with self._lock:
+            symbols = list(self._updated)
+        staleness = {symbol: self.age(symbol) for symbol in symbols}
+        return {"symbols": len(symbols), "fresh": sum(1 for s in staleness.values() if s is not None and s <= self.max_age),
+                "staleness": staleness}
@@ -1,13 +1,28 @@
 from app.schwabdev.client import Client as SchwabClient
+from app.schwabdev.async_client import AsyncClient as SchwabAsyncClient
+from app.schwabdev.cache import ResponseCache
+from app.schwabdev.chain_fetcher import ChainFetcher
+from app.schwabdev.retry import RetryPolicy
+from app.schwabdev.stream_decoder import StreamDecoder
+from app.price_history_store import PriceHistoryStore, months_ago
+from app.order_sync import OrderSync
+from app.quote_cache import QuoteCache, L1_SERVICES
+from app.bar_aggregator import BarAggregator
+from app.execution_monitor import ExecutionMonitor
+from app.contract_scoring import score_chains
+from app.models.option_and_chain_model import OptionChain
+from app.pricing import reprice_chain, greeks_deviation
+from app.iv_history_store import IVHistoryStore, atm_iv_by_expiration
+from app.trade_selection import select_counts
 from dotenv import load_dotenv
 from datetime import datetime,timedelta
-import math
 import logging
 import os
 import asyncio
-import statistics
+import threading
 import json
 import pulp
+import numpy as np
 from calendar import month_abbr
 
 logger = logging.getLogger(__name__)
@@ -15,13 +30,37 @@ load_dotenv()
 APP_KEY = os.getenv("APP_KEY")
 APP_SECRET = os.getenv("APP_SECRET")
 APP_CALLBACK_URL = os.getenv("APP_CALLBACK_URL")
-schwab_client = SchwabClient(APP_KEY, APP_SECRET, APP_CALLBACK_URL)
+schwab_client = SchwabClient(APP_KEY, APP_SECRET, APP_CALLBACK_URL, cache=ResponseCache(),
+                             retry_policy=RetryPolicy(hedge_percentile=0.95))
+schwab_async_client = SchwabAsyncClient(schwab_client)
+chain_fetcher = ChainFetcher(schwab_async_client)
+QUOTES_CHUNK_SIZE = 50 # symbols per quotes request
+quote_cache = QuoteCache()
+bar_aggregator = BarAggregator()
+L1_EQUITY_FIELDS = "0,1,2,3,8,10,11,12,17,33,34,35" # symbol, bid, ask, last, volume, high, low, close, open, mark, quote/trade time
+L1_OPTION_FIELDS = "0,2,3,4,8,9,10,28,29,30,31,37,38" # symbol, bid, ask, last, volume, OI, volatility, greeks, mark, quote time
+QUOTE_REQUIRED_FIELDS = ("lastPrice", "bidPrice", "askPrice", "openPrice", "highPrice", "lowPrice", "closePrice", "totalVolume", "quoteTime")
+CHART_EQUITY_FIELDS = "0,1,2,3,4,5,6,7,8"
+
+stream_receivers = [quote_cache.on_stream_message, bar_aggregator.on_stream_message]
+stream_start_lock = threading.Lock() # stream.active is only set after login, concurrent starts would open several sessions
+
+def on_stream_message(decoded, **kwargs):
+    for receiver in stream_receivers:
+        receiver(decoded)
 global available_cash
 global account_id
 
 class SchwabTools:
     def __init__(self):
         self.account_hash = None
+        self.price_history_store = PriceHistoryStore()
+        self.order_sync = OrderSync()
+        self.option_chains = {} # ticker -> last fetched OptionChain (merged exp map, scored)
+        self.full_option_chains = {} # ticker -> last fetched OptionChain with calls and puts (ATM IV)
+        self.iv_history = IVHistoryStore()
+        self.execution_monitor = ExecutionMonitor(self._fetch_order, lambda: schwab_client.stream.active)
+        stream_receivers.append(self.execution_monitor.on_stream_message)
         self.available_cash = self.get_schwab_available_cash()
         
     def get_schwab_available_cash(self):
@@ -33,50 +72,189 @@ class SchwabTools:
         
         return available_cash
 
-    def get_core_quote(self,ticker):
-        response = schwab_client.quotes(ticker)#can send a list of tickers to get multiple quotes
+    def get_api_metrics_summary(self, reset=True):
+        # per endpoint latency, payload size and status counts since the last reset
+        summary = schwab_client.metrics.summary()
+        if reset:
+            schwab_client.metrics.reset()
+        return summary
+
+    def get_api_cache_stats(self, reset=True):
+        # hits are Schwab API calls saved by the response cache since the last reset
+        stats = schwab_client.cache.stats()
+        if reset:
+            schwab_client.cache.reset_stats()
+        return stats
+
+    async def sync_account_activity(self):
+        # incremental sync, only orders/transactions newer than the last sync (or still open) are requested
+        changed_orders, new_transactions = await asyncio.gather(self.order_sync.sync_orders(schwab_async_client, self.account_hash),
+                                                                self.order_sync.sync_transactions(schwab_async_client, self.account_hash))
+        filled_orders = [order for order in changed_orders if order.get('status') == "FILLED"]
+        return {"changedOrders": changed_orders, "filledOrders": filled_orders, "newTransactions": new_transactions}
+
+    def get_open_orders(self):
+        return self.order_sync.get_open_orders(self.account_hash)
+
+    def get_realized_pnl(self, symbol=None):
+        return self.order_sync.get_realized_pnl(self.account_hash, symbol)
+
+    def start_quote_stream(self, tickers=(), option_symbols=()):
+        # level one updates feed quote_cache, reads below are served from it while fresh, chart bars feed bar_aggregator
+        stream = schwab_client.stream
+        if tickers:
+            stream.send(stream.level_one_equities(list(tickers), L1_EQUITY_FIELDS))
+            stream.send(stream.chart_equity(list(tickers), CHART_EQUITY_FIELDS))
+        if option_symbols:
+            stream.send(stream.level_one_options(list(option_symbols), L1_OPTION_FIELDS))
+        self._ensure_stream()
+
+    def start_account_activity_stream(self):
+        # fills and cancels of our orders arrive as ACCT_ACTIVITY events (see execution_monitor)
+        stream = schwab_client.stream
+        stream.send(stream.account_activity())
+        self._ensure_stream()
+
+    def _ensure_stream(self):
+        # starts the streamer thread once, subscriptions sent before login are queued and replayed by it
+        stream = schwab_client.stream
+        with stream_start_lock:
+            if stream._thread is None or not stream._thread.is_alive():
+                stream.start(StreamDecoder(services=(*L1_SERVICES, "CHART_EQUITY", "ACCT_ACTIVITY")).wrap(on_stream_message), workers=1)
+
+    def get_intraday_features(self, ticker):
+        # vwap and realized volatility from streamed bars, None until the stream delivered data for the ticker
+        return bar_aggregator.features(ticker)
+
+    def get_quote_staleness(self, symbols):
+        return {symbol: quote_cache.age(symbol) for symbol in symbols}
+
+    def _cached_core_quote(self, ticker):
+        # stream fields on top of the REST-only fields kept from the last REST quote
+        reference = quote_cache.get_reference(ticker)
+        fields = quote_cache.get(ticker, required=QUOTE_REQUIRED_FIELDS)
+        if fields is None or reference.get('avg10DaysVolume') is None:
+            return None
+        return self._parse_quote({ticker: {'quote': fields, 'fundamental': reference}}, ticker)
+
+    def _remember_quote_reference(self, data, ticker):
+        fundamental = data.get(ticker, {}).get('fundamental', {})
+        if fundamental.get('avg10DaysVolume') is not None:
+            quote_cache.set_reference(ticker, {'avg10DaysVolume': fundamental['avg10DaysVolume']})
+
+    async def get_core_quote(self,ticker):
+        quote = self._cached_core_quote(ticker)
+        if quote is not None:
+            return quote
+        response = await schwab_async_client.quotes(ticker)#can send a list of tickers to get multiple quotes
         data = response.json()
+        self._remember_quote_reference(data, ticker)
         quote = (self._parse_quote(data, ticker))
         return quote
 
-    def get_options_chain(self,tickers_strike_dict):
-        options_chain_list = []
-        for ticker, strike_price in tickers_strike_dict.items():
-            
-            #TODO: May have to add argument for expiration month, strike count
-            current_date =  (datetime.now() + timedelta(days=3)).strftime("%Y-%m-%d")
-            current_date_plus_14 = (datetime.now() + timedelta(days=14)).strftime("%Y-%m-%d")
-            response = schwab_client.option_chains(symbol=ticker,contractType="ALL",strikeCount=9,
-                                                strike=strike_price, includeUnderlyingQuote=False,fromDate=current_date,toDate=current_date_plus_14)
-            contract_list = []
+    async def get_core_quotes(self, tickers, chunk_size=QUOTES_CHUNK_SIZE):
+        # fresh streamed quotes first, one quotes request per chunk of the remaining symbols instead of one per ticker
+        tickers = list(tickers)
+        quotes = {}
+        for ticker in tickers:
+            quote = self._cached_core_quote(ticker)
+            if quote is not None:
+                quotes[ticker] = quote
+        tickers = [ticker for ticker in tickers if ticker not in quotes]
+        chunks = [tickers[i:i + chunk_size] for i in range(0, len(tickers), chunk_size)]
+        responses = await asyncio.gather(*[schwab_async_client.quotes(chunk) for chunk in chunks])
+        for chunk, response in zip(chunks, responses):
             data = response.json()
-            
-            #Extract calls
-            call_exp_map = data.get("callExpDateMap", {})
-            # contract_list = _extract_contract_info(call_exp_map, contract_list)
-            # Extract puts
-            put_exp_map = data.get("putExpDateMap", {})
-            # contract_list = _extract_contract_info(put_exp_map, contract_list)
-            combined_exp_map = {**call_exp_map, **put_exp_map}
-            contract_list = self._extract_contract_info(combined_exp_map, contract_list)
-            
-            options_chain_list.append({'ticker':ticker, 'options':contract_list})
-            contract_list = []  # Reset for the next ticker
+            for ticker in chunk:
+                self._remember_quote_reference(data, ticker)
+                quote = self._parse_quote(data, ticker)
+                if quote is not None:
+                    quotes[ticker] = quote
+        return quotes
+
+    async def get_options_chain(self,tickers_strike_dict, min_days=3, max_days=14, strike_count=9, subscribe=True):
+        current_date =  (datetime.now() + timedelta(days=min_days)).strftime("%Y-%m-%d")
+        current_date_plus_max = (datetime.now() + timedelta(days=max_days)).strftime("%Y-%m-%d")
+        # fetch every ticker's chain concurrently, oversized chains are split and merged by the fetcher
+        chains = await asyncio.gather(*[chain_fetcher.fetch(symbol=ticker,contractType="ALL",strikeCount=strike_count,
+                                                strike=strike_price, includeUnderlyingQuote=False,fromDate=current_date,toDate=current_date_plus_max)
+                                        for ticker, strike_price in tickers_strike_dict.items()])
+        option_chains, atm_ivs = [], []
+        for ticker, data in zip(tickers_strike_dict, chains):
+            call_map, put_map = data.get("callExpDateMap", {}), data.get("putExpDateMap", {})
+            # scoring keeps the merged map (puts replace the calls of an expiration) so its results are unchanged
+            combined_exp_map = {**call_map, **put_map}
+            chain = OptionChain.from_schwab(ticker, combined_exp_map, underlying_price=data.get("underlyingPrice"),
+                                            interest_rate=data.get("interestRate"))
+            full_chain = OptionChain.from_schwab(ticker, call_map, put_map, underlying_price=data.get("underlyingPrice"),
+                                                 interest_rate=data.get("interestRate"))
+            # as fetched, rescore_options_chain reprices copies of them
+            self.option_chains[ticker], self.full_option_chains[ticker] = chain.copy(), full_chain.copy()
+            try: # today's ATM IV by tenor from calls and puts, the history feeds IV cheapness
+                atm_ivs.append(self._expiration_atm_ivs(chain, full_chain, self.iv_history.record_chain(full_chain)))
+            except Exception as e:
+                logger.error(f"Error recording IV history for {ticker}: {e}")
+                atm_ivs.append(None)
+            option_chains.append(self._overlay_live_option_quotes(chain))
+        self._score_contracts(option_chains, atm_ivs)
+        options_chain_list = [{'ticker':chain.ticker, 'options':chain.to_records()} for chain in option_chains]
 
+        if subscribe: # concurrent callers pass False and call subscribe_option_quotes once instead
+            await self.subscribe_option_quotes(tickers_strike_dict)
         
         return options_chain_list
 
-    def get_price_history(self, ticker, periodType="month"):
-        response = schwab_client.price_history(ticker, periodType=periodType,period=1, frequencyType="daily")
-        data = response.json()
-        
-        candles = data.get("candles")
-        hist_pr_list=[]
-        for candle in candles:
-            date = datetime.fromtimestamp(candle['datetime'] / 1000).strftime('%Y-%m-%d')
-            close_price = candle['close']
-            hist_pr_list.append({'date': date, 'close': close_price})
-        return hist_pr_list
+    async def subscribe_option_quotes(self, tickers):
+        # stream the fetched contracts of tickers in one request so later scoring uses live bid/ask from quote_cache
+        option_symbols = [symbol for ticker in tickers if ticker in self.full_option_chains for symbol in self.full_option_chains[ticker].symbols]
+        if not option_symbols:
+            return
+        try:
+            await asyncio.to_thread(self.start_quote_stream, (), option_symbols)
+        except Exception as e:
+            logger.error(f"Error subscribing option quotes: {e}")
+
+    def rescore_options_chain(self, ticker):
+        # greeks, IV and scores from the streamed quotes (option bid/ask, underlying last) without refetching the chain
+        fetched = self.option_chains.get(ticker)
+        if fetched is None:
+            return None
+        underlying = quote_cache.get(ticker, required=("lastPrice",))
+        spot = underlying["lastPrice"] if underlying is not None else fetched.underlying_price
+        chain = self._overlay_live_option_quotes(fetched.copy())
+        atm_ivs = None
+        if spot is not None:
+            reprice_chain(chain, spot)
+            # ATM IV from calls and puts like the history it is compared to (see get_options_chain)
+            full_chain = reprice_chain(self._overlay_live_option_quotes(self.full_option_chains[ticker].copy()), spot)
+            atm_ivs = [self._expiration_atm_ivs(chain, full_chain, atm_iv_by_expiration(full_chain, spot))]
+        self._score_contracts([chain], atm_ivs)
+        return {'ticker': ticker, 'options': chain.to_records()}
+
+    @staticmethod
+    def _expiration_atm_ivs(chain, full_chain, atm):
+        # ATM IVs of full_chain's expirations (None for none) in the order of chain's expirations, NaN where missing
+        atm_by_key = dict(zip(full_chain.expiration_keys, atm.tolist())) if atm is not None else {}
+        return np.array([atm_by_key.get(key, np.nan) for key in chain.expiration_keys], dtype=float)
+
+    def check_chain_greeks(self, ticker):
+        # median absolute differences between Schwab's IV/greeks and the local Black-Scholes ones for the fetched chain
+        chain = self.option_chains.get(ticker)
+        if chain is None or chain.underlying_price is None:
+            return None
+        return greeks_deviation(chain, chain.underlying_price)
+
+    async def get_price_history(self, ticker, periodType="month", period=1):
+        # only candles newer than the last stored bar are downloaded, the lookback is served from disk
+        await self.price_history_store.sync(schwab_async_client, ticker)
+        now = datetime.now()
+        if periodType == "year":
+            start = months_ago(now, 12 * period)
+        elif periodType == "day":
+            start = now - timedelta(days=period)
+        else:
+            start = months_ago(now, period)
+        return self.price_history_store.get_daily_closes(ticker, start, now)
         
     async def place_order(self,trade):
         try:
@@ -108,22 +286,50 @@ class SchwabTools:
                 ]
             }
             # Place order using Schwab API
-            response = schwab_client.order_place(self.account_hash,order)
+            response = await schwab_async_client.order_place(self.account_hash,order)
             if response.status_code != 201:
                 raise Exception(f"Error placing order: {response.text}")
             else:
+                # the new order id is the last part of the Location header (missing if the order filled immediately)
+                location = response.headers.get("Location")
                 return {
                     "status": "success",
                     "ticker": trade['symbol'],
+                    "symbol": trade['symbol'],
                     "premium_per_contract": premium_per_contract,
+                    "exitPremium": exit_premium,
                     "contract_symbol": contract_symbol,
                     "quantity": contracts_to_buy,
+                    "order_id": location.rstrip("/").split("/")[-1] if location else None,
                 }
 
         except Exception as e:
             logger.error(f"Error in place_order: {e}")
             return None
     
+    async def _fetch_order(self, order_id):
+        response = await schwab_async_client.order_details(self.account_hash, order_id)
+        if response.status_code != 200:
+            raise Exception(f"Error fetching order {order_id}: {response.text}")
+        return response.json()
+
+    async def place_exits_on_fill(self, placed_orders, timeout):
+        # each exit is placed as soon as its entry fills, entries without an order id were filled immediately
+        exits = []
+        async def on_fill(order_id, trade):
+            exits.append(await self.place_exit_oco_order(trade))
+        for trade in placed_orders:
+            if trade.get('order_id') is None:
+                await on_fill(None, trade)
+            else:
+                self.execution_monitor.track(trade['order_id'], trade)
+        statuses = await self.execution_monitor.run(on_fill, timeout)
+        self.execution_monitor.forget(statuses)
+        unfilled = {order_id: status for order_id, status in statuses.items() if status != "FILLED"}
+        if unfilled:
+            logger.info(f"Entries not filled: {unfilled}")
+        return [exit_order for exit_order in exits if exit_order is not None]
+
     async def place_exit_oco_order(self,trade):
         stop_loss = round(trade['premium_per_contract'] * 0.5,2)
         exit_premium = trade['exitPremium']
@@ -170,7 +376,7 @@ class SchwabTools:
                     } 
                     ] 
                     }
-            oco_response = schwab_client.order_place(self.account_hash,oco_order)
+            oco_response = await schwab_async_client.order_place(self.account_hash,oco_order)
             if oco_response.status_code != 201:
                 raise Exception(f"Error placing stop loss order: {oco_response.text}")
             else:
@@ -201,27 +407,9 @@ class SchwabTools:
                 continue
             items.append((idx, cost_cents, item['score']))
         
-        # DP arrays
-        dp = [0.0] * (budget_cents + 1)
-        choice = [-1] * (budget_cents + 1)
-        
-        # Unbounded knapsack
-        for b in range(budget_cents + 1):
-            for idx, cost, value in items:
-                if cost <= b:
-                    new_val = dp[b - cost] + value
-                    if new_val > dp[b]:
-                        dp[b] = new_val
-                        choice[b] = idx
-        
-        # Backtrack to find quantities
-        remaining = budget_cents
-        counts = {idx: 0 for idx, _, _ in items}
-        while remaining > 0 and choice[remaining] != -1:
-            idx = choice[remaining]
-            cost = next(c for i, c, v in items if i == idx)
-            counts[idx] += 1
-            remaining -= cost
+        # Unbounded knapsack on GCD-reduced costs (vectorized DP, branch-and-bound for very large budgets)
+        quantities = select_counts([cost for _, cost, _ in items], [value for _, _, value in items], budget_cents)
+        counts = {idx: count for (idx, _, _), count in zip(items, quantities)}
         
         # Build result
         selected = []
@@ -308,185 +496,27 @@ class SchwabTools:
             'totalPremiumUsed': total_used
         }
         
-    def _extract_contract_info(self,exp_map, contract_list):
-            # Collect contracts by expiration date
-        expiration_contracts_map = {}
+    def _overlay_live_option_quotes(self, chain):
+        # the chain may be seconds old, fresh streamed bid/ask/last replace it before scoring
+        for i, symbol in enumerate(chain.symbols):
+            fields = quote_cache.get(symbol, required=("bidPrice", "askPrice"))
+            if fields is not None:
+                chain.bid[i] = fields["bidPrice"]
+                chain.ask[i] = fields["askPrice"]
+                if fields.get("lastPrice") is not None:
+                    chain.last[i] = fields["lastPrice"]
+        return chain
 
-        for exp_date, strikes in exp_map.items():
-            for strike_price, contracts in strikes.items():
-                for contract in contracts:
-                    symbol = contract.get("symbol")
-                    expiration = contract.get("expirationDate")
-                    ctype = contract.get("putCall")
-                    strike = contract.get("strikePrice")
-                    bid = contract.get("bid")
-                    ask = contract.get("ask")
-                    last = contract.get("last")
-                    open_interest = contract.get("openInterest")
-                    volume = contract.get("totalVolume")
-                    implied_volatility = contract.get("volatility")
-                    delta = contract.get("delta")
-                    gamma = contract.get("gamma")
-                    theta = contract.get("theta")
-                    vega = contract.get("vega")
-
-                    contract_obj = {
-                        "expiration_date": expiration,
-                        "contract_symbol": symbol,
-                        "strike_price": strike,
-                        "type": ctype,
-                        "bid": bid,
-                        "ask": ask,
-                        "last": last,
-                        "open_interest": open_interest,
-                        "volume": volume,
-                        "implied_volatility": implied_volatility,
-                        "delta": delta,
-                        "gamma": gamma,
-                        "theta": theta,
-                        "vega": vega
-                    }
-                    contract_list.append(contract_obj)
-                    
-                    # Group contracts by their expiration (exp_date key, as returned by Schwab)
-                    expiration_contracts_map.setdefault(exp_date, []).append(contract_obj)
-
-        # Compute IV stats for each expiration date, then attach results to each contract in that group
-        for exp_date, contracts_for_exp in expiration_contracts_map.items():
-            iv_values = [c["implied_volatility"] for c in contracts_for_exp if c["implied_volatility"] is not None]
-            if iv_values:
-                stats = {
-                    "expiration_date": exp_date,
-                    "min": min(iv_values),
-                    "max": max(iv_values),
-                    "mean": statistics.mean(iv_values),
-                    "std": statistics.pstdev(iv_values)  # population stdev = pstdev
-                }
-                for c in contracts_for_exp:
-                    c["iv_stats"] = stats  # attach stats to each contract
-        self._score_contracts(contract_list)
-        return contract_list
-
-    def _score_contracts(self,contract_list):
-        
-        logger = logging.getLogger(__name__)
-        
-        # At the beginning of _score_contracts
-        all_open_interests = [c.get("open_interest", 0) for c in contract_list if c.get("open_interest", 0) > 0]
-        if all_open_interests:
-            OI_REF = max(1000, statistics.median(all_open_interests) * 2)  # Median × 2 as reference
-        else:
-            OI_REF = 5000  # Fallback value
-        
-        for contract in contract_list:
+    def _score_contracts(self, chains, atm_ivs=None):
+        # vectorized over every ticker's chain at once, see contract_scoring
+        # atm_ivs (per chain, ATM IV per expiration) are ranked against the IV history once a symbol has enough of it
+        percentiles = None
+        if atm_ivs is not None:
             try:
-                # Extract contract data
-                option_type = contract["type"]
-                strike = contract["strike_price"]
-                delta = contract.get("delta", 0)
-                implied_vol = contract.get("implied_volatility", 0) / 100  # Convert from percentage
-                theta = abs(contract.get("theta", 0))
-                bid = contract.get("bid", 0)
-                ask = contract.get("ask", 0)
-                open_interest = contract.get("open_interest", 0)
-                
-                # IV stats
-                iv_stats = contract.get("iv_stats", {})
-                iv_mean = iv_stats.get("mean", implied_vol * 100) / 100
-                iv_std = iv_stats.get("std", 1) / 100
-                iv_current = implied_vol
-                
-                # Calculate premium (mid-price)
-                premium = (bid + ask) / 2 if bid and ask else 0
-                
-                # Calculate days to expiration
-                exp_date = datetime.strptime(contract["expiration_date"].split('T')[0], "%Y-%m-%d")
-                current_date = datetime.now()
-                days_to_expiration = max(1, (exp_date - current_date).days + 1)
-                
-                score_components = {}
-                
-                # 1. Calculate Probability of Profit (40%)
-                if option_type == "PUT":
-                    pop = 1 - abs(delta) if delta else 0.5  # POP for puts
-                else:  # CALL
-                    pop = delta if delta else 0.5  # POP for calls
-                
-                pop_score = pop * 10  # Scale to 0-10
-                score_components["pop_score"] = pop_score * 0.4
-                
-                # 2. Expected ROI (20%)
-                if premium > 0:
-                    # Simplified expected ROI calculation
-                    if option_type == "PUT":
-                        exp_roi = (pop * premium - (1-pop) * (strike - premium)) / premium
-                    else:  # CALL
-                        exp_roi = (pop * (strike - premium) - (1-pop) * premium) / premium
-                        
-                    exp_roi = min(1.0, max(-1.0, exp_roi))  # Clamp to [-1, 1]
-                else:
-                    exp_roi = 0
-                    
-                exp_roi_score = (exp_roi + 1) * 5  # Scale from [-1,1] to [0,10]
-                score_components["exp_roi_score"] = exp_roi_score * 0.2
-                
-                # 3. Risk/Reward ratio (10%)
-                if 0 < pop < 0.99:  # Avoid division by zero
-                    risk_reward = (pop / (1 - pop)) * max(0, exp_roi)
-                    # Normalize to 0-10 (using a log scale since risk/reward can get large)
-                    risk_reward_score = min(10, max(0, math.log(1 + risk_reward) * 3))
-                else:
-                    risk_reward_score = 10 if pop >= 0.99 else 0
-                    
-                score_components["risk_reward_score"] = risk_reward_score * 0.1
-                
-                # 4. Theta decay drag (10%) - inverted so lower is better
-                if premium > 0:
-                    theta_drag = (theta * days_to_expiration) / premium
-                    # Invert so lower values are better (less decay per premium dollar)
-                    theta_drag_score = 10 / (1 + theta_drag * 2)  # Using a sigmoid-like function
-                else:
-                    theta_drag_score = 0
-                
-                score_components["theta_drag_score"] = min(10, max(0, theta_drag_score)) * 0.1
-                
-                # 5. Liquidity score (10%)
-                if ask > bid > 0:
-                    # Calculate inverse bid-ask spread
-                    spread_pct = (ask - bid) / bid
-                    inverse_spread = 1 / max(0.01, spread_pct)
-                    
-                    # Open interest factor (sqrt scale)
-                    oi_factor = math.sqrt(max(1, open_interest) / OI_REF)
-                    
-                    liquidity_score = min(10, inverse_spread * oi_factor)
-                else:
-                    liquidity_score = 1  # Poor liquidity if invalid bid/ask
-                    
-                score_components["liquidity_score"] = liquidity_score * 0.1
-                
-                # 6. IV cheapness (10%)
-                if iv_std > 0:
-                    iv_z_score = (iv_mean - iv_current) / iv_std
-                    # Convert z-score to a 0-10 scale where lower IV is better
-                    iv_cheapness_score = min(10, max(0, (iv_z_score + 3) * 5/6))
-                else:
-                    iv_cheapness_score = 5  # Neutral score if std is 0
-                    
-                score_components["iv_cheapness_score"] = iv_cheapness_score * 0.1
-                
-                # Calculate final weighted score
-                final_score = sum(score_components.values())
-                final_scory = round(final_score, 2)
-                # Store score and components in the contract object
-                contract["score"] = final_scory
-                
+                percentiles = [self.iv_history.expiration_percentiles(chain, atm) for chain, atm in zip(chains, atm_ivs)]
             except Exception as e:
-                logger.error(f"Error scoring contract {contract.get('contract_symbol', 'unknown')}: {e}")
-                contract["score"] = 0
-                contract["score_components"] = {"error": str(e)}
-        
-        return contract_list
+                logger.error(f"Error reading IV history: {e}")
+        return score_chains(chains, iv_percentiles=percentiles)
 
     def _parse_quote(self, json_response, ticker):
         try:
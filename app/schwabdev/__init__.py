@@ -1,2 +1,3 @@
 from .client import Client
+from .async_client import AsyncClient
 #from .stream import Stream
\ No newline at end of file
@@ -0,0 +1,223 @@
+"""
+This file contains an asyncio client class that accesses the Schwab api
+Built on top of the synchronous Client (same method surface, same Tokens manager)
+"""
+import time
+import asyncio
+import httpx
+from .client import Client, BASE_API_URL
+from .rate_limiter import PRIORITY_READ
+from .cache import ResponseCache, CachedResponse
+from .single_flight import AsyncSingleFlight
+
+
+async def _session_scope(session: httpx.AsyncClient):
+    """
+    Async generator left suspended for the life of an event loop, asyncio.run finalizes it (loop.shutdown_asyncgens)
+    before closing the loop, which closes the session's connections while the loop can still run aclose()
+
+    Args:
+        session (httpx.AsyncClient): session to close
+    """
+    try:
+        yield
+    finally:
+        await session.aclose()
+
+
+class AsyncClient(Client):
+
+    def __init__(self, client: Client, max_connections: int = 20, max_keepalive_connections: int = 10, timeout: int = None):
+        """
+        Initialize an asyncio client that shares the tokens (and stream) of an existing Client.
+
+        Args:
+            client (Client): synchronous client whose tokens manager keeps the access token fresh
+            max_connections (int): maximum number of concurrent connections in the pool
+            max_keepalive_connections (int): maximum number of idle connections kept alive in the pool
+            timeout (int | None): request timeout in seconds, defaults to the timeout of client
+
+        Notes:
+            Every api method of Client is available and returns a coroutine that resolves to an httpx.Response,
+            e.g. response = await async_client.quotes(["AMD", "INTC"])
+        """
+        if timeout is not None and timeout <= 0:
+            raise Exception("Timeout must be greater than 0 and is recommended to be 5 seconds or more.")
+
+        self.version = client.version                                       # version of the client
+        self.timeout = timeout or client.timeout                            # timeout to use in requests
+        self.logger = client.logger                                         # share the logger
+        self.tokens = client.tokens                                         # share the tokens manager (refreshed by client)
+        self.stream = client.stream                                         # share the streaming object
+        self._rate_limiter = client._rate_limiter                           # share the api quota with client
+        self.cache = client.cache                                           # share the response cache with client
+        self._single_flight = AsyncSingleFlight()                           # coalesces identical GETs in flight
+        self.retry_policy = client.retry_policy                             # share the retry policy (and latency history)
+        self.metrics = client.metrics                                       # share the metrics registry
+        self._limits = httpx.Limits(max_connections=max_connections,
+                                    max_keepalive_connections=max_keepalive_connections)
+        self._session = None                                                # httpx.AsyncClient, created per event loop
+        self._session_loop = None                                           # event loop that owns self._session
+        self._session_scope = None                                          # _session_scope generator that closes self._session
+
+        self.logger.info("AsyncClient Initialization Complete")
+
+    async def _get_session(self) -> httpx.AsyncClient:
+        """
+        Get the pooled async session for the running event loop (a pool cannot be shared across event loops)
+        The session is closed when the loop shuts down (every asyncio.run gets its own session) or by aclose()
+
+        Returns:
+            httpx.AsyncClient: session bound to the running event loop
+        """
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session_loop is not loop:
+            session = httpx.AsyncClient(base_url=BASE_API_URL, limits=self._limits, timeout=self.timeout)
+            scope = _session_scope(session)
+            self._session, self._session_loop, self._session_scope = session, loop, scope
+            await scope.__anext__()  # registers the generator with the loop, shutdown_asyncgens closes it
+        return self._session
+
+    async def _request(self, method: str, endpoint: str, path: str, headers: dict = None, params: dict = None, json: dict = None, priority: int = PRIORITY_READ) -> httpx.Response:
+        """
+        Send a request to the Schwab API.
+        Cacheable GET requests are answered from self.cache when possible, identical GET requests
+        already in flight are shared instead of being sent again, and failed GET requests are retried.
+
+        Args:
+            method (str): http method ("GET"|"POST"|"PUT"|"DELETE")
+            endpoint (str): name of the client method making the request (e.g. "quotes")
+            path (str): path appended to BASE_API_URL (e.g. "/marketdata/v1/quotes")
+            headers (dict | None): additional headers (Authorization is added automatically)
+            params (dict | None): query parameters
+            json (dict | None): json body
+            priority (int): rate limiter lane (PRIORITY_ORDER goes ahead of queued PRIORITY_READ requests)
+
+        Returns:
+            httpx.Response: response from the api
+        """
+        if method != "GET":
+            return await self._send(method, endpoint, path, headers, params, json, priority)
+
+        request_key = ResponseCache.key(path, params)
+        use_cache = self.cache is not None and self.cache.cacheable(method, endpoint)
+        if use_cache and (entry := self.cache.get(endpoint, request_key)) is not None:
+            return self._cached_response(entry)
+
+        async def fetch():
+            response = await self._send_with_retry(method, endpoint, path, headers, params, json, priority)
+            if use_cache:
+                self.cache.set(endpoint, request_key, response, params)
+            return response
+
+        return await self._single_flight.do(request_key, fetch)
+
+    async def _send_with_retry(self, method: str, endpoint: str, path: str, headers: dict, params: dict, json: dict, priority: int) -> httpx.Response:
+        """
+        Send an idempotent request, retrying transient failures with backoff (see _request for args)
+
+        Returns:
+            httpx.Response: last response from the api
+        """
+        for attempt in range(self.retry_policy.max_attempts):
+            last_attempt = attempt == self.retry_policy.max_attempts - 1
+            try:
+                response = await self._send_hedged(method, endpoint, path, headers, params, json, priority)
+            except httpx.TransportError as e:
+                if last_attempt:
+                    raise
+                delay = self.retry_policy.delay(attempt)
+                self.logger.warning(f"{endpoint} failed ({e!r}), retrying in {delay:.2f}s")
+            else:
+                if last_attempt or not self.retry_policy.should_retry(response):
+                    return response
+                delay = self.retry_policy.delay(attempt, response)
+                self.logger.warning(f"{endpoint} returned {response.status_code}, retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def _send_hedged(self, method: str, endpoint: str, path: str, headers: dict, params: dict, json: dict, priority: int) -> httpx.Response:
+        """
+        Send a request and, if it is slower than the hedge delay of the retry policy, a second identical one (see _request for args)
+
+        Returns:
+            httpx.Response: first successful response (the slower request is cancelled)
+        """
+        async def timed_send():
+            start = time.monotonic()
+            response = await self._send(method, endpoint, path, headers, params, json, priority)
+            self.retry_policy.record_latency(endpoint, time.monotonic() - start)
+            return response
+
+        hedge_after = self.retry_policy.hedge_delay(endpoint)
+        if hedge_after is None:
+            return await timed_send()
+
+        pending = {asyncio.ensure_future(timed_send())}
+        done, pending = await asyncio.wait(pending, timeout=hedge_after)
+        if not done:
+            self.logger.debug(f"{endpoint} slower than {hedge_after:.3f}s, sending hedged request")
+            pending.add(asyncio.ensure_future(timed_send()))
+        error = None
+        try:
+            while done or pending:
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+        raise error
+
+    async def _send(self, method: str, endpoint: str, path: str, headers: dict, params: dict, json: dict, priority: int) -> httpx.Response:
+        """
+        Send a request to the Schwab API using the current access token, waiting for the rate limiter first (see _request for args)
+
+        Returns:
+            httpx.Response: response from the api
+        """
+        await self._rate_limiter.acquire_async(path, priority)
+        self.logger.debug(f"{endpoint}: {method} {path}")
+        start = time.monotonic()
+        try:
+            response = await (await self._get_session()).request(method, path,
+                                                                 headers={**(headers or {}), 'Authorization': f'Bearer {self.tokens.access_token}'},
+                                                                 params=params,
+                                                                 json=json)
+        except Exception:
+            self.metrics.observe_request(endpoint, "error", time.monotonic() - start)
+            raise
+        self.metrics.observe_request(endpoint, response.status_code, time.monotonic() - start, len(response.content))
+        return response
+
+    def _cached_response(self, entry: CachedResponse) -> httpx.Response:
+        """
+        Rebuild a response from a cache entry
+
+        Args:
+            entry (CachedResponse): cache entry
+
+        Returns:
+            httpx.Response: response equivalent to the one cached
+        """
+        return httpx.Response(entry.status_code, headers=entry.headers, content=entry.content,
+                              request=httpx.Request("GET", entry.url))
+
+    async def aclose(self):
+        """
+        Close the pooled connections of the running event loop
+        """
+        if self._session is not None and self._session_loop is asyncio.get_running_loop():
+            await self._session_scope.aclose()
+        self._session = None
+        self._session_loop = None
+        self._session_scope = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
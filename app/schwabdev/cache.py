@@ -0,0 +1,233 @@
+"""
+This file contains a response cache for read only Schwab api endpoints
+Per endpoint time-to-live with pluggable backends (in-memory LRU or on-disk sqlite)
+"""
+import time
+import json
+import sqlite3
+import datetime
+import zoneinfo
+import threading
+import urllib.parse
+from collections import OrderedDict
+from dataclasses import dataclass
+
+TTL_FOREVER = None                  # never expires (e.g. account hashes)
+TTL_TRADING_DAY = "trading_day"     # expires at the next market close (or the next midnight if after the close)
+MARKET_TIMEZONE = zoneinfo.ZoneInfo("America/New_York")
+MARKET_CLOSE = datetime.time(16, 0, 0)
+
+
+def _price_history_ttl(params: dict):
+    """
+    Daily (or longer) candles only change once per trading day, intraday candles change every minute
+    """
+    return TTL_TRADING_DAY if params.get("frequencyType") in ("daily", "weekly", "monthly") else 30
+
+
+DEFAULT_CACHE_TTLS = {
+    "account_linked": TTL_FOREVER,
+    "quotes": 5,
+    "quote": 5,
+    "price_history": _price_history_ttl,
+    "option_expiration_chain": TTL_TRADING_DAY,
+    "market_hours": TTL_TRADING_DAY,
+    "market_hour": TTL_TRADING_DAY,
+    "instruments": TTL_TRADING_DAY,
+    "instrument_cusip": TTL_TRADING_DAY,
+}
+
+# headers that describe the transfer of the original body, not the (already decoded) cached content
+_TRANSFER_HEADERS = ("content-encoding", "content-length", "transfer-encoding", "connection")
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    status_code: int
+    headers: dict
+    content: bytes
+    url: str
+
+    @classmethod
+    def from_response(cls, response):
+        """
+        Build a cache entry from a requests.Response or httpx.Response
+
+        Args:
+            response (requests.Response | httpx.Response): response to cache
+
+        Returns:
+            CachedResponse: cache entry
+        """
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in _TRANSFER_HEADERS}
+        return cls(response.status_code, headers, response.content, str(response.url))
+
+
+def seconds_until_trading_day_end(now: datetime.datetime = None) -> float:
+    """
+    Seconds until the next market close, or until the next midnight (market time) if the market has already closed
+
+    Args:
+        now (datetime.datetime | None): current time (timezone aware), defaults to now
+
+    Returns:
+        float: seconds remaining
+    """
+    now = (now or datetime.datetime.now(datetime.timezone.utc)).astimezone(MARKET_TIMEZONE)
+    if now.time() < MARKET_CLOSE:
+        end = datetime.datetime.combine(now.date(), MARKET_CLOSE, tzinfo=MARKET_TIMEZONE)
+    else:
+        end = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time(0), tzinfo=MARKET_TIMEZONE)
+    return (end - now).total_seconds()
+
+
+class MemoryCache:
+
+    def __init__(self, max_entries: int = 1024):
+        """
+        In-memory backend with least recently used eviction
+
+        Args:
+            max_entries (int): maximum number of responses kept
+        """
+        if max_entries <= 0:
+            raise Exception("[Schwabdev] max_entries must be greater than 0.")
+        self._max_entries = max_entries
+        self._entries = OrderedDict()       # key -> (expires_at | None, CachedResponse)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> CachedResponse | None:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, entry = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CachedResponse, expires_at: float | None):
+        with self._lock:
+            self._entries[key] = (expires_at, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DiskCache:
+
+    def __init__(self, path: str = "schwab_cache.sqlite"):
+        """
+        On-disk backend (sqlite), survives restarts and can be shared between processes
+
+        Args:
+            path (str): path to the sqlite file
+        """
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, expires_at REAL, "
+                                 "status_code INTEGER, headers TEXT, content BLOB, url TEXT)")
+        self._connection.execute("DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+        self._connection.commit()
+
+    def get(self, key: str) -> CachedResponse | None:
+        with self._lock:
+            row = self._connection.execute("SELECT expires_at, status_code, headers, content, url FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[0] is not None and row[0] <= time.time()):
+            return None
+        return CachedResponse(row[1], json.loads(row[2]), row[3], row[4])
+
+    def set(self, key: str, entry: CachedResponse, expires_at: float | None):
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                                     (key, expires_at, entry.status_code, json.dumps(entry.headers), entry.content, entry.url))
+            self._connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+            self._connection.commit()
+
+
+class ResponseCache:
+
+    def __init__(self, backend: MemoryCache | DiskCache = None, ttls: dict = None):
+        """
+        Cache of successful GET responses for read only endpoints
+
+        Args:
+            backend (MemoryCache | DiskCache | None): storage backend, defaults to MemoryCache()
+            ttls (dict | None): endpoint name (client method name) -> ttl, overrides DEFAULT_CACHE_TTLS.
+                A ttl is seconds, TTL_FOREVER, TTL_TRADING_DAY or a function of the request params returning one of those.
+                Endpoints not listed are never cached.
+        """
+        self.backend = backend if backend is not None else MemoryCache()
+        self.ttls = {**DEFAULT_CACHE_TTLS, **(ttls or {})}
+        self._stats = {}                    # endpoint -> {"hits": int, "misses": int}
+        self._stats_lock = threading.Lock()
+
+    def cacheable(self, method: str, endpoint: str) -> bool:
+        return method == "GET" and endpoint in self.ttls
+
+    @staticmethod
+    def key(path: str, params: dict = None) -> str:
+        """
+        Cache key for a request (path and sorted params)
+        """
+        return f"{path}?{urllib.parse.urlencode(sorted((params or {}).items()), doseq=True)}"
+
+    def _count(self, endpoint: str, outcome: str):
+        with self._stats_lock:
+            counts = self._stats.setdefault(endpoint, {"hits": 0, "misses": 0})
+            counts[outcome] += 1
+
+    def get(self, endpoint: str, key: str) -> CachedResponse | None:
+        entry = self.backend.get(key)
+        self._count(endpoint, "misses" if entry is None else "hits")
+        return entry
+
+    def set(self, endpoint: str, key: str, response, params: dict = None):
+        """
+        Store a successful response using the ttl of endpoint
+
+        Args:
+            endpoint (str): client method name
+            key (str): cache key from ResponseCache.key()
+            response (requests.Response | httpx.Response): response to store (ignored unless status is 200)
+            params (dict | None): request params (for ttl functions)
+        """
+        if response.status_code != 200:
+            return
+        ttl = self.ttls[endpoint]
+        if callable(ttl):
+            ttl = ttl(params or {})
+        if ttl == TTL_TRADING_DAY:
+            ttl = seconds_until_trading_day_end()
+        expires_at = None if ttl is TTL_FOREVER else time.time() + ttl
+        self.backend.set(key, CachedResponse.from_response(response), expires_at)
+
+    def stats(self) -> dict:
+        """
+        Hit and miss counters (hits are api calls saved)
+
+        Returns:
+            dict: {"hits": int, "misses": int, "endpoints": {endpoint: {"hits": int, "misses": int}}}
+        """
+        with self._stats_lock:
+            endpoints = {endpoint: dict(counts) for endpoint, counts in self._stats.items()}
+        return {"hits": sum(c["hits"] for c in endpoints.values()),
+                "misses": sum(c["misses"] for c in endpoints.values()),
+                "endpoints": endpoints}
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats = {}
+
+    def clear(self):
+        self.backend.clear()
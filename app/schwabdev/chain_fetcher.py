@@ -0,0 +1,121 @@
+"""
+This file contains an option chain fetcher that splits requests too large for a single option_chains call
+Pieces are fetched concurrently and merged back into the shape returned by option_chains
+"""
+import asyncio
+import datetime
+from .async_client import AsyncClient
+
+EXP_DATE_MAPS = ("callExpDateMap", "putExpDateMap")
+
+
+class ChainFetcher:
+
+    def __init__(self, client: AsyncClient, max_days_per_request: int = 30):
+        """
+        Initialize an option chain fetcher
+
+        Args:
+            client (AsyncClient): client used for the option_chains requests
+            max_days_per_request (int): widest expiration window requested at once (wider windows are split up front)
+        """
+        if max_days_per_request <= 0:
+            raise Exception("[Schwabdev] max_days_per_request must be greater than 0.")
+        self._client = client
+        self.max_days_per_request = max_days_per_request
+
+    @staticmethod
+    def _to_date(d: datetime.date | datetime.datetime | str | None) -> datetime.date | None:
+        if d is None or type(d) is datetime.date:
+            return d
+        elif isinstance(d, datetime.datetime):
+            return d.date()
+        else:
+            return datetime.date.fromisoformat(d[:10])
+
+    @staticmethod
+    def _is_overflow(response) -> bool:
+        """
+        Check if the server refused the chain because it was too large ("Body buffer overflow")
+        """
+        return response.status_code >= 400 and "buffer" in response.text.lower()
+
+    @staticmethod
+    def merge(chains: list[dict]) -> dict:
+        """
+        Merge option chains of the same symbol (e.g. different expirations, contract types or strike bands)
+
+        Args:
+            chains (list[dict]): option_chains json responses
+
+        Returns:
+            dict: single chain with the union of the callExpDateMap and putExpDateMap entries
+        """
+        merged = {**chains[0], "callExpDateMap": {}, "putExpDateMap": {}} if chains else {"callExpDateMap": {}, "putExpDateMap": {}}
+        for chain in chains:
+            for map_name in EXP_DATE_MAPS:
+                merged_map = merged[map_name]
+                for exp_date, strikes in chain.get(map_name, {}).items():
+                    merged_strikes = merged_map.setdefault(exp_date, {})
+                    for strike, contracts in strikes.items():
+                        merged_contracts = merged_strikes.setdefault(strike, [])
+                        seen = {c.get("symbol") for c in merged_contracts}
+                        merged_contracts.extend(c for c in contracts if c.get("symbol") not in seen)
+        merged["numberOfContracts"] = sum(len(contracts) for map_name in EXP_DATE_MAPS
+                                          for strikes in merged[map_name].values() for contracts in strikes.values())
+        return merged
+
+    async def fetch(self, symbol: str, fromDate: datetime.date | datetime.datetime | str = None, toDate: datetime.date | datetime.datetime | str = None,
+                    contractType: str = "ALL", **params) -> dict:
+        """
+        Get an option chain of any width, splitting it into option_chains requests the server will accept
+
+        Args:
+            symbol (str): ticker symbol
+            fromDate (datetime.date | datetime.datetime | str | None): first expiration date
+            toDate (datetime.date | datetime.datetime | str | None): last expiration date
+            contractType (str): contract type ("CALL"|"PUT"|"ALL")
+            **params: any other option_chains parameter (strikeCount, strike, range, ...)
+
+        Notes:
+            Expiration windows wider than max_days_per_request are split up front. A piece the server still
+            refuses is bisected by expiration range, then split into calls and puts, then into ITM and OTM strike bands.
+            The strike band split does not apply when strike is given (an ITM/OTM band around a fixed strike would not
+            return the same contracts), such a piece raises once it is down to one expiration and contract type.
+
+        Returns:
+            dict: option chain in the same shape as option_chains().json()
+        """
+        start, end = self._to_date(fromDate), self._to_date(toDate)
+        windows = [(start, end)]
+        if start is not None and end is not None:
+            windows = []
+            while start <= end:
+                window_end = min(start + datetime.timedelta(days=self.max_days_per_request - 1), end)
+                windows.append((start, window_end))
+                start = window_end + datetime.timedelta(days=1)
+        chains = await asyncio.gather(*[self._fetch_piece(symbol, s, e, contractType, params) for s, e in windows])
+        return self.merge(chains)
+
+    async def _fetch_piece(self, symbol: str, start: datetime.date | None, end: datetime.date | None, contractType: str, params: dict) -> dict:
+        response = await self._client.option_chains(symbol=symbol, contractType=contractType,
+                                                     fromDate=None if start is None else start.isoformat(),
+                                                     toDate=None if end is None else end.isoformat(), **params)
+        if response.status_code < 400:
+            return response.json()
+        if not self._is_overflow(response):
+            raise Exception(f"[Schwabdev] option_chains failed for {symbol} ({response.status_code}): {response.text}")
+
+        # split the piece and try again
+        if start is not None and end is not None and start < end:
+            middle = start + (end - start) // 2
+            pieces = [(start, middle, contractType, params), (middle + datetime.timedelta(days=1), end, contractType, params)]
+        elif contractType in (None, "ALL"):
+            pieces = [(start, end, "CALL", params), (start, end, "PUT", params)]
+        elif params.get("range") in (None, "ALL") and params.get("strike") is None:
+            pieces = [(start, end, contractType, {**params, "range": "ITM"}), (start, end, contractType, {**params, "range": "OTM"})]
+        else:
+            band = "strike band" if params.get("strike") is None else f"strike {params['strike']} (no band split with a strike)"
+            raise Exception(f"[Schwabdev] option_chains for {symbol} is too large even for a single expiration, contract type and {band}.")
+        self._client.logger.debug(f"Splitting option chain for {symbol} into {len(pieces)} pieces")
+        return self.merge(await asyncio.gather(*[self._fetch_piece(symbol, *piece) for piece in pieces]))
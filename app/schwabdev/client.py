@@ -9,13 +9,19 @@ import datetime
 import requests
 import threading
 import urllib.parse
+import concurrent.futures
 from .stream import Stream
 from .tokens import Tokens
+from .rate_limiter import RateLimiter, PRIORITY_ORDER, PRIORITY_READ
+from .cache import ResponseCache, CachedResponse
+from .single_flight import SingleFlight
+from .retry import RetryPolicy
+from .metrics import MetricsRegistry
 
 BASE_API_URL = "https://api.schwabapi.com"
 class Client:
 
-    def __init__(self, app_key, app_secret, callback_url="https://127.0.0.1", tokens_file="tokens.json", timeout=10, capture_callback=False, use_session=True, call_on_notify=None):
+    def __init__(self, app_key, app_secret, callback_url="https://127.0.0.1", tokens_file="tokens.json", timeout=10, capture_callback=False, use_session=True, call_on_notify=None, rate_limits=None, cache=None, pool_connections=10, pool_maxsize=20, retry_policy=None):
         """
         Initialize a client to access the Schwab API.
 
@@ -26,8 +32,13 @@ class Client:
             tokens_file (str): Path to tokens file.
             timeout (int): Request timeout in seconds - how long to wait for a response.
             capture_callback (bool): Use a webserver with self-signed cert to capture callback with code (no copy/pasting urls during auth).
-            use_session (bool): Use a requests session for requests instead of creating a new session for each request.
+            use_session (bool): Use a requests session for requests instead of creating a new session for each request (keeps connections alive).
             call_on_notify (function | None): Function to call when user needs to be notified (e.g. for input)
+            rate_limits (dict | None): requests per minute for the "marketdata" and "trader" budgets (None for Schwab's defaults, {} to disable)
+            cache (ResponseCache | None): cache for read only endpoints (e.g. ResponseCache() or ResponseCache(DiskCache())), None to disable
+            pool_connections (int): Number of host connection pools to cache in the session.
+            pool_maxsize (int): Maximum number of connections kept alive per host (set to the number of concurrent requests).
+            retry_policy (RetryPolicy | None): retries (and optional hedging) of GET requests, None for RetryPolicy() defaults
         """
 
         # other checks are done in the tokens class
@@ -38,15 +49,24 @@ class Client:
         self.timeout = timeout                                              # timeout to use in requests
         self.logger = logging.getLogger("Schwabdev")  # init the logger
         self._session = requests.Session() if use_session else requests  # session to use in requests
+        if use_session:
+            self._session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize))
+        self._rate_limiter = RateLimiter(rate_limits)                       # client side limiter for the api quota
+        self.metrics = MetricsRegistry()                                    # per endpoint latency, size and status metrics
+        self.cache = cache                                                  # response cache for read only endpoints
+        self._single_flight = SingleFlight()                                # coalesces identical GETs in flight
+        self.retry_policy = retry_policy or RetryPolicy()                   # retries of idempotent (GET) requests
+        self._hedge_executor = None                                         # threads for hedged requests (created when needed)
         self.tokens = Tokens(self, app_key, app_secret, callback_url, tokens_file, capture_callback, call_on_notify)
         self.stream = Stream(self)                                          # init the streaming object
 
-        # Spawns a thread to check the tokens and updates if necessary, also updates the session
+        # Spawns a thread to check the tokens and updates if necessary
+        # the session is kept across refreshes (the token is sent per request) so pooled connections stay alive
+        # sleeps until the next expiry instead of polling, refreshes by other processes are picked up from the tokens file
         def checker():
             while True:
-                if self.tokens.update_tokens() and use_session:
-                    self._session = requests.Session() #make a new session if the access token was updated
-                time.sleep(30)
+                self.tokens.update_tokens()
+                time.sleep(self.tokens.seconds_until_update())
 
         threading.Thread(target=checker, daemon=True).start()
 
@@ -117,7 +137,136 @@ class Client:
             return ",".join(l)
         else:
             return l
-        
+
+    def _request(self, method: str, endpoint: str, path: str, headers: dict = None, params: dict = None, json: dict = None, priority: int = PRIORITY_READ) -> requests.Response:
+        """
+        Send a request to the Schwab API.
+        Cacheable GET requests are answered from self.cache when possible, identical GET requests
+        already in flight are shared instead of being sent again, and failed GET requests are retried.
+
+        Args:
+            method (str): http method ("GET"|"POST"|"PUT"|"DELETE")
+            endpoint (str): name of the client method making the request (e.g. "quotes")
+            path (str): path appended to BASE_API_URL (e.g. "/marketdata/v1/quotes")
+            headers (dict | None): additional headers (Authorization is added automatically)
+            params (dict | None): query parameters
+            json (dict | None): json body
+            priority (int): rate limiter lane (PRIORITY_ORDER goes ahead of queued PRIORITY_READ requests)
+
+        Returns:
+            requests.Response: response from the api
+        """
+        if method != "GET":
+            return self._send(method, endpoint, path, headers, params, json, priority)
+
+        request_key = ResponseCache.key(path, params)
+        use_cache = self.cache is not None and self.cache.cacheable(method, endpoint)
+        if use_cache and (entry := self.cache.get(endpoint, request_key)) is not None:
+            return self._cached_response(entry)
+
+        def fetch():
+            response = self._send_with_retry(method, endpoint, path, headers, params, json, priority)
+            if use_cache:
+                self.cache.set(endpoint, request_key, response, params)
+            return response
+
+        return self._single_flight.do(request_key, fetch)
+
+    def _send_with_retry(self, method: str, endpoint: str, path: str, headers: dict, params: dict, json: dict, priority: int) -> requests.Response:
+        """
+        Send an idempotent request, retrying transient failures with backoff (see _request for args)
+
+        Returns:
+            requests.Response: last response from the api
+        """
+        for attempt in range(self.retry_policy.max_attempts):
+            last_attempt = attempt == self.retry_policy.max_attempts - 1
+            try:
+                response = self._send_hedged(method, endpoint, path, headers, params, json, priority)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if last_attempt:
+                    raise
+                delay = self.retry_policy.delay(attempt)
+                self.logger.warning(f"{endpoint} failed ({e}), retrying in {delay:.2f}s")
+            else:
+                if last_attempt or not self.retry_policy.should_retry(response):
+                    return response
+                delay = self.retry_policy.delay(attempt, response)
+                self.logger.warning(f"{endpoint} returned {response.status_code}, retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+    def _send_hedged(self, method: str, endpoint: str, path: str, headers: dict, params: dict, json: dict, priority: int) -> requests.Response:
+        """
+        Send a request and, if it is slower than the hedge delay of the retry policy, a second identical one (see _request for args)
+
+        Returns:
+            requests.Response: first successful response
+        """
+        def timed_send():
+            start = time.monotonic()
+            response = self._send(method, endpoint, path, headers, params, json, priority)
+            self.retry_policy.record_latency(endpoint, time.monotonic() - start)
+            return response
+
+        hedge_after = self.retry_policy.hedge_delay(endpoint)
+        if hedge_after is None:
+            return timed_send()
+
+        if self._hedge_executor is None:
+            self._hedge_executor = concurrent.futures.ThreadPoolExecutor(thread_name_prefix="SchwabdevHedge")
+        futures = [self._hedge_executor.submit(timed_send)]
+        done, _ = concurrent.futures.wait(futures, timeout=hedge_after)
+        if not done:
+            self.logger.debug(f"{endpoint} slower than {hedge_after:.3f}s, sending hedged request")
+            futures.append(self._hedge_executor.submit(timed_send))
+        error = None
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                return future.result()
+            except Exception as e:
+                error = e
+        raise error
+
+    def _send(self, method: str, endpoint: str, path: str, headers: dict, params: dict, json: dict, priority: int) -> requests.Response:
+        """
+        Send a request to the Schwab API using the current access token, waiting for the rate limiter first (see _request for args)
+
+        Returns:
+            requests.Response: response from the api
+        """
+        self._rate_limiter.acquire(path, priority)
+        self.logger.debug(f"{endpoint}: {method} {path}")
+        start = time.monotonic()
+        try:
+            response = self._session.request(method, f'{BASE_API_URL}{path}',
+                                             headers={**(headers or {}), 'Authorization': f'Bearer {self.tokens.access_token}'},
+                                             params=params,
+                                             json=json,
+                                             timeout=self.timeout)
+        except Exception:
+            self.metrics.observe_request(endpoint, "error", time.monotonic() - start)
+            raise
+        self.metrics.observe_request(endpoint, response.status_code, time.monotonic() - start, len(response.content))
+        return response
+
+    def _cached_response(self, entry: CachedResponse) -> requests.Response:
+        """
+        Rebuild a response from a cache entry
+
+        Args:
+            entry (CachedResponse): cache entry
+
+        Returns:
+            requests.Response: response equivalent to the one cached
+        """
+        response = requests.Response()
+        response.status_code = entry.status_code
+        response.headers = requests.structures.CaseInsensitiveDict(entry.headers)
+        response._content = entry.content
+        response.url = entry.url
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        return response
+
     _base_api_url = "https://api.schwabapi.com"
 
     """
@@ -132,9 +281,7 @@ class Client:
         Return:
             request.Response: All linked account numbers and hashes
         """
-        return self._session.get(f'{BASE_API_URL}/trader/v1/accounts/accountNumbers',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            timeout=self.timeout)
+        return self._request("GET", "account_linked", '/trader/v1/accounts/accountNumbers')
 
     def account_details_all(self, fields: str = None) -> requests.Response:
         """
@@ -146,10 +293,8 @@ class Client:
         Returns:
             request.Response: details for all linked accounts
         """
-        return self._session.get(f'{BASE_API_URL}/trader/v1/accounts/',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params=self._params_parser({'fields': fields}),
-                            timeout=self.timeout)
+        return self._request("GET", "account_details_all", '/trader/v1/accounts/',
+                             params=self._params_parser({'fields': fields}))
 
     def account_details(self, accountHash: str, fields: str = None) -> requests.Response:
         """
@@ -162,10 +307,8 @@ class Client:
         Returns:
             request.Response: details for one linked account
         """
-        return self._session.get(f'{BASE_API_URL}/trader/v1/accounts/{accountHash}',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params=self._params_parser({'fields': fields}),
-                            timeout=self.timeout)
+        return self._request("GET", "account_details", f'/trader/v1/accounts/{accountHash}',
+                             params=self._params_parser({'fields': fields}))
 
     def account_orders(self, accountHash: str, fromEnteredTime: datetime.datetime | str, toEnteredTime: datetime.datetime | str, maxResults: int = None, status: str = None) -> requests.Response:
         """
@@ -181,14 +324,13 @@ class Client:
         Returns:
             request.Response: orders for one linked account
         """
-        return self._session.get(f'{BASE_API_URL}/trader/v1/accounts/{accountHash}/orders',
-                            headers={"Accept": "application/json", 'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params=self._params_parser(
-                                {'maxResults': maxResults,
-                                 'fromEnteredTime': self._time_convert(fromEnteredTime, "8601"),
-                                 'toEnteredTime': self._time_convert(toEnteredTime, "8601"),
-                                 'status': status}),
-                            timeout=self.timeout)
+        return self._request("GET", "account_orders", f'/trader/v1/accounts/{accountHash}/orders',
+                             headers={"Accept": "application/json"},
+                             params=self._params_parser(
+                                 {'maxResults': maxResults,
+                                  'fromEnteredTime': self._time_convert(fromEnteredTime, "8601"),
+                                  'toEnteredTime': self._time_convert(toEnteredTime, "8601"),
+                                  'status': status}))
 
     def order_place(self, accountHash: str, order: dict) -> requests.Response:
         """
@@ -201,12 +343,10 @@ class Client:
         Returns:
             request.Response: order number in response header (if immediately filled then order number not returned)
         """
-        return self._session.post(f'{BASE_API_URL}/trader/v1/accounts/{accountHash}/orders',
-                             headers={"Accept": "application/json",
-                                      'Authorization': f'Bearer {self.tokens.access_token}',
-                                      "Content-Type": "application/json"},
+        return self._request("POST", "order_place", f'/trader/v1/accounts/{accountHash}/orders',
+                             headers={"Accept": "application/json", "Content-Type": "application/json"},
                              json=order,
-                             timeout=self.timeout)
+                             priority=PRIORITY_ORDER)
 
     def order_details(self, accountHash: str, orderId: int | str) -> requests.Response:
         """
@@ -219,9 +359,7 @@ class Client:
         Returns:
             request.Response: order details
         """
-        return self._session.get(f'{BASE_API_URL}/trader/v1/accounts/{accountHash}/orders/{orderId}',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            timeout=self.timeout)
+        return self._request("GET", "order_details", f'/trader/v1/accounts/{accountHash}/orders/{orderId}')
 
     def order_cancel(self, accountHash: str, orderId: int | str) -> requests.Response:
         """
@@ -234,9 +372,8 @@ class Client:
         Returns:
             request.Response: response code
         """
-        return self._session.delete(f'{BASE_API_URL}/trader/v1/accounts/{accountHash}/orders/{orderId}',
-                               headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                               timeout=self.timeout)
+        return self._request("DELETE", "order_cancel", f'/trader/v1/accounts/{accountHash}/orders/{orderId}',
+                             priority=PRIORITY_ORDER)
 
     def order_replace(self, accountHash: str, orderId: int | str, order: dict) -> requests.Response:
         """
@@ -250,12 +387,10 @@ class Client:
         Returns:
             request.Response: response code
         """
-        return self._session.put(f'{BASE_API_URL}/trader/v1/accounts/{accountHash}/orders/{orderId}',
-                            headers={"Accept": "application/json",
-                                     'Authorization': f'Bearer {self.tokens.access_token}',
-                                     "Content-Type": "application/json"},
-                            json=order,
-                            timeout=self.timeout)
+        return self._request("PUT", "order_replace", f'/trader/v1/accounts/{accountHash}/orders/{orderId}',
+                             headers={"Accept": "application/json", "Content-Type": "application/json"},
+                             json=order,
+                             priority=PRIORITY_ORDER)
 
     def account_orders_all(self, fromEnteredTime: datetime.datetime | str, toEnteredTime: datetime.datetime | str, maxResults: int = None, status: str = None) -> requests.Response:
         """
@@ -270,14 +405,13 @@ class Client:
         Returns:
             request.Response: all orders
         """
-        return self._session.get(f'{BASE_API_URL}/trader/v1/orders',
-                            headers={"Accept": "application/json", 'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params=self._params_parser(
-                                {'maxResults': maxResults,
-                                 'fromEnteredTime': self._time_convert(fromEnteredTime, "8601"),
-                                 'toEnteredTime': self._time_convert(toEnteredTime, "8601"),
-                                 'status': status}),
-                            timeout=self.timeout)
+        return self._request("GET", "account_orders_all", '/trader/v1/orders',
+                             headers={"Accept": "application/json"},
+                             params=self._params_parser(
+                                 {'maxResults': maxResults,
+                                  'fromEnteredTime': self._time_convert(fromEnteredTime, "8601"),
+                                  'toEnteredTime': self._time_convert(toEnteredTime, "8601"),
+                                  'status': status}))
 
     """
     def order_preview(self, accountHash, orderObject) -> requests.Response:
@@ -301,14 +435,12 @@ class Client:
         Returns:
             request.Response: list of transactions for a specific account
         """
-        return self._session.get(f'{BASE_API_URL}/trader/v1/accounts/{accountHash}/transactions',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params=self._params_parser(
-                                {'startDate': self._time_convert(startDate, "8601"),
-                                 'endDate': self._time_convert(endDate, "8601"),
-                                 'symbol': symbol,
-                                 'types': types}),
-                            timeout=self.timeout)
+        return self._request("GET", "transactions", f'/trader/v1/accounts/{accountHash}/transactions',
+                             params=self._params_parser(
+                                 {'startDate': self._time_convert(startDate, "8601"),
+                                  'endDate': self._time_convert(endDate, "8601"),
+                                  'symbol': symbol,
+                                  'types': types}))
 
     def transaction_details(self, accountHash: str, transactionId: str | int) -> requests.Response:
         """
@@ -321,9 +453,7 @@ class Client:
         Returns:
             request.Response: transaction details of transaction id using accountHash
         """
-        return self._session.get(f'{BASE_API_URL}/trader/v1/accounts/{accountHash}/transactions/{transactionId}',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            timeout=self.timeout)
+        return self._request("GET", "transaction_details", f'/trader/v1/accounts/{accountHash}/transactions/{transactionId}')
 
     def preferences(self) -> requests.Response:
         """
@@ -332,9 +462,7 @@ class Client:
         Returns:
             request.Response: User preferences and streaming info
         """
-        return self._session.get(f'{BASE_API_URL}/trader/v1/userPreference',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            timeout=self.timeout)
+        return self._request("GET", "preferences", '/trader/v1/userPreference')
 
     """
     Market Data
@@ -352,13 +480,11 @@ class Client:
         Returns:
             request.Response: list of quotes
         """
-        return self._session.get(f'{BASE_API_URL}/marketdata/v1/quotes',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params=self._params_parser(
-                                {'symbols': self._format_list(symbols),
-                                 'fields': fields,
-                                 'indicative': indicative}),
-                            timeout=self.timeout)
+        return self._request("GET", "quotes", '/marketdata/v1/quotes',
+                             params=self._params_parser(
+                                 {'symbols': self._format_list(symbols),
+                                  'fields': fields,
+                                  'indicative': indicative}))
 
     def quote(self, symbol_id: str, fields: str = None) -> requests.Response:
         """
@@ -371,10 +497,8 @@ class Client:
         Returns:
             request.Response: quote for a single symbol
         """
-        return self._session.get(f'{BASE_API_URL}/marketdata/v1/{urllib.parse.quote(symbol_id,safe="")}/quotes',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params=self._params_parser({'fields': fields}),
-                            timeout=self.timeout)
+        return self._request("GET", "quote", f'/marketdata/v1/{urllib.parse.quote(symbol_id,safe="")}/quotes',
+                             params=self._params_parser({'fields': fields}))
 
     def option_chains(self, symbol: str, contractType: str = None, strikeCount: any = None, includeUnderlyingQuote: bool = None, strategy: str = None,
                interval: any = None, strike: any = None, range: str = None, fromDate: datetime.datetime | str = None, toDate: datetime.datetime | str = None, volatility: any = None, underlyingPrice: any = None,
@@ -403,34 +527,33 @@ class Client:
 
         Notes:
             1. Some calls can exceed the amount of data that can be returned which results in a "Body buffer overflow"
-               error from the server, to fix this you must add additional parameters to limit the amount of data returned.
+               error from the server, to fix this you must add additional parameters to limit the amount of data returned
+               (or use ChainFetcher which splits and merges these requests automatically).
             2. Some symbols are differnt for Schwab, to find ticker symbols use Schwab research tools search here:
                https://client.schwab.com/app/research/#/tools/stocks
 
         Returns:
             request.Response: option chain
         """
-        return self._session.get(f'{BASE_API_URL}/marketdata/v1/chains',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params=self._params_parser(
-                                {'symbol': symbol,
-                                 'contractType': contractType,
-                                 'strikeCount': strikeCount,
-                                 'includeUnderlyingQuote': includeUnderlyingQuote,
-                                 'strategy': strategy,
-                                 'interval': interval,
-                                 'strike': strike,
-                                 'range': range,
-                                 'fromDate': self._time_convert(fromDate, "YYYY-MM-DD"),
-                                 'toDate': self._time_convert(toDate, "YYYY-MM-DD"),
-                                 'volatility': volatility,
-                                 'underlyingPrice': underlyingPrice,
-                                 'interestRate': interestRate,
-                                 'daysToExpiration': daysToExpiration,
-                                 'expMonth': expMonth,
-                                 'optionType': optionType,
-                                 'entitlement': entitlement}),
-                            timeout=self.timeout)
+        return self._request("GET", "option_chains", '/marketdata/v1/chains',
+                             params=self._params_parser(
+                                 {'symbol': symbol,
+                                  'contractType': contractType,
+                                  'strikeCount': strikeCount,
+                                  'includeUnderlyingQuote': includeUnderlyingQuote,
+                                  'strategy': strategy,
+                                  'interval': interval,
+                                  'strike': strike,
+                                  'range': range,
+                                  'fromDate': self._time_convert(fromDate, "YYYY-MM-DD"),
+                                  'toDate': self._time_convert(toDate, "YYYY-MM-DD"),
+                                  'volatility': volatility,
+                                  'underlyingPrice': underlyingPrice,
+                                  'interestRate': interestRate,
+                                  'daysToExpiration': daysToExpiration,
+                                  'expMonth': expMonth,
+                                  'optionType': optionType,
+                                  'entitlement': entitlement}))
 
     def option_expiration_chain(self, symbol: str) -> requests.Response:
         """
@@ -442,10 +565,8 @@ class Client:
         Returns:
             request.Response: Option expiration chain
         """
-        return self._session.get(f'{BASE_API_URL}/marketdata/v1/expirationchain',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params=self._params_parser({'symbol': symbol}),
-                            timeout=self.timeout)
+        return self._request("GET", "option_expiration_chain", '/marketdata/v1/expirationchain',
+                             params=self._params_parser({'symbol': symbol}))
 
     def price_history(self, symbol: str, periodType: str = None, period: any = None, frequencyType: str = None, frequency: any = None, startDate: datetime.datetime | str = None,
                       endDate: any = None, needExtendedHoursData: bool = None, needPreviousClose: bool = None) -> requests.Response:
@@ -466,18 +587,16 @@ class Client:
         Returns:
             request.Response: Dictionary containing candle history
         """
-        return self._session.get(f'{BASE_API_URL}/marketdata/v1/pricehistory',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params=self._params_parser({'symbol': symbol,
-                                                        'periodType': periodType,
-                                                        'period': period,
-                                                        'frequencyType': frequencyType,
-                                                        'frequency': frequency,
-                                                        'startDate': self._time_convert(startDate, 'epoch_ms'),
-                                                        'endDate': self._time_convert(endDate, 'epoch_ms'),
-                                                        'needExtendedHoursData': needExtendedHoursData,
-                                                        'needPreviousClose': needPreviousClose}),
-                            timeout=self.timeout)
+        return self._request("GET", "price_history", '/marketdata/v1/pricehistory',
+                             params=self._params_parser({'symbol': symbol,
+                                                         'periodType': periodType,
+                                                         'period': period,
+                                                         'frequencyType': frequencyType,
+                                                         'frequency': frequency,
+                                                         'startDate': self._time_convert(startDate, 'epoch_ms'),
+                                                         'endDate': self._time_convert(endDate, 'epoch_ms'),
+                                                         'needExtendedHoursData': needExtendedHoursData,
+                                                         'needPreviousClose': needPreviousClose}))
 
     def movers(self, symbol: str, sort: str = None, frequency: any = None) -> requests.Response:
         """
@@ -494,12 +613,10 @@ class Client:
         Returns:
             request.Response: Movers
         """
-        return self._session.get(f'{BASE_API_URL}/marketdata/v1/movers/{symbol}',
-                            headers={"accept": "application/json",
-                                     'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params=self._params_parser({'sort': sort,
-                                                        'frequency': frequency}),
-                            timeout=self.timeout)
+        return self._request("GET", "movers", f'/marketdata/v1/movers/{symbol}',
+                             headers={"accept": "application/json"},
+                             params=self._params_parser({'sort': sort,
+                                                         'frequency': frequency}))
 
     def market_hours(self, symbols: list[str], date: datetime.datetime | str = None) -> requests.Response:
         """
@@ -512,12 +629,10 @@ class Client:
         Returns:
             request.Response: Market hours
         """
-        return self._session.get(f'{BASE_API_URL}/marketdata/v1/markets',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params=self._params_parser(
-                                {'markets': symbols, #self._format_list(symbols),
-                                 'date': self._time_convert(date, 'YYYY-MM-DD')}),
-                            timeout=self.timeout)
+        return self._request("GET", "market_hours", '/marketdata/v1/markets',
+                             params=self._params_parser(
+                                 {'markets': symbols, #self._format_list(symbols),
+                                  'date': self._time_convert(date, 'YYYY-MM-DD')}))
 
     def market_hour(self, market_id: str, date: datetime.datetime | str = None) -> requests.Response:
         """
@@ -530,10 +645,8 @@ class Client:
         Returns:
             request.Response: Market hours
         """
-        return self._session.get(f'{BASE_API_URL}/marketdata/v1/markets/{market_id}',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params=self._params_parser({'date': self._time_convert(date, 'YYYY-MM-DD')}),
-                            timeout=self.timeout)
+        return self._request("GET", "market_hour", f'/marketdata/v1/markets/{market_id}',
+                             params=self._params_parser({'date': self._time_convert(date, 'YYYY-MM-DD')}))
 
     def instruments(self, symbol: str, projection: str) -> requests.Response:
         """
@@ -546,11 +659,9 @@ class Client:
         Returns:
             request.Response: Instruments
         """
-        return self._session.get(f'{BASE_API_URL}/marketdata/v1/instruments',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            params={'symbol': symbol,
-                                    'projection': projection},
-                            timeout=self.timeout)
+        return self._request("GET", "instruments", '/marketdata/v1/instruments',
+                             params={'symbol': symbol,
+                                     'projection': projection})
 
     def instrument_cusip(self, cusip_id: str | int) -> requests.Response:
         """
@@ -562,6 +673,4 @@ class Client:
         Returns:
             request.Response: Instrument
         """
-        return self._session.get(f'{BASE_API_URL}/marketdata/v1/instruments/{cusip_id}',
-                            headers={'Authorization': f'Bearer {self.tokens.access_token}'},
-                            timeout=self.timeout)
+        return self._request("GET", "instrument_cusip", f'/marketdata/v1/instruments/{cusip_id}')
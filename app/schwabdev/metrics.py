@@ -0,0 +1,134 @@
+"""
+This file contains a lightweight in-process metrics registry for the Schwab api clients
+Latency histograms, response sizes, status codes and token events per endpoint, exportable as Prometheus text or json
+"""
+import bisect
+import threading
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # seconds (upper bounds, +Inf is implied)
+
+
+class _EndpointMetrics:
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)  # last bucket is +Inf
+        self.count = 0                                         # requests sent
+        self.latency_sum = 0.0                                 # seconds
+        self.latency_max = 0.0                                 # seconds
+        self.response_bytes = 0                                # bytes received
+        self.statuses = {}                                     # status code (or "error") -> count
+
+    def quantile(self, q: float) -> float | None:
+        """
+        Estimate a latency quantile from the histogram (upper bound of the bucket that contains it)
+        """
+        if self.count == 0:
+            return None
+        rank, cumulative = q * self.count, 0
+        for i, bucket_count in enumerate(self.bucket_counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else self.latency_max
+        return self.latency_max
+
+
+class MetricsRegistry:
+
+    def __init__(self, prefix: str = "schwabdev"):
+        """
+        Initialize an empty registry
+
+        Args:
+            prefix (str): prefix of the exported Prometheus metric names
+        """
+        self.prefix = prefix
+        self._endpoints = {}    # endpoint -> _EndpointMetrics
+        self._events = {}       # event name -> count
+        self._lock = threading.Lock()
+
+    def observe_request(self, endpoint: str, status: int | str, seconds: float, response_bytes: int = 0):
+        """
+        Record one request sent to the api
+
+        Args:
+            endpoint (str): client method name
+            status (int | str): response status code ("error" if the request raised)
+            seconds (float): latency in seconds
+            response_bytes (int): size of the response body
+        """
+        with self._lock:
+            metrics = self._endpoints.get(endpoint)
+            if metrics is None:
+                metrics = self._endpoints[endpoint] = _EndpointMetrics()
+            metrics.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            metrics.count += 1
+            metrics.latency_sum += seconds
+            metrics.latency_max = max(metrics.latency_max, seconds)
+            metrics.response_bytes += response_bytes
+            metrics.statuses[str(status)] = metrics.statuses.get(str(status), 0) + 1
+
+    def record_event(self, event: str):
+        """
+        Count an event (e.g. "access_token_refresh")
+
+        Args:
+            event (str): event name
+        """
+        with self._lock:
+            self._events[event] = self._events.get(event, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+            self._events = {}
+
+    def summary(self) -> dict:
+        """
+        Summary of everything recorded (e.g. per run), json serializable
+
+        Returns:
+            dict: {"endpoints": {endpoint: {...}}, "events": {event: count}}, endpoints sorted by total latency
+        """
+        with self._lock:
+            endpoints = {endpoint: {"requests": m.count,
+                                    "latency_total": round(m.latency_sum, 4),
+                                    "latency_mean": round(m.latency_sum / m.count, 4) if m.count else None,
+                                    "latency_p50": m.quantile(0.5),
+                                    "latency_p95": m.quantile(0.95),
+                                    "latency_max": round(m.latency_max, 4),
+                                    "response_bytes": m.response_bytes,
+                                    "statuses": dict(m.statuses)}
+                         for endpoint, m in self._endpoints.items()}
+            events = dict(self._events)
+        endpoints = dict(sorted(endpoints.items(), key=lambda item: item[1]["latency_total"], reverse=True))
+        return {"endpoints": endpoints, "events": events}
+
+    def to_prometheus(self) -> str:
+        """
+        Export in the Prometheus text exposition format
+
+        Returns:
+            str: metrics text
+        """
+        p = self.prefix
+        lines = [f"# HELP {p}_request_duration_seconds Latency of Schwab api requests.",
+                 f"# TYPE {p}_request_duration_seconds histogram"]
+        with self._lock:
+            for endpoint, m in self._endpoints.items():
+                cumulative = 0
+                for bound, bucket_count in zip((*map(str, LATENCY_BUCKETS), "+Inf"), m.bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f'{p}_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+                lines.append(f'{p}_request_duration_seconds_sum{{endpoint="{endpoint}"}} {m.latency_sum}')
+                lines.append(f'{p}_request_duration_seconds_count{{endpoint="{endpoint}"}} {m.count}')
+            lines += [f"# HELP {p}_response_bytes_total Bytes received from the Schwab api.",
+                      f"# TYPE {p}_response_bytes_total counter"]
+            lines += [f'{p}_response_bytes_total{{endpoint="{endpoint}"}} {m.response_bytes}' for endpoint, m in self._endpoints.items()]
+            lines += [f"# HELP {p}_responses_total Schwab api responses by status code.",
+                      f"# TYPE {p}_responses_total counter"]
+            lines += [f'{p}_responses_total{{endpoint="{endpoint}",status="{status}"}} {count}'
+                      for endpoint, m in self._endpoints.items() for status, count in m.statuses.items()]
+            lines += [f"# HELP {p}_events_total Client events (e.g. token refreshes).",
+                      f"# TYPE {p}_events_total counter"]
+            lines += [f'{p}_events_total{{event="{event}"}} {count}' for event, count in self._events.items()]
+        return "\n".join(lines) + "\n"
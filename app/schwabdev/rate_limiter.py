@@ -0,0 +1,172 @@
+"""
+This file contains a client side rate limiter for the Schwab api
+Token buckets per api budget (market data and trading) with priority lanes so orders are never stuck behind reads
+"""
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+
+PRIORITY_ORDER = 0  # order placement, cancellation and replacement
+PRIORITY_READ = 1   # everything else (quotes, chains, history, account reads...)
+
+DEFAULT_RATE_LIMITS = {"marketdata": 120, "trader": 120}  # requests per minute (from schwab)
+DEFAULT_BURST = 20                                          # requests that may be sent back to back
+
+
+class _Bucket:
+
+    def __init__(self, rate_per_minute: int, burst: int):
+        """
+        Token bucket with a priority queue of waiting requests
+
+        Args:
+            rate_per_minute (int): sustained requests per minute
+            burst (int): bucket capacity (requests that can be sent without waiting)
+        """
+        if rate_per_minute <= 0 or burst <= 0:
+            raise Exception("[Schwabdev] Rate limits must be greater than 0.")
+        self.rate = rate_per_minute / 60.0          # tokens per second
+        self.capacity = float(burst)                # maximum tokens
+        self.tokens = float(burst)                  # current tokens
+        self._last_refill = time.monotonic()        # last time tokens were added
+        self._waiting = []                          # heap of (priority, sequence) tickets
+        self._async_waiters = {}                    # ticket -> (event loop, asyncio.Event) of tickets waiting in acquire_async
+        self._condition = threading.Condition()     # guards all of the above
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def _try_take(self, ticket: tuple) -> float | None:
+        """
+        Take a token for ticket if it is first in line (must hold self._condition)
+
+        Returns:
+            float | None: 0 if a token was taken, seconds until the next token if ticket is first in line,
+                None if it is not (it is woken up when it becomes first)
+        """
+        self._refill()
+        if self._waiting[0] != ticket:
+            return None
+        if self.tokens >= 1:
+            heapq.heappop(self._waiting)
+            self.tokens -= 1
+            self._wake_first()  # next in line may be able to go
+            return 0
+        return max((1 - self.tokens) / self.rate, 0.001)
+
+    def _wake_first(self):
+        """
+        Wake up the ticket now first in line, sync waiters through the condition, async ones through their event (must hold self._condition)
+        """
+        self._condition.notify_all()
+        if self._waiting and (waiter := self._async_waiters.get(self._waiting[0])) is not None:
+            loop, event = waiter
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:  # loop closed, its waiter is gone
+                pass
+
+    def _remove(self, ticket: tuple):
+        """
+        Remove an abandoned ticket from the line (must hold self._condition)
+        """
+        if ticket in self._waiting:
+            self._waiting.remove(ticket)
+            heapq.heapify(self._waiting)
+            self._wake_first()
+
+    def acquire(self, ticket: tuple):
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while (wait := self._try_take(ticket)) != 0:
+                    self._condition.wait(wait)  # None (not first in line) until woken up
+            except BaseException:
+                self._remove(ticket)
+                raise
+
+    async def acquire_async(self, ticket: tuple):
+        woken = asyncio.Event()
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            self._async_waiters[ticket] = (asyncio.get_running_loop(), woken)
+        try:
+            while True:
+                woken.clear()
+                with self._condition:
+                    wait = self._try_take(ticket)
+                if wait == 0:
+                    return
+                if wait is None:
+                    await woken.wait()
+                else:
+                    try:  # first in line: wait for the next token (or for a higher priority ticket to take the lead)
+                        await asyncio.wait_for(woken.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+        except BaseException:
+            with self._condition:
+                self._remove(ticket)
+            raise
+        finally:
+            with self._condition:
+                self._async_waiters.pop(ticket, None)
+
+
+class RateLimiter:
+
+    def __init__(self, rate_limits: dict = None, burst: int = DEFAULT_BURST):
+        """
+        Initialize a rate limiter with one token bucket per api budget
+
+        Args:
+            rate_limits (dict | None): requests per minute per budget ("marketdata" and/or "trader"), None for defaults
+            burst (int): requests per budget that may be sent back to back before waiting
+
+        Notes:
+            Requests are queued (not failed) when a budget is exhausted, lower priority values go first
+            and requests of the same priority go in the order they arrived.
+        """
+        rate_limits = DEFAULT_RATE_LIMITS if rate_limits is None else rate_limits
+        self._buckets = {budget: _Bucket(rate, min(burst, rate)) for budget, rate in rate_limits.items()}
+        self._sequence = itertools.count()  # tie breaker so equal priorities are first come first serve
+
+    def _bucket_for(self, path: str) -> _Bucket | None:
+        """
+        Get the budget bucket for an api path (e.g. "/marketdata/v1/quotes" -> marketdata)
+
+        Args:
+            path (str): path of the request
+
+        Returns:
+            _Bucket | None: bucket for the path or None if the path is not limited
+        """
+        return self._buckets.get(path.lstrip("/").split("/", 1)[0])
+
+    def acquire(self, path: str, priority: int = PRIORITY_READ):
+        """
+        Block until a request to path may be sent
+
+        Args:
+            path (str): path of the request
+            priority (int): PRIORITY_ORDER or PRIORITY_READ
+        """
+        bucket = self._bucket_for(path)
+        if bucket is not None:
+            bucket.acquire((priority, next(self._sequence)))
+
+    async def acquire_async(self, path: str, priority: int = PRIORITY_READ):
+        """
+        Wait (without blocking the event loop) until a request to path may be sent
+
+        Args:
+            path (str): path of the request
+            priority (int): PRIORITY_ORDER or PRIORITY_READ
+        """
+        bucket = self._bucket_for(path)
+        if bucket is not None:
+            await bucket.acquire_async((priority, next(self._sequence)))
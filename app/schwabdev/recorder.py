@@ -0,0 +1,204 @@
+"""
+This file contains an append-only recorder of raw stream messages and a replay engine for recorded sessions
+Messages are stored with their receive time in memory-mapped segment files, each with an index by time and service
+"""
+import os
+import re
+import mmap
+import time
+import glob
+import struct
+import bisect
+import threading
+
+SEGMENT_MAGIC = b"SDTK\x01\x00\x00\x00"         # file type and format version
+RECORD_HEADER = struct.Struct("<qI")            # receive time (ns since epoch), payload length
+INDEX_ENTRY = struct.Struct("<qIH2x")           # receive time (ns since epoch), record offset, service mask
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024         # bytes per segment file
+
+# service -> bit of the index service mask (anything else sets OTHER_SERVICE_BIT)
+SERVICE_BITS = {service: 1 << i for i, service in enumerate((
+    "LEVELONE_EQUITIES", "LEVELONE_OPTIONS", "LEVELONE_FUTURES", "LEVELONE_FUTURES_OPTIONS", "LEVELONE_FOREX",
+    "NYSE_BOOK", "NASDAQ_BOOK", "OPTIONS_BOOK", "CHART_EQUITY", "CHART_FUTURES", "SCREENER_EQUITY", "SCREENER_OPTION",
+    "ACCT_ACTIVITY", "ADMIN"))}
+OTHER_SERVICE_BIT = 1 << 15
+_SERVICE_PATTERN = re.compile(r'"service"\s*:\s*"([A-Z_]+)"')
+
+
+def service_mask(services: list[str] | None) -> int:
+    """
+    Index mask of a list of services (None means every service)
+    """
+    if services is None:
+        return 0xFFFF
+    mask = 0
+    for service in services:
+        mask |= SERVICE_BITS.get(service.upper(), OTHER_SERVICE_BIT)
+    return mask
+
+
+class TickRecorder:
+
+    def __init__(self, directory: str, segment_size: int = DEFAULT_SEGMENT_SIZE):
+        """
+        Initialize a recorder (pass it to Stream.start(recorder=...))
+
+        Args:
+            directory (str): directory of the segment (.seg) and index (.idx) files
+            segment_size (int): size of a segment file, a new segment is started when a message does not fit
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self._lock = threading.Lock()
+        self._file = None
+        self._map = None
+        self._index = None
+        self._position = 0
+        self.records = 0                    # messages recorded
+        os.makedirs(directory, exist_ok=True)
+
+    def _open_segment(self, time_ns: int, min_size: int):
+        self._close_segment()
+        path = os.path.join(self.directory, f"ticks-{time_ns}")
+        size = max(self.segment_size, len(SEGMENT_MAGIC) + min_size)
+        self._file = open(f"{path}.seg", "w+b")
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._map[:len(SEGMENT_MAGIC)] = SEGMENT_MAGIC
+        self._position = len(SEGMENT_MAGIC)
+        self._index = open(f"{path}.idx", "ab")
+
+    def _close_segment(self):
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+            self._file.truncate(self._position)  # drop the unused preallocated tail
+            self._file.close()
+            self._index.close()
+            self._map = self._file = self._index = None
+
+    def append(self, message: str | bytes, time_ns: int = None):
+        """
+        Record one message
+
+        Args:
+            message (str | bytes): raw message from the streamer
+            time_ns (int | None): receive time in ns since epoch (now if None)
+        """
+        time_ns = time.time_ns() if time_ns is None else time_ns
+        payload = message.encode() if isinstance(message, str) else message
+        text = payload.decode(errors="ignore") if isinstance(message, bytes) else message
+        mask = 0
+        for service in set(_SERVICE_PATTERN.findall(text)):
+            mask |= SERVICE_BITS.get(service, OTHER_SERVICE_BIT)
+        size = RECORD_HEADER.size + len(payload)
+        with self._lock:
+            if self._map is None or self._position + size > len(self._map):
+                self._open_segment(time_ns, size)
+            offset = self._position
+            RECORD_HEADER.pack_into(self._map, offset, time_ns, len(payload))
+            self._map[offset + RECORD_HEADER.size:offset + size] = payload
+            self._position += size
+            # the index entry is written after the record, so an index entry always points at a complete record
+            self._index.write(INDEX_ENTRY.pack(time_ns, offset, mask))
+            self.records += 1
+
+    def flush(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.flush()
+                self._index.flush()
+
+    def close(self):
+        with self._lock:
+            self._close_segment()
+
+
+class _Segment:
+
+    def __init__(self, path: str):
+        with open(f"{path}.idx", "rb") as f:
+            index = f.read()
+        self.count = len(index) // INDEX_ENTRY.size
+        self.entries = [INDEX_ENTRY.unpack_from(index, i * INDEX_ENTRY.size) for i in range(self.count)]
+        self.times = [entry[0] for entry in self.entries]
+        self._file = open(f"{path}.seg", "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+            raise Exception(f"[Schwabdev] {path}.seg is not a tick segment.")
+
+    def message(self, offset: int) -> bytes:
+        _, length = RECORD_HEADER.unpack_from(self._map, offset)
+        start = offset + RECORD_HEADER.size
+        return self._map[start:start + length]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class TickReplayer:
+
+    def __init__(self, directory: str):
+        """
+        Initialize a replay engine over the segments recorded in directory
+
+        Args:
+            directory (str): directory written by a TickRecorder
+        """
+        paths = sorted(glob.glob(os.path.join(directory, "ticks-*.idx")), key=lambda p: int(os.path.basename(p)[6:-4]))
+        self._paths = [p[:-4] for p in paths]
+
+    def messages(self, start: int = None, end: int = None, services: list[str] = None):
+        """
+        Recorded messages in receive order
+
+        Args:
+            start (int | None): first receive time (ns since epoch)
+            end (int | None): last receive time (ns since epoch)
+            services (list[str] | None): only messages carrying one of these services
+
+        Yields:
+            tuple[int, str]: (receive time in ns since epoch, raw message)
+        """
+        mask = service_mask(services)
+        for path in self._paths:
+            segment = _Segment(path)
+            try:
+                if not segment.count or (end is not None and segment.times[0] > end) or (start is not None and segment.times[-1] < start):
+                    continue
+                first = 0 if start is None else bisect.bisect_left(segment.times, start)
+                last = segment.count if end is None else bisect.bisect_right(segment.times, end)
+                for time_ns, offset, entry_mask in segment.entries[first:last]:
+                    if entry_mask & mask:
+                        yield time_ns, segment.message(offset).decode()
+            finally:
+                segment.close()
+
+    def replay(self, receiver=print, speed: float | None = 1.0, start: int = None, end: int = None, services: list[str] = None, **kwargs) -> int:
+        """
+        Feed recorded messages to a stream receiver
+
+        Args:
+            receiver (function): function called with each raw message (same interface as Stream.start)
+            speed (float | None): 1.0 for real time, N for N times faster, None (or 0) for as fast as possible
+            start (int | None): first receive time (ns since epoch)
+            end (int | None): last receive time (ns since epoch)
+            services (list[str] | None): only messages carrying one of these services
+            **kwargs: keyword arguments to pass to receiver
+
+        Returns:
+            int: number of messages replayed
+        """
+        count = 0
+        first_time = wall_start = None
+        for time_ns, message in self.messages(start, end, services):
+            if speed:
+                if first_time is None:
+                    first_time, wall_start = time_ns, time.perf_counter()
+                delay = (time_ns - first_time) / 1e9 / speed - (time.perf_counter() - wall_start)
+                if delay > 0:
+                    time.sleep(delay)
+            receiver(message, **kwargs)
+            count += 1
+        return count
@@ -0,0 +1,107 @@
+"""
+This file contains the retry policy for idempotent (GET) Schwab api requests
+Exponential backoff with jitter, Retry-After on 429, and optional hedged requests once a latency percentile is exceeded
+"""
+import math
+import random
+import datetime
+import threading
+import email.utils
+from collections import deque
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RetryPolicy:
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0, retry_statuses: tuple = RETRY_STATUSES,
+                 hedge_percentile: float = None, hedge_min_samples: int = 20, latency_window: int = 200):
+        """
+        Initialize a retry policy (only ever applied to GET requests)
+
+        Args:
+            max_attempts (int): attempts per request including the first one (1 disables retries)
+            base_delay (float): backoff of the first retry in seconds (doubles every attempt, full jitter)
+            max_delay (float): maximum backoff in seconds (Retry-After included)
+            retry_statuses (tuple): response status codes that are retried
+            hedge_percentile (float | None): send a second identical request when the first one is slower than this
+                percentile of recent latencies of the endpoint (e.g. 0.95), None to disable hedging
+            hedge_min_samples (int): latencies needed for an endpoint before hedging starts
+            latency_window (int): recent latencies kept per endpoint
+        """
+        if max_attempts < 1:
+            raise Exception("[Schwabdev] max_attempts must be at least 1.")
+        if hedge_percentile is not None and not 0 < hedge_percentile < 1:
+            raise Exception("[Schwabdev] hedge_percentile must be between 0 and 1.")
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = retry_statuses
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self._latency_window = latency_window
+        self._latencies = {}                # endpoint -> deque of recent latencies in seconds
+        self._lock = threading.Lock()
+
+    def should_retry(self, response) -> bool:
+        """
+        Check if a response is a transient failure worth retrying
+
+        Args:
+            response (requests.Response | httpx.Response): response to check
+
+        Returns:
+            bool: True if the request should be sent again
+        """
+        if response.status_code not in self.retry_statuses:
+            return False
+        # an oversized option chain fails the same way every time (see ChainFetcher)
+        return "buffer" not in response.text.lower()
+
+    def delay(self, attempt: int, response=None) -> float:
+        """
+        Seconds to wait before the next attempt
+
+        Args:
+            attempt (int): number of the attempt that just failed (starting at 0)
+            response (requests.Response | httpx.Response | None): failed response (None if the request raised)
+
+        Returns:
+            float: seconds to wait (Retry-After if the server sent one with a 429, jittered exponential backoff otherwise),
+                never more than max_delay
+        """
+        if response is not None and response.status_code == 429 and (retry_after := response.headers.get("Retry-After")):
+            seconds = None
+            try:
+                seconds = float(retry_after)
+            except ValueError:
+                try:
+                    when = email.utils.parsedate_to_datetime(retry_after)
+                    seconds = (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+                except (TypeError, ValueError):
+                    pass
+            if seconds is not None and math.isfinite(seconds):
+                return min(max(seconds, 0), self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def record_latency(self, endpoint: str, seconds: float):
+        with self._lock:
+            self._latencies.setdefault(endpoint, deque(maxlen=self._latency_window)).append(seconds)
+
+    def hedge_delay(self, endpoint: str) -> float | None:
+        """
+        Seconds after which a hedged request should be sent for endpoint
+
+        Args:
+            endpoint (str): client method name
+
+        Returns:
+            float | None: hedge_percentile of the recent latencies, None if hedging is disabled or there are too few samples
+        """
+        if self.hedge_percentile is None:
+            return None
+        with self._lock:
+            latencies = sorted(self._latencies.get(endpoint, ()))
+        if len(latencies) < self.hedge_min_samples:
+            return None
+        return latencies[min(int(len(latencies) * self.hedge_percentile), len(latencies) - 1)]
@@ -0,0 +1,87 @@
+"""
+This file contains request coalescing ("single flight") for the Schwab api clients
+Identical requests made while one is already in flight wait for and share its result instead of being sent again
+"""
+import asyncio
+import threading
+import weakref
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()   # set when the leader finishes
+        self.result = None              # result of the leader
+        self.error = None               # exception raised by the leader
+
+
+class SingleFlight:
+
+    def __init__(self):
+        """
+        Coalesce identical calls made from different threads
+        """
+        self._calls = {}                # key -> _Call in flight
+        self._lock = threading.Lock()
+
+    def do(self, key: str, func):
+        """
+        Call func unless a call with the same key is in flight, in which case wait for and return its result
+
+        Args:
+            key (str): identity of the call (e.g. path and params of a request)
+            func (function): function without arguments to call
+
+        Returns:
+            any: result of func (shared by every caller of the same flight)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class AsyncSingleFlight:
+
+    def __init__(self):
+        """
+        Coalesce identical coroutine calls made on the same event loop
+        """
+        self._calls = weakref.WeakKeyDictionary()  # event loop -> {key: task in flight}
+
+    async def do(self, key: str, func):
+        """
+        Await func() unless a call with the same key is in flight, in which case wait for and return its result
+
+        Args:
+            key (str): identity of the call (e.g. path and params of a request)
+            func (function): coroutine function without arguments
+
+        Returns:
+            any: result of func() (shared by every caller of the same flight)
+        """
+        calls = self._calls.setdefault(asyncio.get_running_loop(), {})
+        task = calls.get(key)
+        if task is None:
+            task = calls[key] = asyncio.ensure_future(func())
+            task.add_done_callback(lambda _: calls.pop(key, None))
+        # shield so a cancelled waiter does not cancel the request shared with the other waiters
+        return await asyncio.shield(task)
@@ -14,6 +14,8 @@ import zoneinfo
 import threading
 import websockets
 import websockets.exceptions
+from .stream_queue import StreamQueue, WorkerPool, POLICY_BLOCK
+from .subscriptions import SubscriptionManager
 
 
 class Stream:
@@ -31,8 +33,10 @@ class Stream:
         self.active = False                                     # whether the stream is active
         self._thread = None                                     # the thread that runs the stream
         self._client = client                                   # so we can get streamer info
-        self.subscriptions = {}                                 # a dictionary of subscriptions
+        self._subscription_manager = SubscriptionManager(self.basic_request)  # subscriptions (sets) and request diffs
+        self.subscription_timeout = 10                          # seconds to wait for the response to each replayed subscription chunk
         self.backoff_time = 2.0                                 # default backoff time (time to wait before retrying)
+        self._worker_pool = None                                # workers consuming received messages (if enabled)
 
         # register atexit to stop the stream (if active)
         def stop_atexit():
@@ -41,13 +45,23 @@ class Stream:
         atexit.register(stop_atexit)
 
 
-    async def _start_streamer(self, receiver_func=print, ping_timeout: int = 30, **kwargs):
+    async def _start_streamer(self, receiver_func=print, ping_timeout: int = 30, workers: int = 0, worker_mode: str = "thread",
+                              queue_size: int = 1000, backpressure: str = POLICY_BLOCK, coalesce_key=None, coalesce_merge=None,
+                              batch_size: int = None, recorder=None, **kwargs):
         """
         Start the streamer
 
         Args:
             receiver_func (function, optional): function to call when data is received. Defaults to print.
             ping_timeout (int, optional): how long to wait for pongs from the server. Defaults to 30.
+            workers (int, optional): see start(). Defaults to 0.
+            worker_mode (str, optional): see start(). Defaults to "thread".
+            queue_size (int, optional): see start(). Defaults to 1000.
+            backpressure (str, optional): see start(). Defaults to "block".
+            coalesce_key (function, optional): see start(). Defaults to None.
+            coalesce_merge (function, optional): see start(). Defaults to None.
+            batch_size (int, optional): see start(). Defaults to None.
+            recorder (TickRecorder, optional): see start(). Defaults to None.
             **kwargs: keyword arguments to pass to receiver_func
         """
         # get streamer info
@@ -58,6 +72,40 @@ class Stream:
             self._client.logger.error("Could not get streamerInfo")
             return
 
+        # hand messages to a bounded queue consumed by workers so a slow receiver can not stall the read loop (and pings)
+        if workers > 0:
+            self._worker_pool = WorkerPool(receiver_func, kwargs, StreamQueue(queue_size, backpressure, coalesce_key, coalesce_merge),
+                                           workers, worker_mode, batch_size, self._client.logger)
+            self._worker_pool.start()
+            receive = self._worker_pool.queue.put_async
+        else:
+            async def receive(message):
+                receiver_func(message, **kwargs)
+
+        # record every message (with its receive time) before it is handed on
+        if recorder is not None:
+            dispatch = receive
+            async def receive(message):
+                recorder.append(message)
+                await dispatch(message)
+
+        try:
+            await self._listen(receive, ping_timeout)
+        finally:
+            if self._worker_pool is not None:
+                await self._worker_pool.stop_async()
+            if recorder is not None:
+                recorder.flush()
+
+    async def _listen(self, receive, ping_timeout: int):
+        """
+        Connect, login, (re)send subscriptions and read messages until the stream is closed
+
+        Args:
+            receive (function): coroutine function called with every received message
+            ping_timeout (int): how long to wait for pongs from the server
+        """
+
         # start the stream
         start_time = datetime.datetime.now(datetime.timezone.utc)
         while True:
@@ -74,21 +122,14 @@ class Stream:
                                                                    "SchwabClientChannel": self._streamer_info.get("schwabClientChannel"),
                                                                    "SchwabClientFunctionId": self._streamer_info.get("schwabClientFunctionId")})
                     await self._websocket.send(json.dumps(login_payload))
-                    receiver_func(await self._websocket.recv(), **kwargs)
+                    await receive(await self._websocket.recv())
                     self.active = True
 
-                    # send subscriptions (that are queued or previously sent)
-                    for service, subs in self.subscriptions.items():
-                        grouped = {} # group subscriptions by fields for more efficient requests
-                        for key, fields in subs.items():
-                            grouped.setdefault(self._list_to_string(fields), []).append(key)
-                        reqs = [] # list of requests to send for this service
-                        for fields, keys in grouped.items():
-                            reqs.append(self.basic_request(service=service, command="ADD", parameters={"keys": self._list_to_string(keys), "fields": fields}))
-                        if reqs:
-                            self._client.logger.debug(f"Sending subscriptions: {reqs}")
-                            await self._websocket.send(json.dumps({"requests": reqs}))
-                            receiver_func(await self._websocket.recv(), **kwargs)
+                    # send subscriptions (that are queued or previously sent) in chunks, each one confirmed before the next
+                    for request in self._subscription_manager.replay_requests():
+                        self._client.logger.debug(f"Sending subscriptions: {request}")
+                        await self._websocket.send(json.dumps({"requests": [request]}))
+                        await self._wait_for_response(request, receive)
 
                     # reset backoff time
                     self.backoff_time = 2.0
@@ -101,7 +142,11 @@ class Stream:
                     """
                     # main listener loop
                     while True:
-                        receiver_func(await self._websocket.recv(), **kwargs)
+                        message = await self._websocket.recv()
+                        if self._subscription_manager.pending:
+                            for request, content in self._subscription_manager.confirm(message):
+                                self._check_response(request, content)
+                        await receive(message)
 
             except websockets.exceptions.ConnectionClosedOK as e: # "received 1000 (OK); then sent 1000 (OK)"
                 self.active = False
@@ -122,6 +167,32 @@ class Stream:
                 await self._wait_for_backoff()
 
 
+    async def _wait_for_response(self, request: dict, receive):
+        """
+        Read messages (passing them on) until the response to request arrives or subscription_timeout passes
+
+        Args:
+            request (dict): request sent
+            receive (function): coroutine function called with every received message
+        """
+        async def wait():
+            while True:
+                message = await self._websocket.recv()
+                await receive(message)
+                if '"response"' in message:
+                    for response in json.loads(message).get("response", []):
+                        if str(response.get("requestid")) == str(request.get("requestid")):
+                            return response.get("content", {})
+        try:
+            self._check_response(request, await asyncio.wait_for(wait(), self.subscription_timeout))
+        except asyncio.TimeoutError:
+            self._client.logger.warning(f"No response to subscription request {request.get('requestid')} ({request.get('service')}) within {self.subscription_timeout} seconds.")
+
+    def _check_response(self, request: dict, content: dict):
+        if content.get("code", 0) != 0:
+            self._client.logger.error(f"Subscription request {request.get('requestid')} ({request.get('service')} {request.get('command')}) failed: {content.get('msg')}")
+            self._subscription_manager.failed(request)
+
     async def _wait_for_backoff(self):
         """
         Wait for the backoff time
@@ -130,7 +201,8 @@ class Stream:
         # exponential backoff and cap at 128s
         self.backoff_time = min(self.backoff_time * 2, 128)
 
-    def start(self, receiver=print, daemon: bool = True, ping_interval: int = 20, **kwargs):
+    def start(self, receiver=print, daemon: bool = True, ping_interval: int = 20, workers: int = 0, worker_mode: str = "thread",
+              queue_size: int = 1000, backpressure: str = POLICY_BLOCK, coalesce_key=None, coalesce_merge=None, batch_size: int = None, recorder=None, **kwargs):
         """
         Start the stream
 
@@ -138,10 +210,24 @@ class Stream:
             receiver (function, optional): function to call when data is received. Defaults to print.
             daemon (bool, optional): whether to run the thread in the background (as a daemon). Defaults to True.
             ping_interval (int, optional): interval in seconds to send pings to the streamer. Defaults to 20.
+            workers (int, optional): number of workers calling receiver from a bounded queue, 0 calls it inline from the read loop. Defaults to 0.
+            worker_mode (str, optional): "thread" (receiver may block) or "async" (tasks on the stream event loop, for coroutine receivers). Defaults to "thread".
+            queue_size (int, optional): maximum number of queued messages. Defaults to 1000.
+            backpressure (str, optional): policy when the queue is full ("block"|"drop_oldest"|"coalesce"). Defaults to "block".
+            coalesce_key (function, optional): message -> key for "coalesce" (e.g. stream_queue.data_message_key). Defaults to None.
+            coalesce_merge (function, optional): (queued message, new message) -> message to keep when coalescing, "replace" keeps the new one. Defaults to None (stream_queue.merge_data_messages).
+            batch_size (int, optional): with workers, call receiver with lists of up to batch_size queued messages (e.g. StreamDecoder.wrap_batch). Defaults to None.
+            recorder (TickRecorder, optional): record every received message for replay with TickReplayer. Defaults to None.
+
+        Notes:
+            With more than one worker messages may be handled out of order.
         """
         if not self.active:
+            if workers > 0:  # validate here, errors in the stream thread are only logged
+                StreamQueue(queue_size, backpressure, coalesce_key, coalesce_merge)
             def _start_async():
-                asyncio.run(self._start_streamer(receiver, ping_interval, **kwargs))
+                asyncio.run(self._start_streamer(receiver, ping_interval, workers, worker_mode, queue_size, backpressure,
+                                                 coalesce_key, coalesce_merge, batch_size, recorder, **kwargs))
 
             self._thread = threading.Thread(target=_start_async, daemon=daemon)
             self._thread.start()
@@ -182,49 +268,50 @@ class Stream:
         if not start_time <= datetime.datetime.now(now_timezone).time() <= stop_time:
             self._client.logger.info("Stream was started outside of active hours and will launch when in hours.")
 
-    def _record_request(self, request: dict):
+    def queue_stats(self) -> dict | None:
+        """
+        Counters of the receiver queue (only when started with workers)
+
+        Returns:
+            dict | None: {"depth", "max_depth", "received", "dropped", "coalesced", "processed", "errors"}
+        """
+        if self._worker_pool is None:
+            return None
+        return {**self._worker_pool.queue.stats(), "errors": self._worker_pool.errors}
+
+    @property
+    def subscriptions(self) -> dict:
+        """
+        Subscriptions (replayed on reconnect)
+
+        Returns:
+            dict: {service: {key: [fields]}}
+        """
+        return self._subscription_manager.as_dict()
+
+    @subscriptions.setter
+    def subscriptions(self, subscriptions: dict):
+        if subscriptions:
+            self._subscription_manager.replace(subscriptions)
+        else:
+            self._subscription_manager.clear()
+
+    def _record_request(self, request: dict) -> list[dict]:
         """
         Record the request into self.subscriptions (for the event of crashes)
 
         Args:
             request (dict): request
-        """
 
+        Returns:
+            list[dict]: requests that still need to be sent (minimal diff, split into chunks)
+        """
         try:
-            def str_to_list(st):
-                if type(st) is str: return st.split(",")
-                elif type(st) is list: return st
-            service = request.get("service", None)
-            command = request.get("command", None)
-            parameters = request.get("parameters", None)
-            if parameters is not None and service is not None:
-                keys = str_to_list(parameters.get("keys", []))
-                fields = str_to_list(parameters.get("fields", []))
-                # add service to subscriptions if not already there
-                if service not in self.subscriptions:
-                    self.subscriptions[service] = {}
-                if command == "ADD":
-                    for key in keys:
-                        if key not in self.subscriptions[service]:
-                            self.subscriptions[service][key] = fields
-                        else:
-                            self.subscriptions[service][key] = list(set(fields) | set(self.subscriptions[service][key]))
-                elif command == "SUBS":
-                    self.subscriptions[service] = {}
-                    for key in keys:
-                        self.subscriptions[service][key] = fields
-                elif command == "UNSUBS":
-                    for key in keys:
-                        if key in self.subscriptions[service]:
-                            self.subscriptions[service].pop(key)
-                elif command == "VIEW":  # not sure if this is even working on Schwab's end :/
-                    for key in self.subscriptions[service].keys():
-                        self.subscriptions[service][key] = fields
+            return self._subscription_manager.apply(request)
         except Exception as e:
             self._client.logger.error(e)
             self._client.logger.error("Error recording request - subscription not saved.")
-
-
+            return [request]
 
     def send(self, requests: list | dict):
         """
@@ -249,14 +336,14 @@ class Stream:
         if type(requests) is not list:
             requests = [requests]
 
-        # add requests to list of subscriptions (acts as a queue before stream started)
-        for request in requests:
-            self._record_request(request)
+        # add requests to the subscriptions (acts as a queue before stream started), keeping only what changes
+        to_send = [chunk for request in requests for chunk in self._record_request(request)]
 
         # send the request if the stream is active, queue otherwise
         if self.active:
-            to_send = json.dumps({"requests": requests})
-            await self._websocket.send(to_send)
+            self._subscription_manager.track(to_send)
+            for chunk in to_send:
+                await self._websocket.send(json.dumps({"requests": [chunk]}))
         else:
             self._client.logger.info("Stream is not active, request queued.")
 
@@ -0,0 +1,164 @@
+"""
+This file contains a decoder for stream messages, mapping the numeric field keys to names
+Records (one dict per symbol update) or columns (one list per field per service) for LEVELONE_EQUITIES, LEVELONE_OPTIONS, CHART_EQUITY and ACCT_ACTIVITY
+"""
+import json
+import inspect
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # orjson is optional, it is only faster
+    _loads = json.loads
+
+# field number -> name (names follow the REST quote fields where there is one)
+LEVELONE_EQUITIES_FIELDS = (
+    "symbol", "bidPrice", "askPrice", "lastPrice", "bidSize", "askSize", "askId", "bidId", "totalVolume", "lastSize",
+    "highPrice", "lowPrice", "closePrice", "exchange", "marginable", "description", "lastId", "openPrice", "netChange", "52WeekHigh",
+    "52WeekLow", "peRatio", "divAmount", "divYield", "nAV", "exchangeName", "divDate", "regularMarketQuote", "regularMarketTrade", "regularMarketLastPrice",
+    "regularMarketLastSize", "regularMarketNetChange", "securityStatus", "mark", "quoteTime", "tradeTime", "regularMarketTradeTime", "bidTime", "askTime", "askMICId",
+    "bidMICId", "lastMICId", "netPercentChange", "regularMarketPercentChange", "markChange", "markPercentChange", "htbQuantity", "htbRate", "isHardToBorrow", "isShortable",
+    "postMarketChange", "postMarketPercentChange")
+
+LEVELONE_OPTIONS_FIELDS = (
+    "symbol", "description", "bidPrice", "askPrice", "lastPrice", "highPrice", "lowPrice", "closePrice", "totalVolume", "openInterest",
+    "volatility", "moneyIntrinsicValue", "expirationYear", "multiplier", "digits", "openPrice", "bidSize", "askSize", "lastSize", "netChange",
+    "strikePrice", "contractType", "underlying", "expirationMonth", "deliverables", "timeValue", "expirationDay", "daysToExpiration", "delta", "gamma",
+    "theta", "vega", "rho", "securityStatus", "theoreticalOptionValue", "underlyingPrice", "uvExpirationType", "mark", "quoteTime", "tradeTime",
+    "exchange", "exchangeName", "lastTradingDay", "settlementType", "netPercentChange", "markChange", "markPercentChange", "impliedYield", "isPennyPilot", "optionRoot",
+    "52WeekHigh", "52WeekLow", "indicativeAskPrice", "indicativeBidPrice", "indicativeQuoteTime", "exerciseType")
+
+CHART_EQUITY_FIELDS = ("key", "openPrice", "highPrice", "lowPrice", "closePrice", "volume", "sequence", "chartTime", "chartDay")
+
+ACCT_ACTIVITY_FIELDS = ("subscriptionKey", "accountNumber", "messageType", "messageData")
+
+FIELD_NAMES = {"LEVELONE_EQUITIES": LEVELONE_EQUITIES_FIELDS,
+               "LEVELONE_OPTIONS": LEVELONE_OPTIONS_FIELDS,
+               "CHART_EQUITY": CHART_EQUITY_FIELDS,
+               "ACCT_ACTIVITY": ACCT_ACTIVITY_FIELDS}
+
+# json keys are strings, so the lookups are prepared once per service
+_KEY_MAPS = {service: {str(i): name for i, name in enumerate(names)} for service, names in FIELD_NAMES.items()}
+
+
+class StreamDecoder:
+
+    def __init__(self, columnar: bool = False, services: list[str] = None, parse_activity: bool = True):
+        """
+        Initialize a decoder
+
+        Args:
+            columnar (bool): deliver {service: {field: [values]}} per batch instead of {service: [records]}
+            services (list[str] | None): services to decode (default all known), data of other services is dropped
+            parse_activity (bool): parse the json in ACCT_ACTIVITY messageData
+        """
+        self.columnar = columnar
+        self._key_maps = {service: key_map for service, key_map in _KEY_MAPS.items() if services is None or service in services}
+        self._parse_activity = parse_activity
+
+    def decode(self, message: str | bytes) -> dict:
+        """
+        Decode one raw stream message
+
+        Args:
+            message (str | bytes): raw message from the streamer
+
+        Returns:
+            dict: {"data": {service: records or columns}, "response": [...], "notify": [...]}
+                each record has "key", "timestamp" and the named fields that were sent (updates only carry changed fields)
+        """
+        data, response, notify = self._decode_records(message)
+        if self.columnar:
+            data = {service: self.to_columns(records) for service, records in data.items()}
+        return {"data": data, "response": response, "notify": notify}
+
+    def decode_batch(self, messages: list[str | bytes]) -> dict:
+        """
+        Decode several raw messages into one result (e.g. everything queued since the last call)
+
+        Args:
+            messages (list[str | bytes]): raw messages, oldest first
+
+        Returns:
+            dict: same as decode(), with the records (or columns) of every message concatenated in order
+        """
+        data, response, notify = {}, [], []
+        for message in messages:
+            message_data, message_response, message_notify = self._decode_records(message)
+            for service, records in message_data.items():
+                data.setdefault(service, []).extend(records)
+            response.extend(message_response)
+            notify.extend(message_notify)
+        if self.columnar:
+            data = {service: self.to_columns(records) for service, records in data.items()}
+        return {"data": data, "response": response, "notify": notify}
+
+    def _decode_records(self, message: str | bytes) -> tuple[dict, list, list]:
+        d = _loads(message)
+        data = {}
+        for entry in d.get("data", ()):
+            key_map = self._key_maps.get(entry.get("service"))
+            if key_map is None:
+                continue
+            timestamp = entry.get("timestamp")
+            records = data.setdefault(entry["service"], [])
+            for content in entry.get("content", ()):
+                record = {key_map.get(k, k): v for k, v in content.items()}
+                record["timestamp"] = timestamp
+                records.append(record)
+            if self._parse_activity and entry["service"] == "ACCT_ACTIVITY":
+                for record in records:
+                    message_data = record.get("messageData")
+                    if isinstance(message_data, str) and message_data[:1] in ("{", "["):
+                        record["messageData"] = _loads(message_data)
+        return data, d.get("response", []), d.get("notify", [])
+
+    @staticmethod
+    def to_columns(records: list[dict]) -> dict:
+        """
+        Convert records to columns
+
+        Args:
+            records (list[dict]): decoded records
+
+        Returns:
+            dict: {field: [values]} aligned by row, None where a record did not carry the field
+        """
+        fields = {}
+        for record in records:
+            fields.update(dict.fromkeys(record))
+        return {field: [record.get(field) for record in records] for field in fields}
+
+    def wrap(self, receiver):
+        """
+        Wrap a receiver so it is called with decoded messages (e.g. stream.start(StreamDecoder().wrap(receiver)))
+
+        Args:
+            receiver (function): function called with the decoded message and the stream kwargs
+
+        Returns:
+            function: receiver for Stream.start
+        """
+        return self._wrap(receiver, self.decode)
+
+    def wrap_batch(self, receiver):
+        """
+        Wrap a receiver so it is called with one decoded result per batch of messages
+        (e.g. stream.start(StreamDecoder(columnar=True).wrap_batch(receiver), workers=1, batch_size=500))
+
+        Args:
+            receiver (function): function called with the decoded batch and the stream kwargs
+
+        Returns:
+            function: receiver for Stream.start (needs batch_size so it is called with lists of messages)
+        """
+        return self._wrap(receiver, self.decode_batch)
+
+    @staticmethod
+    def _wrap(receiver, decode):
+        if inspect.iscoroutinefunction(receiver):
+            async def decoding_receiver(messages, **kwargs):
+                return await receiver(decode(messages), **kwargs)
+        else:
+            def decoding_receiver(messages, **kwargs):
+                return receiver(decode(messages), **kwargs)
+        return decoding_receiver
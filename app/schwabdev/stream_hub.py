@@ -0,0 +1,233 @@
+"""
+This file contains a hub that shares one Schwab stream session with other local processes
+The hub owns the websocket and publishes decoded messages over a Unix socket, subscriptions are aggregated and reference counted
+"""
+import os
+import json
+import socket
+import asyncio
+import threading
+from .stream import Stream
+from .stream_queue import StreamQueue, POLICY_DROP_OLDEST, _EMPTY
+from .stream_decoder import StreamDecoder
+
+DEFAULT_SOCKET_PATH = os.path.expanduser("~/.schwabdev/stream.sock")
+
+
+class _Subscriber:
+
+    def __init__(self, writer: asyncio.StreamWriter, queue_size: int):
+        self.writer = writer
+        self.queue = StreamQueue(queue_size, POLICY_DROP_OLDEST)   # a slow subscriber loses its oldest messages, not the hub
+        self.keys = {}                                              # service -> set of keys
+
+
+class StreamHub:
+
+    def __init__(self, stream: Stream, socket_path: str = DEFAULT_SOCKET_PATH, queue_size: int = 10000):
+        """
+        Initialize a stream hub (Unix sockets only, not available on Windows)
+
+        Args:
+            stream (Stream): stream owned by the hub (client.stream)
+            socket_path (str): path of the Unix socket subscribers connect to
+            queue_size (int): messages buffered per subscriber before the oldest are dropped
+        """
+        self._stream = stream
+        self.socket_path = socket_path
+        self._queue_size = queue_size
+        self._decoder = StreamDecoder()
+        self._subscribers = set()
+        self._refs = {}                     # (service, key) -> {subscriber: fields}
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+
+    def start(self, daemon: bool = True, **stream_kwargs):
+        """
+        Start the socket server and the stream
+
+        Args:
+            daemon (bool): run the server thread as a daemon
+            **stream_kwargs: keyword arguments for Stream.start (e.g. workers)
+        """
+        # the socket carries account streams, only the owner may reach it (directory 0700 when it is the hub's own, socket 0600)
+        socket_dir = os.path.dirname(os.path.abspath(self.socket_path))
+        if not os.path.isdir(socket_dir):
+            os.makedirs(socket_dir, mode=0o700)
+        elif socket_dir == os.path.dirname(DEFAULT_SOCKET_PATH):
+            os.chmod(socket_dir, 0o700)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        started = threading.Event()
+
+        async def serve():
+            self._loop = asyncio.get_running_loop()
+            server = await asyncio.start_unix_server(self._handle_subscriber, path=self.socket_path)
+            os.chmod(self.socket_path, 0o600)
+            started.set()
+            async with server:
+                await server.serve_forever()
+
+        self._thread = threading.Thread(target=lambda: asyncio.run(serve()), daemon=daemon)
+        self._thread.start()
+        started.wait()
+        self._stream._client.logger.info(f"Stream hub listening on {self.socket_path}")
+        if not self._stream.active:
+            self._stream.start(receiver=self._on_message, daemon=daemon, **stream_kwargs)
+
+    def _on_message(self, message, **kwargs):
+        # called by the stream (its own thread), decoded once and fanned out on the hub loop
+        decoded = self._decoder.decode(message)
+        if decoded["data"] and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._fan_out, decoded["data"])
+
+    def _fan_out(self, data: dict):
+        for subscriber in list(self._subscribers):
+            filtered = {}
+            for service, records in data.items():
+                keys = subscriber.keys.get(service)
+                if keys:
+                    selected = [record for record in records if record.get("key") in keys]
+                    if selected:
+                        filtered[service] = selected
+            if filtered:
+                subscriber.queue.put({"data": filtered}, block=False)
+
+    async def _handle_subscriber(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        subscriber = _Subscriber(writer, self._queue_size)
+        self._subscribers.add(subscriber)
+        writer_task = asyncio.create_task(self._write_subscriber(subscriber))
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    if request.get("op") == "subscribe":
+                        await self._subscribe(subscriber, request["service"], request["keys"], request.get("fields", []))
+                    elif request.get("op") == "unsubscribe":
+                        await self._unsubscribe(subscriber, request["service"], request["keys"])
+                except Exception as e:
+                    self._stream._client.logger.error(f"Stream hub request error: {e}")
+        finally:
+            self._subscribers.discard(subscriber)
+            for service, keys in list(subscriber.keys.items()):
+                await self._unsubscribe(subscriber, service, list(keys))
+            subscriber.queue.close()
+            await writer_task
+            writer.close()
+
+    async def _write_subscriber(self, subscriber: _Subscriber):
+        while (message := await subscriber.queue.get_async()) is not _EMPTY:
+            try:
+                subscriber.writer.write(json.dumps(message).encode() + b"\n")
+                await subscriber.writer.drain()
+            except (ConnectionError, OSError):
+                subscriber.queue.close()
+
+    async def _subscribe(self, subscriber: _Subscriber, service: str, keys: list, fields: list):
+        # only keys that are new to the session (or need more fields) are sent to Schwab
+        # fields are numeric field ids, a bad one raises here before any reference count changes
+        service, fields = service.upper(), [str(int(f)) for f in fields]
+        grouped = {}
+        with self._lock:
+            subscriber.keys.setdefault(service, set()).update(keys)
+            for key in keys:
+                holders = self._refs.setdefault((service, key), {})
+                before = set().union(*holders.values()) if holders else None
+                holders[subscriber] = set(fields) | holders.get(subscriber, set())
+                after = set().union(*holders.values())
+                if before is None or after != before:
+                    grouped.setdefault(tuple(sorted(after, key=int)), []).append(key)
+        for union_fields, new_keys in grouped.items():
+            await asyncio.to_thread(self._stream.send, self._stream.basic_request(service, "ADD", parameters={
+                "keys": Stream._list_to_string(new_keys), "fields": Stream._list_to_string(union_fields)}))
+
+    async def _unsubscribe(self, subscriber: _Subscriber, service: str, keys: list):
+        # keys are unsubscribed from Schwab when their last subscriber leaves
+        service = service.upper()
+        released = []
+        with self._lock:
+            subscriber.keys.get(service, set()).difference_update(keys)
+            for key in keys:
+                holders = self._refs.get((service, key))
+                if holders is None or subscriber not in holders:
+                    continue
+                del holders[subscriber]
+                if not holders:
+                    del self._refs[(service, key)]
+                    released.append(key)
+        if released:
+            await asyncio.to_thread(self._stream.send, self._stream.basic_request(service, "UNSUBS", parameters={
+                "keys": Stream._list_to_string(released)}))
+
+    def ref_counts(self) -> dict:
+        """
+        Number of subscribers per subscribed key
+
+        Returns:
+            dict: {service: {key: count}}
+        """
+        counts = {}
+        with self._lock:
+            for (service, key), holders in self._refs.items():
+                counts.setdefault(service, {})[key] = len(holders)
+        return counts
+
+
+class StreamHubClient:
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH):
+        """
+        Connect to a StreamHub running in another process
+
+        Args:
+            socket_path (str): path of the hub's Unix socket
+        """
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(socket_path)
+        self._send_lock = threading.Lock()
+        self._thread = None
+
+    def _send(self, request: dict):
+        with self._send_lock:
+            self._socket.sendall(json.dumps(request).encode() + b"\n")
+
+    def subscribe(self, service: str, keys: str | list, fields: str | list):
+        """
+        Subscribe to keys of a service (e.g. "LEVELONE_EQUITIES", ["AAPL"], "0,1,2,3")
+
+        Args:
+            service (str): stream service
+            keys (str | list): keys to subscribe to
+            fields (str | list): field numbers
+        """
+        self._send({"op": "subscribe", "service": service, "keys": keys.split(",") if isinstance(keys, str) else list(keys),
+                    "fields": fields.split(",") if isinstance(fields, str) else list(fields)})
+
+    def unsubscribe(self, service: str, keys: str | list):
+        self._send({"op": "unsubscribe", "service": service, "keys": keys.split(",") if isinstance(keys, str) else list(keys)})
+
+    def start(self, receiver=print, daemon: bool = True, **kwargs):
+        """
+        Start receiving decoded messages ({"data": {service: [records]}}, records as StreamDecoder produces them)
+
+        Args:
+            receiver (function): function called with each decoded message
+            daemon (bool): run the reader thread as a daemon
+            **kwargs: keyword arguments to pass to receiver
+        """
+        def reader():
+            with self._socket.makefile("rb") as f:
+                for line in f:
+                    receiver(json.loads(line), **kwargs)
+
+        self._thread = threading.Thread(target=reader, daemon=daemon)
+        self._thread.start()
+
+    def close(self):
+        # shutdown first, the reader thread's file object keeps the socket open otherwise
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
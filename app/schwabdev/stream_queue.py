@@ -0,0 +1,314 @@
+"""
+This file contains the bounded queue and worker pool that decouple the stream receiver from the websocket read loop
+A slow receiver only fills the queue (handled by the backpressure policy) instead of stalling reads, pings and pongs
+"""
+import json
+import asyncio
+import inspect
+import itertools
+import threading
+from collections import OrderedDict
+
+POLICY_BLOCK = "block"              # the read loop waits for room (nothing is lost, the socket buffers)
+POLICY_DROP_OLDEST = "drop_oldest"  # the oldest queued message is discarded to make room
+POLICY_COALESCE = "coalesce"        # a queued message with the same key is merged with the new one, drop_oldest if there is still no room
+POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_COALESCE)
+MERGE_REPLACE = "replace"           # merge_func that keeps only the new message
+
+_EMPTY = object()
+
+
+def data_message_key(message: str):
+    """
+    Coalescing key of a raw stream message: (service, keys) for messages that only carry data, None otherwise
+
+    Args:
+        message (str): raw message from the streamer
+
+    Returns:
+        tuple | None: key (responses and notifications are never coalesced)
+    """
+    try:
+        d = json.loads(message)
+    except (TypeError, ValueError):
+        return None
+    data = d.get("data")
+    if not data or len(d) != 1:
+        return None
+    return tuple((entry.get("service"), tuple(c.get("key") for c in entry.get("content", []))) for entry in data)
+
+
+def merge_data_messages(queued: str, new: str) -> str:
+    """
+    Merge two data messages with the same coalescing key, field by field per content key (the newest value wins)
+    LEVELONE messages only carry the fields that changed, replacing the queued message would lose the others
+
+    Args:
+        queued (str): raw message already in the queue
+        new (str): raw message received since
+
+    Returns:
+        str: merged raw message (the new message if they cannot be merged)
+    """
+    try:
+        old_data, new_data = json.loads(queued)["data"], json.loads(new)["data"]
+    except (TypeError, ValueError, KeyError):
+        return new
+    if len(old_data) != len(new_data):
+        return new
+    merged = []
+    for old_entry, new_entry in zip(old_data, new_data):
+        records = {record.get("key"): record for record in old_entry.get("content", [])}
+        content = [{**records.get(record.get("key"), {}), **record} for record in new_entry.get("content", [])]
+        merged.append({**old_entry, **new_entry, "content": content})
+    return json.dumps({"data": merged})
+
+
+class StreamQueue:
+
+    def __init__(self, maxsize: int = 1000, policy: str = POLICY_BLOCK, key_func=None, merge_func=None):
+        """
+        Initialize a bounded message queue
+
+        Args:
+            maxsize (int): maximum number of queued messages
+            policy (str): what to do when the queue is full ("block"|"drop_oldest"|"coalesce")
+            key_func (function | None): message -> key used by "coalesce" (None means the message is never coalesced)
+            merge_func (function | str | None): (queued message, new message) -> message kept when coalescing,
+                defaults to merge_data_messages, "replace" keeps the new message
+        """
+        if maxsize < 1:
+            raise Exception("[Schwabdev] maxsize must be at least 1.")
+        if policy not in POLICIES:
+            raise Exception(f"[Schwabdev] Unknown backpressure policy \"{policy}\", use one of {POLICIES}.")
+        if policy == POLICY_COALESCE and key_func is None:
+            raise Exception("[Schwabdev] The coalesce policy needs a key_func.")
+        self.maxsize = maxsize
+        self.policy = policy
+        self._key_func = key_func
+        self._merge_func = merge_data_messages if merge_func is None else merge_func
+        self._items = OrderedDict()         # key (or unique id) -> message, in arrival order
+        self._unique = itertools.count()    # ids of messages that are not coalesced
+        self._cond = threading.Condition()
+        self._closed = False
+        self._async_waiters = {}            # event loop -> asyncio.Event set when a message is queued
+        self.received = 0                   # messages put
+        self.dropped = 0                    # messages discarded by drop_oldest
+        self.coalesced = 0                  # messages merged into a queued one
+        self.processed = 0                  # messages taken by workers
+        self.max_depth = 0                  # high-water mark of the queue depth
+
+    @property
+    def depth(self) -> int:
+        return len(self._items)
+
+    def stats(self) -> dict:
+        """
+        Counters of the queue
+
+        Returns:
+            dict: {"depth", "max_depth", "received", "dropped", "coalesced", "processed"}
+        """
+        with self._cond:
+            return {"depth": len(self._items), "max_depth": self.max_depth, "received": self.received,
+                    "dropped": self.dropped, "coalesced": self.coalesced, "processed": self.processed}
+
+    def put(self, message, block: bool = True) -> bool:
+        """
+        Queue a message according to the backpressure policy
+
+        Args:
+            message (any): message to queue
+            block (bool): wait for room when the policy is "block" (False returns False instead)
+
+        Returns:
+            bool: True if the message was queued or coalesced
+        """
+        with self._cond:
+            if self._closed:
+                return False
+            self.received += 1
+            key = self._key_func(message) if self.policy == POLICY_COALESCE else None
+            if key is not None and key in self._items:
+                self._items[key] = message if self._merge_func == MERGE_REPLACE else self._merge_func(self._items[key], message)
+                self.coalesced += 1
+                return True
+            if len(self._items) >= self.maxsize:
+                if self.policy == POLICY_BLOCK:
+                    if not block:
+                        self.received -= 1
+                        return False
+                    self._cond.wait_for(lambda: len(self._items) < self.maxsize or self._closed)
+                    if self._closed:
+                        return False
+                else:
+                    self._items.popitem(last=False)
+                    self.dropped += 1
+            self._items[key if key is not None else ("_", next(self._unique))] = message
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._cond.notify_all()
+        self._notify_async()
+        return True
+
+    async def put_async(self, message) -> bool:
+        """
+        Queue a message from an event loop (a full "block" queue is waited on in a thread so the loop keeps running)
+
+        Args:
+            message (any): message to queue
+
+        Returns:
+            bool: True if the message was queued or coalesced
+        """
+        if self.put(message, block=False):
+            return True
+        return await asyncio.to_thread(self.put, message)
+
+    def _pop(self, max_items: int = None):
+        # must hold self._cond
+        if not self._items:
+            return _EMPTY
+        if max_items is None:
+            message = self._items.popitem(last=False)[1]
+            self.processed += 1
+        else:
+            message = [self._items.popitem(last=False)[1] for _ in range(min(max_items, len(self._items)))]
+            self.processed += len(message)
+        self._cond.notify_all()
+        return message
+
+    def get(self, max_items: int = None):
+        """
+        Take the oldest message, waiting for one
+
+        Args:
+            max_items (int | None): take a list of up to max_items queued messages instead of a single one
+
+        Returns:
+            any: message or list of messages (_EMPTY once the queue is closed and drained)
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._items or self._closed)
+            return self._pop(max_items)
+
+    async def get_async(self, max_items: int = None):
+        """
+        Take the oldest message from an event loop, waiting for one
+
+        Args:
+            max_items (int | None): take a list of up to max_items queued messages instead of a single one
+
+        Returns:
+            any: message or list of messages (_EMPTY once the queue is closed and drained)
+        """
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            ready = self._async_waiters.setdefault(loop, asyncio.Event())
+        while True:
+            ready.clear()
+            with self._cond:
+                message = self._pop(max_items)
+                if message is not _EMPTY or self._closed:
+                    return message
+            await ready.wait()
+
+    def _notify_async(self):
+        with self._cond:
+            waiters = list(self._async_waiters.items())
+        for loop, ready in waiters:
+            try:
+                loop.call_soon_threadsafe(ready.set)
+            except RuntimeError:  # loop closed
+                with self._cond:
+                    self._async_waiters.pop(loop, None)
+
+    def close(self):
+        """
+        Stop accepting messages and wake up every waiting worker (queued messages are still handed out)
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._notify_async()
+
+
+class WorkerPool:
+
+    def __init__(self, receiver, kwargs: dict, queue: StreamQueue, workers: int = 1, mode: str = "thread", batch_size: int = None, logger=None):
+        """
+        Workers that call receiver for every message of a StreamQueue
+
+        Args:
+            receiver (function): function (or coroutine function for mode "async") called with each message
+            kwargs (dict): keyword arguments passed to receiver
+            queue (StreamQueue): queue to consume
+            workers (int): number of workers (more than one means messages may be handled out of order)
+            mode (str): "thread" for daemon threads, "async" for tasks on the event loop that calls start()
+            batch_size (int | None): call receiver with lists of up to batch_size queued messages instead of one message at a time
+            logger (logging.Logger | None): logger for receiver errors
+        """
+        if mode not in ("thread", "async"):
+            raise Exception(f"[Schwabdev] Unknown worker mode \"{mode}\", use \"thread\" or \"async\".")
+        self._receiver = receiver
+        self._kwargs = kwargs
+        self.queue = queue
+        self.workers = workers
+        self.mode = mode
+        self.batch_size = batch_size
+        self._logger = logger
+        self._is_coroutine = inspect.iscoroutinefunction(receiver)
+        self._threads = []
+        self._tasks = []
+        self.errors = 0                     # exceptions raised by the receiver
+
+    def start(self):
+        if self.mode == "thread":
+            self._threads = [threading.Thread(target=self._run_thread, daemon=True) for _ in range(self.workers)]
+            for thread in self._threads:
+                thread.start()
+        else:
+            self._tasks = [asyncio.get_running_loop().create_task(self._run_async()) for _ in range(self.workers)]
+
+    def _error(self, e: Exception):
+        self.errors += 1
+        if self._logger is not None:
+            self._logger.error(f"Stream receiver error: {e}")
+
+    def _run_thread(self):
+        while (message := self.queue.get(self.batch_size)) is not _EMPTY:
+            try:
+                if self._is_coroutine:
+                    asyncio.run(self._receiver(message, **self._kwargs))
+                else:
+                    self._receiver(message, **self._kwargs)
+            except Exception as e:
+                self._error(e)
+
+    async def _run_async(self):
+        while (message := await self.queue.get_async(self.batch_size)) is not _EMPTY:
+            try:
+                if self._is_coroutine:
+                    await self._receiver(message, **self._kwargs)
+                else:
+                    self._receiver(message, **self._kwargs)
+            except Exception as e:
+                self._error(e)
+
+    def stop(self, timeout: float = 5):
+        """
+        Close the queue and wait for the workers to handle what is left in it
+
+        Args:
+            timeout (float): seconds to wait for each thread worker
+        """
+        self.queue.close()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout)
+
+    async def stop_async(self, timeout: float = 5):
+        self.queue.close()
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=timeout)
+        if self._threads:
+            await asyncio.to_thread(self.stop, timeout)
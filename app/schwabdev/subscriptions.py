@@ -0,0 +1,195 @@
+"""
+This file contains the subscription manager of the stream
+Subscriptions are kept as sets, requests are reduced to the minimal ADD/UNSUBS diff and split into size limited chunks
+"""
+import json
+import threading
+
+MAX_KEYS_PER_REQUEST = 100          # keys per ADD/UNSUBS request (large requests are slow to be acknowledged or refused)
+SUBSCRIPTION_COMMANDS = ("ADD", "SUBS", "UNSUBS", "VIEW")
+
+
+class SubscriptionManager:
+
+    def __init__(self, request_factory, max_keys: int = MAX_KEYS_PER_REQUEST):
+        """
+        Initialize an empty subscription manager
+
+        Args:
+            request_factory (function): (service, command, parameters) -> request dict (Stream.basic_request)
+            max_keys (int): maximum number of keys per request
+        """
+        self._request = request_factory
+        self.max_keys = max_keys
+        self._subs = {}                     # service -> {key: frozenset of fields}
+        self._pending = {}                  # requestid -> request sent and not acknowledged yet
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _to_list(value) -> list:
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return [v for v in value.split(",") if v]
+        return [str(v) for v in value]
+
+    @staticmethod
+    def _sort_fields(fields) -> list:
+        return sorted(fields, key=lambda f: (not f.isdigit(), int(f) if f.isdigit() else 0, f))
+
+    def as_dict(self) -> dict:
+        """
+        Subscriptions in the format of Stream.subscriptions
+
+        Returns:
+            dict: {service: {key: [fields]}}
+        """
+        with self._lock:
+            return {service: {key: self._sort_fields(fields) for key, fields in subs.items()} for service, subs in self._subs.items()}
+
+    def clear(self):
+        with self._lock:
+            self._subs = {}
+            self._pending = {}
+
+    def replace(self, subscriptions: dict):
+        """
+        Replace every subscription (nothing is sent)
+
+        Args:
+            subscriptions (dict): {service: {key: [fields]}} (format of Stream.subscriptions)
+        """
+        with self._lock:
+            self._subs = {service: {key: frozenset(self._to_list(fields)) for key, fields in keys.items()}
+                          for service, keys in subscriptions.items()}
+
+    def _chunks(self, service: str, command: str, keys: list, fields: list | None) -> list[dict]:
+        requests = []
+        for i in range(0, len(keys), self.max_keys):
+            parameters = {"keys": ",".join(keys[i:i + self.max_keys])}
+            if fields is not None:
+                parameters["fields"] = ",".join(self._sort_fields(fields))
+            requests.append(self._request(service, command, parameters))
+        return requests
+
+    @staticmethod
+    def _grouped_adds(wanted: dict) -> list[tuple]:
+        # one ADD per distinct field set, (command, keys, fields) to be chunked by _build
+        grouped = {}
+        for key, fields in wanted.items():
+            grouped.setdefault(fields, []).append(key)
+        return [("ADD", keys, fields) for fields, keys in grouped.items()]
+
+    def _build(self, service: str, plan: list[tuple]) -> list[dict]:
+        # chunked requests of a plan, built without holding self._lock (the request factory may fetch the streamer info)
+        return [request for command, keys, fields in plan for request in self._chunks(service, command, keys, fields)]
+
+    def apply(self, request: dict) -> list[dict]:
+        """
+        Record a request and reduce it to the requests that still need to be sent
+
+        Args:
+            request (dict): stream request (e.g. from Stream.level_one_equities)
+
+        Returns:
+            list[dict]: minimal chunked requests (the request itself if it is not a subscription request)
+        """
+        service, command = request.get("service"), request.get("command")
+        parameters = request.get("parameters") or {}
+        if service is None or command not in SUBSCRIPTION_COMMANDS:
+            return [request]
+        keys = self._to_list(parameters.get("keys"))
+        fields = frozenset(self._to_list(parameters.get("fields")))
+
+        with self._lock:
+            current = self._subs.setdefault(service, {})
+            if command == "ADD":
+                # keys already subscribed with these fields are skipped, the others get the union of the fields
+                wanted = {}
+                for key in keys:
+                    merged = current.get(key, frozenset()) | fields
+                    if current.get(key) != merged:
+                        wanted[key] = current[key] = merged
+                plan = self._grouped_adds(wanted)
+            elif command == "SUBS":
+                # replace everything: unsubscribe what is no longer wanted, add what is new or changed
+                kept = set(keys)
+                removed = [key for key in current if key not in kept]
+                wanted = {key: fields for key in keys if current.get(key) != fields}
+                self._subs[service] = {key: fields for key in keys}
+                plan = [("UNSUBS", removed, None)] + self._grouped_adds(wanted)
+            elif command == "UNSUBS":
+                plan = [("UNSUBS", [key for key in keys if current.pop(key, None) is not None], None)]
+            else:  # VIEW changes the fields of every key of the service
+                for key in current:
+                    current[key] = fields
+                return [request]
+        return self._build(service, plan)
+
+    def replay_requests(self) -> list[dict]:
+        """
+        Requests that restore every subscription (after a reconnect)
+
+        Returns:
+            list[dict]: chunked ADD requests grouped by field set
+        """
+        with self._lock:
+            subs = {service: dict(keys) for service, keys in self._subs.items()}
+        return [request for service, keys in subs.items() for request in self._build(service, self._grouped_adds(keys))]
+
+    def failed(self, request: dict):
+        """
+        Forget the keys of a refused ADD/SUBS request so the next request for them is sent again instead of being skipped
+
+        Args:
+            request (dict): request the streamer answered with an error code
+        """
+        if request.get("command") not in ("ADD", "SUBS"):
+            return
+        parameters = request.get("parameters") or {}
+        fields = frozenset(self._to_list(parameters.get("fields")))
+        with self._lock:
+            current = self._subs.get(request.get("service"), {})
+            for key in self._to_list(parameters.get("keys")):
+                if current.get(key) == fields:  # unless it was changed by a later request
+                    del current[key]
+
+    def track(self, requests: list[dict]):
+        """
+        Remember sent subscription requests until their response arrives
+
+        Args:
+            requests (list[dict]): requests sent
+        """
+        with self._lock:
+            for request in requests:
+                if request.get("command") in SUBSCRIPTION_COMMANDS and "requestid" in request:
+                    self._pending[str(request["requestid"])] = request
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def confirm(self, message: str) -> list[tuple[dict, dict]]:
+        """
+        Match the responses in a message to pending requests
+
+        Args:
+            message (str): raw message from the streamer
+
+        Returns:
+            list[tuple[dict, dict]]: (request, response content) of every acknowledged pending request
+        """
+        if '"response"' not in message:  # cheap check, most messages are data
+            return []
+        try:
+            responses = json.loads(message).get("response", [])
+        except ValueError:
+            return []
+        confirmed = []
+        with self._lock:
+            for response in responses:
+                request = self._pending.pop(str(response.get("requestid")), None)
+                if request is not None:
+                    confirmed.append((request, response.get("content", {})))
+        return confirmed
@@ -6,12 +6,64 @@ Github: https://github.com/tylerebowers/Schwab-API-Python
 import os
 import ssl
 import json
+import time
 import base64
 import logging
 import requests
 import datetime
+import tempfile
+import threading
 import webbrowser
 import http.server
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+    import msvcrt
+
+
+class _FileLock:
+
+    def __init__(self, path: str):
+        """
+        Exclusive lock shared by every thread and process that uses the same path
+
+        Args:
+            path (str): path of the lock file
+        """
+        self._path = path
+        self._thread_lock = threading.RLock()    # file locks do not exclude threads of the same process
+        self._file = None
+        self._depth = 0                          # re-entrant within a thread
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        self._depth += 1
+        if self._depth == 1:
+            self._file = open(self._path, 'a+')
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            else:
+                self._file.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:  # LK_LOCK gives up after 10 seconds
+                        continue
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._depth -= 1
+        if self._depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
 
 
 class Tokens:
@@ -61,25 +113,21 @@ class Tokens:
         self._access_token_timeout = 1800                   # in seconds (from schwab)
         self._refresh_token_timeout = 7 * 24 * 60 * 60      # in seconds (from schwab)
         self._tokens_file = tokens_file                     # path to tokens file
+        self._tokens_file_mtime = None                      # modification time of the tokens file when last read/written
+        self._file_lock = _FileLock(f"{tokens_file}.lock")  # held while refreshing so only one process refreshes
+        self._last_expiry_print = float("-inf")             # time.monotonic() of the last refresh token expiry message
+        self._last_expiry_notify = float("-inf")            # time.monotonic() of the last refresh token expiry notification
 
         self._capture_callback = capture_callback               # use a webserver with self-signed cert to callback
         self.call_on_notify = call_on_notify                    # function to call when user needs to be notified (e.g. for input)
 
         try:
-            with open(self._tokens_file, 'r') as f: # Load tokens if the file exists.
-                d = json.load(f)
-                token_dictionary = d.get("token_dictionary")
-                self.access_token = token_dictionary.get("access_token")
-                self.refresh_token = token_dictionary.get("refresh_token")
-                self.id_token = token_dictionary.get("id_token")
-                self._access_token_issued = datetime.datetime.fromisoformat(d.get("access_token_issued")).replace(tzinfo=datetime.timezone.utc)
-                self._refresh_token_issued = datetime.datetime.fromisoformat(d.get("refresh_token_issued")).replace(tzinfo=datetime.timezone.utc)
-
-                self.update_tokens()  # check if tokens need to be updated and update if needed
-                at_delta = self._access_token_timeout - (datetime.datetime.now(datetime.timezone.utc) - self._access_token_issued).total_seconds()
-                rt_delta = self._refresh_token_timeout - (datetime.datetime.now(datetime.timezone.utc) - self._refresh_token_issued).total_seconds()
-                self._client.logger.info(f"Access token expires in {'-' if at_delta < 0 else ''}{int(abs(at_delta) / 3600):02}H:{int((abs(at_delta) % 3600) / 60):02}M:{int((abs(at_delta) % 60)):02}S")
-                self._client.logger.info(f"Refresh token expires in {'-' if rt_delta < 0 else ''}{int(abs(rt_delta) / 3600):02}H:{int((abs(rt_delta) % 3600) / 60):02}M:{int((abs(rt_delta) % 60)):02}S")
+            self._load_tokens_file() # Load tokens if the file exists.
+
+            self.update_tokens()  # check if tokens need to be updated and update if needed
+            at_delta, rt_delta = self._time_remaining()
+            self._client.logger.info(f"Access token expires in {'-' if at_delta < 0 else ''}{int(abs(at_delta) / 3600):02}H:{int((abs(at_delta) % 3600) / 60):02}M:{int((abs(at_delta) % 60)):02}S")
+            self._client.logger.info(f"Refresh token expires in {'-' if rt_delta < 0 else ''}{int(abs(rt_delta) / 3600):02}H:{int((abs(rt_delta) % 3600) / 60):02}M:{int((abs(rt_delta) % 60)):02}S")
 
         except Exception as e:
             self._client.logger.error(e)
@@ -111,6 +159,74 @@ class Tokens:
             raise Exception("Invalid grant type; options are 'authorization_code' or 'refresh_token'")
         return requests.post('https://api.schwabapi.com/v1/oauth/token', headers=headers, data=data)
 
+    def _time_remaining(self) -> tuple[float, float]:
+        """
+        Seconds until the access and refresh tokens expire
+
+        Returns:
+            tuple[float, float]: (access token seconds remaining, refresh token seconds remaining)
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return (self._access_token_timeout - (now - self._access_token_issued).total_seconds(),
+                self._refresh_token_timeout - (now - self._refresh_token_issued).total_seconds())
+
+    def _load_tokens_file(self, only_if_newer: bool = False) -> bool:
+        """
+        Read tokens from self._tokens_file (the file is replaced atomically so it is never read half written)
+
+        Args:
+            only_if_newer (bool): only use the tokens in the file if they were issued after the ones in memory
+
+        Returns:
+            bool: True if the tokens in the file were used
+        """
+        mtime = os.stat(self._tokens_file).st_mtime_ns
+        with open(self._tokens_file, 'r') as f:
+            d = json.load(f)
+        token_dictionary = d.get("token_dictionary")
+        at_issued = datetime.datetime.fromisoformat(d.get("access_token_issued")).replace(tzinfo=datetime.timezone.utc)
+        rt_issued = datetime.datetime.fromisoformat(d.get("refresh_token_issued")).replace(tzinfo=datetime.timezone.utc)
+        self._tokens_file_mtime = mtime
+        if only_if_newer and at_issued <= self._access_token_issued and rt_issued <= self._refresh_token_issued:
+            return False
+        self.access_token = token_dictionary.get("access_token")
+        self.refresh_token = token_dictionary.get("refresh_token")
+        self.id_token = token_dictionary.get("id_token")
+        self._access_token_issued = at_issued
+        self._refresh_token_issued = rt_issued
+        return True
+
+    def _reload_if_changed(self) -> bool:
+        """
+        Pick up tokens written to the tokens file by another process (or client)
+
+        Returns:
+            bool: True if newer tokens were loaded
+        """
+        try:
+            if os.stat(self._tokens_file).st_mtime_ns == self._tokens_file_mtime:
+                return False
+            if self._load_tokens_file(only_if_newer=True):
+                self._client.logger.info("Tokens updated by another process.")
+                return True
+        except Exception as e:
+            self._client.logger.error(e)
+            self._client.logger.error("Could not read tokens file")
+        return False
+
+    def seconds_until_update(self) -> float:
+        """
+        Seconds until update_tokens() has something to do (used to schedule the next check instead of polling)
+
+        Returns:
+            float: seconds to wait (at least 30)
+        """
+        at_delta, rt_delta = self._time_remaining()
+        wait = min(at_delta - 61, rt_delta - 1800)
+        if rt_delta <= 43300:  # refresh token expiry messages every 15 minutes
+            wait = min(wait, 900)
+        return max(wait, 30)
+
     def _set_tokens(self, at_issued: datetime, rt_issued: datetime, token_dictionary: dict):
         """
         Writes token file and sets variables
@@ -121,7 +237,7 @@ class Tokens:
             token_dictionary (dict): token dictionary
 
         Notes:
-            Writes to tokens and expiration times to self._tokens_file
+            Writes to tokens and expiration times to self._tokens_file (atomically, through a temporary file)
         """
         self.access_token = token_dictionary.get("access_token")
         self.refresh_token = token_dictionary.get("refresh_token")
@@ -129,11 +245,20 @@ class Tokens:
         self._access_token_issued = at_issued
         self._refresh_token_issued = rt_issued
         try:
-            with open(self._tokens_file, 'w') as f:
-                to_write = {"access_token_issued": at_issued.isoformat(),
-                            "refresh_token_issued": rt_issued.isoformat(),
-                            "token_dictionary": token_dictionary}
-                json.dump(to_write, f, ensure_ascii=False, indent=4)
+            to_write = {"access_token_issued": at_issued.isoformat(),
+                        "refresh_token_issued": rt_issued.isoformat(),
+                        "token_dictionary": token_dictionary}
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self._tokens_file)), prefix=".tokens-", suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(to_write, f, ensure_ascii=False, indent=4)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self._tokens_file)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+            self._tokens_file_mtime = os.stat(self._tokens_file).st_mtime_ns
         except Exception as e:
             self._client.logger.error(e)
             self._client.logger.error("Could not write tokens file")
@@ -157,12 +282,17 @@ class Tokens:
                 except Exception as e:
                     self._client.logger.error(e)
 
+        # pick up tokens refreshed by another process
+        reloaded = self._reload_if_changed()
+
         # refresh token notification
-        rt_delta = self._refresh_token_timeout - (datetime.datetime.now(datetime.timezone.utc) - self._refresh_token_issued).total_seconds()
-        at_delta = self._access_token_timeout - (datetime.datetime.now(datetime.timezone.utc) - self._access_token_issued).total_seconds()
-        if 30 <= rt_delta <= 43300 and rt_delta % 900 <= 30:  # call every hour
+        at_delta, rt_delta = self._time_remaining()
+        if 30 <= rt_delta <= 43300 and time.monotonic() - self._last_expiry_print >= 870:  # every 15 minutes
+            self._last_expiry_print = time.monotonic()
             print(f"The refresh token will expire soon! ({'-' if rt_delta < 0 else ''}{int(abs(rt_delta) / 3600):02}H:{int((abs(rt_delta) % 3600) / 60):02}M:{int((abs(rt_delta) % 60)):02}S remaining)")
-            if rt_delta < 21700 and rt_delta % 3600 <= 30: call_notifier(message=f"Refresh token expires in less than {int(abs(rt_delta) / 3600):01} hours", importance=int(abs(rt_delta) / 3600))
+            if rt_delta < 21700 and time.monotonic() - self._last_expiry_notify >= 3570:  # every hour
+                self._last_expiry_notify = time.monotonic()
+                call_notifier(message=f"Refresh token expires in less than {int(abs(rt_delta) / 3600):01} hours", importance=int(abs(rt_delta) / 3600))
 
 
         # check if we need to update refresh (and access) token
@@ -177,7 +307,7 @@ class Tokens:
             self.update_access_token()
             return True
         else:
-            return False
+            return reloaded
 
     """
         Access Token functions:
@@ -186,17 +316,26 @@ class Tokens:
     def update_access_token(self):
         """
         "refresh" the access token using the refresh token
+
+        Notes:
+            Holds the tokens file lock so only one process refreshes, the others use the tokens it writes.
         """
-        response = self._post_oauth_token('refresh_token', self.refresh_token)
-        if response.ok:
-            # get and update to the new access token
-            at_issued = datetime.datetime.now(datetime.timezone.utc)
-            self._set_tokens(at_issued, self._refresh_token_issued, response.json())
-            # show user that we have updated the access token
-            self._client.logger.info(f"Access token updated: {self._access_token_issued}")
-        else:
-            self._client.logger.error(response.text)
-            self._client.logger.error(f"Could not get new access token; refresh_token likely invalid.")
+        with self._file_lock:
+            # another process may have refreshed while we waited for the lock
+            if self._reload_if_changed() and self._time_remaining()[0] >= 61:
+                return
+            response = self._post_oauth_token('refresh_token', self.refresh_token)
+            if response.ok:
+                # get and update to the new access token
+                at_issued = datetime.datetime.now(datetime.timezone.utc)
+                self._set_tokens(at_issued, self._refresh_token_issued, response.json())
+                self._client.metrics.record_event("access_token_refresh")
+                # show user that we have updated the access token
+                self._client.logger.info(f"Access token updated: {self._access_token_issued}")
+            else:
+                self._client.metrics.record_event("access_token_refresh_failed")
+                self._client.logger.error(response.text)
+                self._client.logger.error(f"Could not get new access token; refresh_token likely invalid.")
 
     """
         Refresh Token functions:
@@ -275,8 +414,10 @@ class Tokens:
         if response.ok:
             # update token file and variables
             self._set_tokens(now, now, response.json())
+            self._client.metrics.record_event("refresh_token_update")
             self._client.logger.info("Refresh and Access tokens updated")
         else:
+            self._client.metrics.record_event("refresh_token_update_failed")
             self._client.logger.error(response.text)
             self._client.logger.error("Could not get new refresh and access tokens, check these:\n"
                                "1. App status is \"Ready For Use\".\n"
@@ -330,34 +471,40 @@ class Tokens:
     def update_refresh_token(self):
         """
         Get new access and refresh tokens using authorization code.
-        """
-
-        # get and open the link that the user will authorize with.
-        auth_url = f'https://api.schwabapi.com/v1/oauth/authorize?client_id={self._app_key}&redirect_uri={self._callback_url}'
-        print(f"[Schwabdev] Open to authenticate: {auth_url}")
 
-        # try to open the link
-        try:
-            webbrowser.open(auth_url)
-        except Exception as e:
-            self._client.logger.error(e)
-            self._client.logger.warning("Could not open browser for authorization (open the link manually)")
-
-        #parse the callback url
-        url_split = self._callback_url.split("://")[-1].split(":")
-        url_base = url_split[0]
-        url_port = url_split[-1] # this may or may not have the port
-
-        if self._capture_callback and not url_port.isdigit(): # if there is a port then capture the callback url
-            self._client.logger.error("Could not find port in callback url, so you will have to copy/paste the url.")
-            self._capture_callback = False
-
-        if self._capture_callback:
-            self._update_refresh_token_from_code(self._launch_capture_server(url_base, int(url_port)))
-        else:
-            response_url = input("[Schwabdev] After authorizing, paste the address bar url here: ")
-            code = f"{response_url[response_url.index('code=') + 5:response_url.index('%40')]}@"
-            if code is not None:
-                self._update_refresh_token_from_code(code)
+        Notes:
+            Holds the tokens file lock so other processes wait for (and then use) the new tokens instead of asking to authorize too.
+        """
+        with self._file_lock:
+            # another process may have authorized while we waited for the lock
+            if self._reload_if_changed() and self._time_remaining()[1] > 1800:
+                return
+            # get and open the link that the user will authorize with.
+            auth_url = f'https://api.schwabapi.com/v1/oauth/authorize?client_id={self._app_key}&redirect_uri={self._callback_url}'
+            print(f"[Schwabdev] Open to authenticate: {auth_url}")
+
+            # try to open the link
+            try:
+                webbrowser.open(auth_url)
+            except Exception as e:
+                self._client.logger.error(e)
+                self._client.logger.warning("Could not open browser for authorization (open the link manually)")
+
+            #parse the callback url
+            url_split = self._callback_url.split("://")[-1].split(":")
+            url_base = url_split[0]
+            url_port = url_split[-1] # this may or may not have the port
+
+            if self._capture_callback and not url_port.isdigit(): # if there is a port then capture the callback url
+                self._client.logger.error("Could not find port in callback url, so you will have to copy/paste the url.")
+                self._capture_callback = False
+
+            if self._capture_callback:
+                self._update_refresh_token_from_code(self._launch_capture_server(url_base, int(url_port)))
             else:
-                self._client.logger.error("Could not get new refresh token without code.")
+                response_url = input("[Schwabdev] After authorizing, paste the address bar url here: ")
+                code = f"{response_url[response_url.index('code=') + 5:response_url.index('%40')]}@"
+                if code is not None:
+                    self._update_refresh_token_from_code(code)
+                else:
+                    self._client.logger.error("Could not get new refresh token without code.")
@@ -0,0 +1,155 @@
+from math import gcd
+from functools import reduce
+import numpy as np
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+BNB_MIN_CELLS = 2_000_000 # reduced budget cells above which branch-and-bound replaces the DP table
+BNB_MAX_NODES = 2_000_000 # search nodes before branch-and-bound gives up and the DP table is built instead
+TIE_TOLERANCE = 1e-9 # relative, candidates closer than this to the best one are ties only the DP's float sums can break
+
+class _UseTable(Exception):
+    # branch-and-bound cannot reproduce the DP's choice (node budget spent or a tie), the DP table is built instead
+    pass
+
+def reduce_costs(costs, budget):
+    # divides costs and budget by the costs' GCD, the unbounded knapsack only reaches multiples of it
+    g = reduce(gcd, costs, 0) or 1
+    return [cost // g for cost in costs], budget // g, g
+
+def select_counts(costs, values, budget, bnb_min_cells=BNB_MIN_CELLS):
+    # unbounded knapsack, same allocation as the cent-granularity DP of SchwabTools.optimal_trade_selection:
+    # from the full budget, repeatedly take the first item (in input order) that maximizes best(remaining - cost) + value
+    # costs are positive ints (<= budget), returns a count per item
+    if not costs:
+        return []
+    keep = undominated(costs, values)
+    reduced, budget, _ = reduce_costs([costs[i] for i in keep], budget)
+    kept_values = [values[i] for i in keep]
+    kept_counts = None
+    if budget + 1 > bnb_min_cells:
+        try:
+            kept_counts = _branch_and_bound_counts(reduced, [float(v) for v in kept_values], budget)
+        except _UseTable as e:
+            logger.debug(f"Branch-and-bound fell back to the DP table for {budget + 1} cells: {e}")
+    if kept_counts is None:
+        kept_counts = _dp_counts(reduced, kept_values, budget)
+    counts = [0] * len(costs)
+    for i, count in zip(keep, kept_counts):
+        counts[i] = count
+    return counts
+
+def undominated(costs, values):
+    # items that can be the first maximizer of some cell: an item is never chosen if another costs no more and is worth
+    # more, or costs no more, is worth as much and comes first (its candidate is then always at least as large)
+    order = sorted(range(len(costs)), key=lambda i: (costs[i], -values[i] if values[i] == values[i] else float("inf"), i))
+    keep = []
+    best_value, best_index = -float("inf"), -1
+    for i in order:
+        value = values[i]
+        if value != value:
+            continue
+        if value > best_value or (value == best_value and i < best_index):
+            keep.append(i)
+            best_value, best_index = value, i
+    return sorted(keep)
+
+def _dp_counts(costs, values, budget):
+    # cells within a block of min(cost) only depend on earlier blocks, so a block is one vectorized step
+    cost = np.array(costs, dtype=np.int64)
+    value = np.array(values, dtype=float)
+    value[np.isnan(value)] = -np.inf # never chosen, like a NaN comparison in the per cell loop
+    dp = np.zeros(budget + 1)
+    choice = np.full(budget + 1, -1, dtype=np.int64)
+    block = int(cost.min())
+    for start in range(block, budget + 1, block):
+        cells = np.arange(start, min(start + block, budget + 1))
+        previous = cells[None, :] - cost[:, None]
+        candidates = np.where(previous >= 0, dp[np.maximum(previous, 0)] + value[:, None], -np.inf)
+        best = candidates.argmax(axis=0) # first maximum, the loop only replaced on a strictly greater value
+        best_value = candidates[best, np.arange(len(cells))]
+        chosen = best_value > 0.0
+        dp[cells] = np.where(chosen, best_value, 0.0)
+        choice[cells] = np.where(chosen, best, -1)
+    counts = [0] * len(costs)
+    remaining = budget
+    while remaining > 0 and choice[remaining] != -1:
+        idx = int(choice[remaining])
+        counts[idx] += 1
+        remaining -= costs[idx]
+    return counts
+
+class _KnapsackBound:
+    # best value of an unbounded knapsack per capacity, depth first over items by value density with the Dantzig bound
+    def __init__(self, costs, values, max_nodes=BNB_MAX_NODES):
+        # dominated items (another is no more expensive and worth at least as much) never change the best value
+        items = sorted((i for i in range(len(costs)) if values[i] > 0), key=lambda i: (costs[i], -values[i], i))
+        kept = []
+        for i in items:
+            if not any(costs[j] <= costs[i] and values[j] >= values[i] for j in kept):
+                kept.append(i)
+        self.order = sorted(kept, key=lambda i: -values[i] / costs[i])
+        self.costs = [costs[i] for i in self.order]
+        self.values = [values[i] for i in self.order]
+        self.density = self.values[0] / self.costs[0] if self.order else 0.0 # best value per cost
+        self._memo = {}
+        self._nodes_left = max_nodes # shared by every solve, _UseTable once spent
+
+    def solve(self, capacity):
+        # (best value, {item: count}) for capacity
+        if capacity in self._memo:
+            return self._memo[capacity]
+        costs, values, n = self.costs, self.values, len(self.costs)
+        best = [0.0, {}]
+        counts = [0] * n
+
+        def search(k, remaining, value):
+            self._nodes_left -= 1
+            if self._nodes_left < 0:
+                raise _UseTable(f"over {BNB_MAX_NODES} search nodes")
+            if k == n or value + remaining * values[k] / costs[k] <= best[0]:
+                if value > best[0]:
+                    best[0], best[1] = value, {self.order[i]: c for i, c in enumerate(counts) if c}
+                return
+            for count in range(remaining // costs[k], -1, -1):
+                counts[k] = count
+                search(k + 1, remaining - count * costs[k], value + count * values[k])
+            counts[k] = 0
+
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, n + 100))
+        try:
+            search(0, capacity, 0.0)
+        finally:
+            sys.setrecursionlimit(limit)
+        self._memo[capacity] = result = (best[0], best[1])
+        return result
+
+def _branch_and_bound_counts(costs, values, budget):
+    # the DP's backtrack without its table: an item of an optimal solution is a maximizer and the rest of the solution stays
+    # optimal for the remainder. The DP picks between tied maximizers by the float noise of its sums, so a step is only
+    # taken when no other item comes within TIE_TOLERANCE of the best value, otherwise _UseTable is raised
+    bound = _KnapsackBound(costs, values)
+    counts = [0] * len(costs)
+    remaining = budget
+    _, solution = bound.solve(remaining)
+    while remaining > 0 and solution:
+        target = sum(values[i] * count for i, count in solution.items())
+        tolerance = TIE_TOLERANCE * max(1.0, target)
+        chosen = min(solution)
+        for i in range(len(costs)):
+            if i == chosen or costs[i] > remaining or values[i] != values[i]:
+                continue
+            # best(remaining - cost) is at most (remaining - cost) * best density, most items are ruled out without a solve
+            if (remaining - costs[i]) * bound.density + values[i] < target - tolerance:
+                continue
+            if bound.solve(remaining - costs[i])[0] + values[i] >= target - tolerance:
+                raise _UseTable(f"items {chosen} and {i} tie at {remaining} cells")
+        solution = dict(solution)
+        solution[chosen] -= 1
+        if not solution[chosen]:
+            del solution[chosen]
+        counts[chosen] += 1
+        remaining -= costs[chosen]
+    return counts
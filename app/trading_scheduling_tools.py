@@ -5,6 +5,7 @@ import pandas_market_calendars as mcal
 
 logger = logging.getLogger(__name__)
 CALENDAR_DAY_NOT_TO_TRADE = [1,2,3,4,5,25,26,27,28,29,30,31] # 1st and last days of the month
+MARKET_CLOSE_HOUR = 16
 
 class TradingSchedulingTools:
     def __init__(self):
@@ -47,6 +48,12 @@ class TradingSchedulingTools:
         time.sleep(sleep_seconds)
             
         
+    def seconds_until_market_close(self, current_time=None):
+        # regular session close (local time, like the rest of the schedule checks)
+        current_time = current_time or datetime.now()
+        market_close = current_time.replace(hour=MARKET_CLOSE_HOUR, minute=0, second=0, microsecond=0)
+        return max(0, (market_close - current_time).total_seconds())
+
     def rest(self,current_time=None,function=None, sleep_seconds=None):
         did_rest = False
         
@@ -0,0 +1,73 @@
+# Runtime of the trade selection solvers as the budget and the number of candidates grow.
+# Run from the repository root: python -m benchmarks.trade_selection_benchmark [--legacy-max-cells N] [--seed N] [--score-decimals N]
+# (--score-decimals 1 makes tied allocations common, the solvers must still agree with the legacy loop on them)
+from app.trade_selection import select_counts
+import argparse
+import random
+import time
+
+BUDGETS = (1_000, 10_000, 50_000, 250_000, 1_000_000) # dollars
+CANDIDATES = (5, 20, 100, 500)
+LEGACY_MAX_CELLS = 50_000_000 # budget cells x candidates the legacy loop is allowed to run
+
+def legacy_counts(costs, values, budget_cents):
+    # the cent-granularity DP and backtrack SchwabTools.optimal_trade_selection used before
+    items = list(zip(range(len(costs)), costs, values))
+    dp = [0.0] * (budget_cents + 1)
+    choice = [-1] * (budget_cents + 1)
+    for b in range(budget_cents + 1):
+        for idx, cost, value in items:
+            if cost <= b:
+                new_val = dp[b - cost] + value
+                if new_val > dp[b]:
+                    dp[b] = new_val
+                    choice[b] = idx
+    remaining = budget_cents
+    counts = [0] * len(costs)
+    while remaining > 0 and choice[remaining] != -1:
+        idx = choice[remaining]
+        cost = next(c for i, c, v in items if i == idx)
+        counts[idx] += 1
+        remaining -= cost
+    return counts
+
+def candidates(rng, n, budget_cents, score_decimals=2):
+    # premiums in cents like the chains quote them, scores rounded like the analysis returns them
+    costs, values = [], []
+    while len(costs) < n:
+        cost = rng.choice([rng.randint(5, 800) * 100, rng.randint(1, 160) * 500])
+        if cost <= budget_cents:
+            costs.append(cost)
+            values.append(round(rng.uniform(0, 10), score_decimals))
+    return costs, values
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--legacy-max-cells", type=int, default=LEGACY_MAX_CELLS)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--score-decimals", type=int, default=2)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    print(f"{'budget $':>10} {'candidates':>10} {'legacy s':>10} {'dp s':>10} {'b&b s':>10} {'contracts':>10}  same")
+    for budget in BUDGETS:
+        budget_cents = budget * 100
+        for n in CANDIDATES:
+            costs, values = candidates(rng, n, budget_cents, args.score_decimals)
+            dp, dp_time = timed(select_counts, costs, values, budget_cents, bnb_min_cells=float("inf"))
+            bnb, bnb_time = timed(select_counts, costs, values, budget_cents, bnb_min_cells=0)
+            same = dp == bnb
+            legacy_time = "skipped"
+            if (budget_cents + 1) * n <= args.legacy_max_cells:
+                legacy, seconds = timed(legacy_counts, costs, values, budget_cents)
+                legacy_time = f"{seconds:.3f}"
+                same = same and legacy == dp
+            print(f"{budget:>10} {n:>10} {legacy_time:>10} {dp_time:>10.3f} {bnb_time:>10.3f} {sum(dp):>10}  {'yes' if same else 'NO'}")
+
+if __name__ == "__main__":
+    main()